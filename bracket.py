@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+#
+# bracket.py -- single-elimination bracket of a tournament
+#
+
+import json
+
+
+def seedOrder(size):
+    ''' Returns the seeds in the positions of a bracket of size players,
+        the seed 1 and the seed 2 only can meet in the final,
+        e.g. 8 --> [1, 8, 4, 5, 2, 7, 3, 6]
+    '''
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [x for seed in order for x in (seed, total - seed)]
+    return order
+
+
+class Bracket(object):
+
+    ''' Single-elimination bracket kept in memory.
+
+        It's built once from the players of the cut sorted by RANK_FIN, the
+        bracket has the next power of 2 positions and the missing seeds are
+        byes, so the best seeds advance to the second round without playing.
+        The levels of the bracket are lists of player ids (None is a bye or
+        a position still undecided), the winner of the positions 2i and
+        2i+1 of a level goes to the position i of the next level as soon as
+        the match is reported.
+    '''
+
+    def __init__(self, seeds):
+        ''' Args:
+              seeds: (list) tuples (id, name) of the players of the cut
+                     sorted by seed
+        '''
+        size = 1 << (max(len(seeds), 2) - 1).bit_length()
+        self._names = dict(seeds)
+        ids = [row[0] for row in seeds]
+        first = [ids[seed - 1] if seed <= len(ids) else None
+                 for seed in seedOrder(size)]
+        self._levels = [first]
+        while len(self._levels[-1]) > 1:
+            self._levels.append([None] * (len(self._levels[-1]) / 2))
+        self._round = 0
+        # the byes of the first level advance without match
+        for i in xrange(0, size, 2):
+            if first[i] is None or first[i + 1] is None:
+                self._levels[1][i / 2] = first[i] or first[i + 1]
+
+    def getRound(self):
+        ''' Returns the current round of the bracket, 0 is the first one '''
+        return self._round
+
+    def seedCount(self):
+        ''' Returns the number of players of the cut '''
+        return len(self._names)
+
+    def totalRounds(self):
+        return len(self._levels) - 1
+
+    def finished(self):
+        return self._levels[-1][0] is not None
+
+    def roundComplete(self):
+        ''' Returns True if every match of the current round has a winner '''
+        return None not in self._levels[self._round + 1]
+
+    def pairings(self):
+        ''' Returns the matches of the current round still to be played
+
+        Returns:
+          A list of tuples (id1, name1, id2, name2), id1 is the best seed
+        '''
+        if self.finished():
+            return list()
+        while self.roundComplete():
+            self._round += 1
+        level, winners = self._levels[self._round], self._levels[self._round + 1]
+        pairings = list()
+        for i in xrange(len(winners)):
+            id1, id2 = level[2 * i], level[2 * i + 1]
+            if winners[i] is None and id1 is not None and id2 is not None:
+                pairings.append((id1, self._names[id1], id2, self._names[id2]))
+        return pairings
+
+    def reportMatch(self, winner, loser):
+        ''' Advances the winner of a match of the current round
+
+        Returns:
+          True if the match belongs to the bracket, False otherwise
+          (e.g. a match of the swiss rounds)
+        '''
+        if self.finished():
+            return False
+        level = self._levels[self._round]
+        try:
+            i = level.index(winner)
+        except ValueError:
+            return False
+        if level[i ^ 1] != loser:
+            return False
+        self._levels[self._round + 1][i / 2] = winner
+        return True
+
+    def winner(self):
+        ''' Returns (id, name) of the champion, None if not finished '''
+        if not self.finished():
+            return None
+        player_id = self._levels[-1][0]
+        return (player_id, self._names[player_id])
+
+    def secondPlace(self):
+        ''' Returns (id, name) of the loser of the final, None if not finished
+        '''
+        if not self.finished():
+            return None
+        final = self._levels[-2]
+        player_id = final[1] if final[0] == self._levels[-1][0] else final[0]
+        return (player_id, self._names[player_id])
+
+    def toJson(self):
+        ''' Returns the bracket as a JSON document, see fromJson '''
+        return json.dumps({
+            'players': [[k, v] for k, v in sorted(self._names.iteritems())],
+            'levels': self._levels,
+            'round': self._round})
+
+    @classmethod
+    def fromJson(cls, document):
+        ''' Builds a bracket from a document of toJson (string or dict) '''
+        if isinstance(document, basestring):
+            document = json.loads(document)
+        bracket = cls.__new__(cls)
+        bracket._names = dict((k, v) for k, v in document['players'])
+        bracket._levels = document['levels']
+        bracket._round = document['round']
+        return bracket
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+#
+# journal.py -- local write-behind journal of the match results
+#
+# The results are appended to a local file and a background thread writes
+# them to MATCHES in batches, so reportMatch doesn't wait for the database.
+# The last record written to the database is kept in JOURNAL_WATERMARK with
+# the same transaction of the batch, after a crash the records above the
+# watermark are replayed exactly once.
+
+import datetime
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+import tournament
+
+logger = logging.getLogger('tournament')
+
+# seq, tournament id, round, winner, loser, date of the match (epoch), crc32
+RECORD = struct.Struct('<QiiiidI')
+PAYLOAD_SIZE = RECORD.size - 4
+NO_ROUND = -1      # round None
+NO_DATE = -1.0     # date_match None
+
+BATCH_SIZE = 1000       # records written to the database by transaction
+FLUSH_INTERVAL = 0.2    # seconds between batches of the flusher
+SYNC_RECORDS = 100      # appended records between two fsync
+RETRY_INTERVAL = 1.0    # seconds to wait after a database error
+COMPACT_BYTES = 1 << 20  # the file is emptied once all is in the database
+
+
+def encodeRecord(seq, trnmnt_id, round_, date_match, winner, loser):
+    ''' Returns the bytes of a record, see RECORD '''
+    if date_match is None:
+        epoch = NO_DATE
+    else:
+        epoch = (time.mktime(date_match.timetuple()) +
+                 date_match.microsecond / 1e6)
+    payload = RECORD.pack(seq, trnmnt_id, NO_ROUND if round_ is None else
+                          round_, winner, loser, epoch, 0)[:PAYLOAD_SIZE]
+    return payload + struct.pack('<I', zlib.crc32(payload) & 0xffffffff)
+
+
+def decodeRecord(data, offset=0):
+    ''' Returns the record at offset as (seq, trnmnt_id, round_, date_match,
+        winner, loser), None if it's incomplete or corrupted (a torn write)
+    '''
+    if len(data) - offset < RECORD.size:
+        return None
+    seq, trnmnt_id, round_, winner, loser, epoch, crc = \
+        RECORD.unpack_from(data, offset)
+    payload = data[offset:offset + PAYLOAD_SIZE]
+    if zlib.crc32(payload) & 0xffffffff != crc:
+        return None
+    date_match = (None if epoch == NO_DATE else
+                  datetime.datetime.fromtimestamp(epoch))
+    return (seq, trnmnt_id, None if round_ == NO_ROUND else round_,
+            date_match, winner, loser)
+
+
+class MatchJournal(object):
+
+    ''' Append-only journal of match results in a local file.
+
+        append stores a result in the file and returns at once, the records
+        are synced to disk (fsync) by batches of SYNC_RECORDS and by each
+        cycle of the flusher. The flusher (start) inserts the pending
+        records in MATCHES with insertMatches, grouped by tournament, round
+        and date, and moves the watermark of the journal in the same
+        transaction. When the journal is opened the file is replayed through
+        mmap and the records above the watermark are pending again.
+
+        The results in the journal can't be rolled back. A Tournament with
+        a journal (see Tournament.__init__) waits for the flusher (drain)
+        before reading matches from the database, e.g. to pair a round.
+    '''
+
+    def __init__(self, path, storage=None, name=None, dsn=tournament.DSN,
+                 pool_size=tournament.POOL_SIZE, batch_size=BATCH_SIZE,
+                 interval=FLUSH_INTERVAL):
+        ''' Opens the journal and replays its file
+
+        Args:
+          path: (string) the file of the journal, it's created if missing
+          storage: (TournamentStorage) the storage written by the flusher,
+                   by default a TournamentDb with dsn and pool_size. It
+                   must not be the storage of a Tournament, the flusher
+                   commits its own transactions
+          name: (string) the id of the journal in JOURNAL_WATERMARK, by
+                default the name of the file
+          batch_size: (int) the records written by transaction
+          interval: (float) seconds between two batches of the flusher
+        '''
+        if storage is None:
+            storage = tournament.TournamentDb(dsn, pool_size)
+            storage.connect()
+        self._storage = storage
+        self._path = path
+        self._name = name or os.path.basename(path)
+        self._batch_size = batch_size
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pending = list()  # records not written to the database yet
+        self._unsynced = 0
+        self._thread = None
+        self._closing = False
+        self._error = None  # the last error of the flusher
+        self._watermark = storage.journalWatermark(self._name)
+        self._file = open(path, 'a+b')
+        self.replay()
+
+    def replay(self):
+        ''' Reads the records of the file with mmap, the ones above the
+            watermark are pending. A torn record at the end is truncated
+        '''
+        size = os.fstat(self._file.fileno()).st_size
+        last_seq = self._watermark
+        valid = 0
+        if size:
+            data = mmap.mmap(self._file.fileno(), size,
+                             access=mmap.ACCESS_READ)
+            try:
+                while valid < size:
+                    record = decodeRecord(data, valid)
+                    if record is None:
+                        break
+                    if record[0] > self._watermark:
+                        self._pending.append(record)
+                    last_seq = max(last_seq, record[0])
+                    valid += RECORD.size
+            finally:
+                data.close()
+        if valid < size:
+            logger.warning('journal %s: %s bytes of a torn record dropped',
+                           self._name, size - valid)
+            self._file.truncate(valid)
+            os.fsync(self._file.fileno())
+        self._seq = last_seq
+        self._file.seek(0, os.SEEK_END)
+
+    def append(self, trnmnt_id, round_, date_match, winner, loser):
+        ''' Stores a result in the journal, the flusher writes it to MATCHES
+
+        Returns:
+          seq: (int) the sequence number of the record
+        '''
+        with self._lock:
+            self._seq += 1
+            record = (self._seq, trnmnt_id, round_, date_match, winner, loser)
+            self._file.write(encodeRecord(*record))
+            self._file.flush()
+            self._pending.append(record)
+            self._unsynced += 1
+            if self._unsynced >= SYNC_RECORDS:
+                self.syncLocked()
+            self._changed.notify_all()
+            return self._seq
+
+    def sync(self):
+        ''' Syncs the appended records to disk (fsync) '''
+        with self._lock:
+            self.syncLocked()
+
+    def syncLocked(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def pending(self):
+        ''' Returns the number of records not written to the database '''
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        ''' Writes a batch of pending records to the database in one
+            transaction, with the watermark of its last record
+
+        Returns:
+          The number of records written
+        '''
+        with self._lock:
+            self.syncLocked()
+            batch = self._pending[:self._batch_size]
+        if not batch:
+            return 0
+        try:
+            start = 0
+            for end in xrange(1, len(batch) + 1):
+                if (end == len(batch) or
+                        batch[end][1:4] != batch[start][1:4]):
+                    trnmnt_id, round_, date_match = batch[start][1:4]
+                    # a result reported twice is written once
+                    self._storage.insertMatches(
+                        trnmnt_id, round_, date_match,
+                        [(r[4], r[5]) for r in batch[start:end]],
+                        skip_stored=True)
+                    start = end
+            self._storage.setJournalWatermark(self._name, batch[-1][0])
+            self._storage.commit()
+        except Exception:
+            self._storage.rollback()
+            raise
+        with self._lock:
+            del self._pending[:len(batch)]
+            self._watermark = batch[-1][0]
+            if (not self._pending and
+                    self._file.tell() >= COMPACT_BYTES):
+                # all the records are in the database, the watermark keeps
+                # the sequence
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+            self._changed.notify_all()
+        return len(batch)
+
+    def start(self):
+        ''' Starts the background flusher '''
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run,
+                                            name='journal-%s' % self._name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def run(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closing:
+                    self._changed.wait()
+                if not self._pending:
+                    return
+            try:
+                written = self.flush()
+            except Exception as ex:
+                logger.warning('journal %s: %s, retrying', self._name, ex)
+                self._error = ex
+                if self._closing:
+                    return
+                time.sleep(RETRY_INTERVAL)
+                continue
+            self._error = None
+            if written < self._batch_size and not self._closing:
+                # the results of the interval make the next batch
+                time.sleep(self._interval)
+
+    def drain(self, timeout=None):
+        ''' Waits until all the appended records are in the database, they
+            are written by this thread if the flusher isn't running. The
+            error of the flusher is raised instead of waiting for its retry
+
+        Args:
+          timeout: (float) seconds to wait for the flusher, RuntimeError is
+                   raised after them. None waits without limit
+        '''
+        if self._thread is None or not self._thread.is_alive():
+            while self.flush():
+                pass
+            return
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            seq = self._seq
+            while self._watermark < seq:
+                if self._error is not None:
+                    raise self._error
+                if deadline is not None and time.time() >= deadline:
+                    raise RuntimeError('journal %s: records up to %s not '
+                                       'written after %s seconds'
+                                       % (self._name, seq, timeout))
+                self._changed.wait(self._interval)
+
+    def close(self):
+        ''' Stops the flusher after writing the pending records, and closes
+            the file. The records not written stay in the file
+        '''
+        self._closing = True
+        if self._thread is not None:
+            with self._lock:
+                self._changed.notify_all()
+            self._thread.join()
+            self._thread = None
+        self.sync()
+        self._file.close()
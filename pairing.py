@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+#
+# pairing.py -- pairing engines of a Swiss-system tournament
+#
+
+import player
+
+# Weights of the edges between two players, the matching always prefers
+# the highest cardinality, after that the highest total weight
+SCORE_WEIGHT = 1000     # penalty by the square of the wins difference
+BYE_WEIGHT = 100000     # penalty to give a second bye to the same player
+REMATCH_WEIGHT = 1      # weight of a rematch, only used as last resort
+BLOCK_SIZE = 20         # players (even) matched at once, see BlossomPairing
+
+
+def pairKey(player1, player2):
+    ''' Returns the canonical key (lowest id, highest id) of two opponents,
+        it doesn't matter who won the match
+    '''
+    if player1 < player2:
+        return (player1, player2)
+    return (player2, player1)
+
+
+class BlossomPairing(object):
+
+    ''' Pairing engine that builds the whole round at once as a maximum
+        weight matching (Edmonds blossom) over the players' standings.
+
+        The weight of an edge penalizes the difference of wins and the
+        distance in the standings, a rematch is not an edge, and the bye is
+        an extra node which prefers the lowest players without a bye.
+        To keep the time bounded on big fields the standings are matched by
+        blocks of consecutive players; a block without a perfect matching is
+        merged with the next one, and only when the whole field can't be
+        paired the rematches are allowed.
+    '''
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        if block_size < 2 or block_size % 2:
+            raise ValueError('block_size must be an even number >= 2')
+        self._block_size = block_size
+
+    def pairRound(self, players, history, byes):
+        ''' Returns the pairings of the next round
+
+        Args:
+          players: (player.PlayerTable) the players sorted by standings, a
+                   list of Player objects is also accepted
+          history: (set) canonical pairs already matched (see pairKey)
+          byes: (set) ids of the players who already had a round bye
+        Returns:
+          pairings, player_bye: (list, Player) a list of tuples of Player
+                      objects (player1, player2) and the player who gets
+                      the round bye, None if the number of players is even
+        '''
+        if not isinstance(players, player.PlayerTable):
+            players = player.PlayerTable.fromPlayers(players)
+        total = len(players)
+        blocks = list()  # (start, pairings, player_bye) of each block
+        start = 0
+        end = self.nextEnd(start, total)
+        while start < total:
+            result = self.matchBlock(players, start, end, history, byes,
+                                     end == total, False)
+            if result is None and start == 0 and end == total:
+                # the whole field can't be paired without rematches
+                result = self.matchBlock(players, start, end, history, byes,
+                                         True, True)
+            if result is not None:
+                blocks.append((start, result[0], result[1]))
+                start = end
+                end = self.nextEnd(start, total)
+            elif end < total:
+                # grow the block with the next players of the standings
+                end = self.nextEnd(end, total)
+            else:
+                # the tail can't be paired, merge it with the previous block
+                start = blocks.pop()[0]
+        pairings = list()
+        player_bye = None
+        for _, pairs, bye in blocks:
+            pairings.extend(pairs)
+            if bye is not None:
+                player_bye = bye
+        return pairings, player_bye
+
+    def nextEnd(self, start, total):
+        ''' Returns the end of the block starting at start, it avoids to
+            leave a small tail of players at the end of the standings
+        '''
+        end = start + self._block_size
+        if total - end < self._block_size / 2:
+            end = total
+        return end
+
+    def matchBlock(self, players, start, end, history, byes, last,
+                   allow_rematch):
+        ''' Returns the perfect matching of a block of players
+
+        Args:
+          players: (player.PlayerTable) the players sorted by standings
+          start, end: (int) the block is the range of rows start to end-1
+          history: (set) canonical pairs already matched
+          byes: (set) ids of the players who already had a round bye
+          last: (bool) the block is the tail of the standings, if the
+                number of players is odd it includes the bye
+          allow_rematch: (bool) allows rematches as last resort
+        Returns:
+          (pairings, player_bye) or None if there is not a perfect matching
+        '''
+        size = end - start
+        with_bye = last and size % 2 == 1
+        if size == 1 and with_bye:
+            return [], players[start]
+        ids = players.ids[start:end]
+        wins = players.wins[start:end]
+        min_wins = min(wins)
+        max_wins = max(wins)
+        # base weight, it keeps every allowed edge positive
+        base = (SCORE_WEIGHT * (max_wins - min_wins) ** 2 + BYE_WEIGHT +
+                2 * size + 1)
+        edges = list()
+        for i in xrange(size):
+            id1, wins1 = ids[i], wins[i]
+            for j in xrange(i + 1, size):
+                id2, wins2 = ids[j], wins[j]
+                if pairKey(id1, id2) in history:
+                    if allow_rematch:
+                        edges.append((i, j, REMATCH_WEIGHT))
+                    continue
+                weight = (base - SCORE_WEIGHT * (wins1 - wins2) ** 2 -
+                          (j - i))
+                edges.append((i, j, weight))
+            if with_bye:
+                weight = (base - SCORE_WEIGHT * (wins1 - min_wins) ** 2 -
+                          (size - i))
+                if id1 in byes:
+                    weight -= BYE_WEIGHT
+                edges.append((i, size, weight))
+        mate = maxWeightMatching(edges, maxcardinality=True)
+        nodes = size + 1 if with_bye else size
+        if len(mate) < nodes or -1 in mate:
+            return None
+        pairings = list()
+        player_bye = None
+        for i in xrange(size):
+            if mate[i] == size:
+                player_bye = players[start + i]
+            elif mate[i] > i:
+                pairings.append((players[start + i], players[start + mate[i]]))
+        return pairings, player_bye
+
+
+def maxWeightMatching(edges, maxcardinality=False):
+    ''' Computes a maximum weighted matching of a general graph (Edmonds
+        blossom algorithm with dual variables, O(n^3)).
+
+    Args:
+      edges: (list) tuples (i, j, weight) with vertices 0..n-1 and integer
+             weights, i != j
+      maxcardinality: (bool) returns only a maximum-cardinality matching
+    Returns:
+      mate: (list) mate[i] is the vertex matched with i, or -1 if single
+    '''
+    if not edges:
+        return []
+    nedge = len(edges)
+    nvertex = 0
+    for (i, j, w) in edges:
+        if i >= nvertex:
+            nvertex = i + 1
+        if j >= nvertex:
+            nvertex = j + 1
+    maxweight = max(0, max(w for (i, j, w) in edges))
+
+    # endpoint[p] is the vertex of the endpoint p, edge k has endpoints
+    # 2k and 2k+1; neighbend[v] are the remote endpoints of the edges of v
+    endpoint = [edges[p // 2][p % 2] for p in xrange(2 * nedge)]
+    neighbend = [[] for i in xrange(nvertex)]
+    for k in xrange(nedge):
+        (i, j, w) = edges[k]
+        neighbend[i].append(2 * k + 1)
+        neighbend[j].append(2 * k)
+
+    # mate[v] is the remote endpoint of the matched edge of v, or -1
+    mate = nvertex * [-1]
+    # labels of top-level blossoms and vertices: 0 free, 1 S, 2 T
+    label = (2 * nvertex) * [0]
+    labelend = (2 * nvertex) * [-1]
+    inblossom = range(nvertex)
+    blossomparent = (2 * nvertex) * [-1]
+    blossomchilds = (2 * nvertex) * [None]
+    blossombase = range(nvertex) + nvertex * [-1]
+    blossomendps = (2 * nvertex) * [None]
+    bestedge = (2 * nvertex) * [-1]
+    blossombestedges = (2 * nvertex) * [None]
+    unusedblossoms = range(nvertex, 2 * nvertex)
+    # dual variables, doubled to keep them integers
+    dualvar = nvertex * [maxweight] + nvertex * [0]
+    allowedge = nedge * [False]
+    queue = []
+
+    def slack(k):
+        (i, j, wt) = edges[k]
+        return dualvar[i] + dualvar[j] - 2 * wt
+
+    def blossomLeaves(b):
+        if b < nvertex:
+            yield b
+        else:
+            for t in blossomchilds[b]:
+                if t < nvertex:
+                    yield t
+                else:
+                    for v in blossomLeaves(t):
+                        yield v
+
+    def assignLabel(w, t, p):
+        b = inblossom[w]
+        label[w] = label[b] = t
+        labelend[w] = labelend[b] = p
+        bestedge[w] = bestedge[b] = -1
+        if t == 1:
+            queue.extend(blossomLeaves(b))
+        elif t == 2:
+            base = blossombase[b]
+            assignLabel(endpoint[mate[base]], 1, mate[base] ^ 1)
+
+    def scanBlossom(v, w):
+        # trace back from v and w to find a new blossom or an augmenting
+        # path, returns the base of the blossom or -1
+        path = []
+        base = -1
+        while v != -1 or w != -1:
+            b = inblossom[v]
+            if label[b] & 4:
+                base = blossombase[b]
+                break
+            path.append(b)
+            label[b] = 5
+            if labelend[b] == -1:
+                v = -1
+            else:
+                v = endpoint[labelend[b]]
+                b = inblossom[v]
+                v = endpoint[labelend[b]]
+            if w != -1:
+                v, w = w, v
+        for b in path:
+            label[b] = 1
+        return base
+
+    def addBlossom(base, k):
+        (v, w, wt) = edges[k]
+        bb = inblossom[base]
+        bv = inblossom[v]
+        bw = inblossom[w]
+        b = unusedblossoms.pop()
+        blossombase[b] = base
+        blossomparent[b] = -1
+        blossomparent[bb] = b
+        blossomchilds[b] = path = []
+        blossomendps[b] = endps = []
+        while bv != bb:
+            blossomparent[bv] = b
+            path.append(bv)
+            endps.append(labelend[bv])
+            v = endpoint[labelend[bv]]
+            bv = inblossom[v]
+        path.append(bb)
+        path.reverse()
+        endps.reverse()
+        endps.append(2 * k)
+        while bw != bb:
+            blossomparent[bw] = b
+            path.append(bw)
+            endps.append(labelend[bw] ^ 1)
+            w = endpoint[labelend[bw]]
+            bw = inblossom[w]
+        label[b] = 1
+        labelend[b] = labelend[bb]
+        dualvar[b] = 0
+        for v in blossomLeaves(b):
+            if label[inblossom[v]] == 2:
+                queue.append(v)
+            inblossom[v] = b
+        bestedgeto = (2 * nvertex) * [-1]
+        for bv in path:
+            if blossombestedges[bv] is None:
+                nblists = [[p // 2 for p in neighbend[v]]
+                           for v in blossomLeaves(bv)]
+            else:
+                nblists = [blossombestedges[bv]]
+            for nblist in nblists:
+                for k in nblist:
+                    (i, j, wt) = edges[k]
+                    if inblossom[j] == b:
+                        i, j = j, i
+                    bj = inblossom[j]
+                    if (bj != b and label[bj] == 1 and
+                            (bestedgeto[bj] == -1 or
+                             slack(k) < slack(bestedgeto[bj]))):
+                        bestedgeto[bj] = k
+            blossombestedges[bv] = None
+            bestedge[bv] = -1
+        blossombestedges[b] = [k for k in bestedgeto if k != -1]
+        bestedge[b] = -1
+        for k in blossombestedges[b]:
+            if bestedge[b] == -1 or slack(k) < slack(bestedge[b]):
+                bestedge[b] = k
+
+    def expandBlossom(b, endstage):
+        for s in blossomchilds[b]:
+            blossomparent[s] = -1
+            if s < nvertex:
+                inblossom[s] = s
+            elif endstage and dualvar[s] == 0:
+                expandBlossom(s, endstage)
+            else:
+                for v in blossomLeaves(s):
+                    inblossom[v] = s
+        if (not endstage) and label[b] == 2:
+            # relabel the sub-blossoms on the path through the T-blossom
+            entrychild = inblossom[endpoint[labelend[b] ^ 1]]
+            j = blossomchilds[b].index(entrychild)
+            if j & 1:
+                j -= len(blossomchilds[b])
+                jstep = 1
+                endptrick = 0
+            else:
+                jstep = -1
+                endptrick = 1
+            p = labelend[b]
+            while j != 0:
+                label[endpoint[p ^ 1]] = 0
+                label[endpoint[
+                    blossomendps[b][j - endptrick] ^ endptrick ^ 1]] = 0
+                assignLabel(endpoint[p ^ 1], 2, p)
+                allowedge[blossomendps[b][j - endptrick] // 2] = True
+                j += jstep
+                p = blossomendps[b][j - endptrick] ^ endptrick
+                allowedge[p // 2] = True
+                j += jstep
+            bv = blossomchilds[b][j]
+            label[endpoint[p ^ 1]] = label[bv] = 2
+            labelend[endpoint[p ^ 1]] = labelend[bv] = p
+            bestedge[bv] = -1
+            j += jstep
+            while blossomchilds[b][j] != entrychild:
+                bv = blossomchilds[b][j]
+                if label[bv] == 1:
+                    j += jstep
+                    continue
+                for v in blossomLeaves(bv):
+                    if label[v] != 0:
+                        break
+                if label[v] != 0:
+                    label[v] = 0
+                    label[endpoint[mate[blossombase[bv]]]] = 0
+                    assignLabel(v, 2, labelend[v])
+                j += jstep
+        label[b] = labelend[b] = -1
+        blossomchilds[b] = blossomendps[b] = None
+        blossombase[b] = -1
+        blossombestedges[b] = None
+        bestedge[b] = -1
+        unusedblossoms.append(b)
+
+    def augmentBlossom(b, v):
+        # swap matched/unmatched edges over the path from v to the base
+        t = v
+        while blossomparent[t] != b:
+            t = blossomparent[t]
+        if t >= nvertex:
+            augmentBlossom(t, v)
+        i = j = blossomchilds[b].index(t)
+        if i & 1:
+            j -= len(blossomchilds[b])
+            jstep = 1
+            endptrick = 0
+        else:
+            jstep = -1
+            endptrick = 1
+        while j != 0:
+            j += jstep
+            t = blossomchilds[b][j]
+            p = blossomendps[b][j - endptrick] ^ endptrick
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p])
+            j += jstep
+            t = blossomchilds[b][j]
+            if t >= nvertex:
+                augmentBlossom(t, endpoint[p ^ 1])
+            mate[endpoint[p]] = p ^ 1
+            mate[endpoint[p ^ 1]] = p
+        blossomchilds[b] = blossomchilds[b][i:] + blossomchilds[b][:i]
+        blossomendps[b] = blossomendps[b][i:] + blossomendps[b][:i]
+        blossombase[b] = blossombase[blossomchilds[b][0]]
+
+    def augmentMatching(k):
+        (v, w, wt) = edges[k]
+        for (s, p) in ((v, 2 * k + 1), (w, 2 * k)):
+            while 1:
+                bs = inblossom[s]
+                if bs >= nvertex:
+                    augmentBlossom(bs, s)
+                mate[s] = p
+                if labelend[bs] == -1:
+                    break
+                t = endpoint[labelend[bs]]
+                bt = inblossom[t]
+                s = endpoint[labelend[bt]]
+                j = endpoint[labelend[bt] ^ 1]
+                if bt >= nvertex:
+                    augmentBlossom(bt, j)
+                mate[j] = labelend[bt]
+                p = labelend[bt] ^ 1
+
+    # each stage finds an augmenting path, at most n stages
+    for t in xrange(nvertex):
+        label[:] = (2 * nvertex) * [0]
+        bestedge[:] = (2 * nvertex) * [-1]
+        blossombestedges[nvertex:] = nvertex * [None]
+        allowedge[:] = nedge * [False]
+        queue[:] = []
+        for v in xrange(nvertex):
+            if mate[v] == -1 and label[inblossom[v]] == 0:
+                assignLabel(v, 1, -1)
+        augmented = 0
+        while 1:
+            while queue and not augmented:
+                v = queue.pop()
+                for p in neighbend[v]:
+                    k = p // 2
+                    w = endpoint[p]
+                    if inblossom[v] == inblossom[w]:
+                        continue
+                    if not allowedge[k]:
+                        kslack = slack(k)
+                        if kslack <= 0:
+                            allowedge[k] = True
+                    if allowedge[k]:
+                        if label[inblossom[w]] == 0:
+                            assignLabel(w, 2, p ^ 1)
+                        elif label[inblossom[w]] == 1:
+                            base = scanBlossom(v, w)
+                            if base >= 0:
+                                addBlossom(base, k)
+                            else:
+                                augmentMatching(k)
+                                augmented = 1
+                                break
+                        elif label[w] == 0:
+                            label[w] = 2
+                            labelend[w] = p ^ 1
+                    elif label[inblossom[w]] == 1:
+                        b = inblossom[v]
+                        if bestedge[b] == -1 or kslack < slack(bestedge[b]):
+                            bestedge[b] = k
+                    elif label[w] == 0:
+                        if bestedge[w] == -1 or kslack < slack(bestedge[w]):
+                            bestedge[w] = k
+            if augmented:
+                break
+            # no augmenting path with the current duals, update them
+            deltatype = -1
+            delta = deltaedge = deltablossom = None
+            if not maxcardinality:
+                deltatype = 1
+                delta = min(dualvar[:nvertex])
+            for v in xrange(nvertex):
+                if label[inblossom[v]] == 0 and bestedge[v] != -1:
+                    d = slack(bestedge[v])
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 2
+                        deltaedge = bestedge[v]
+            for b in xrange(2 * nvertex):
+                if (blossomparent[b] == -1 and label[b] == 1 and
+                        bestedge[b] != -1):
+                    d = slack(bestedge[b]) // 2
+                    if deltatype == -1 or d < delta:
+                        delta = d
+                        deltatype = 3
+                        deltaedge = bestedge[b]
+            for b in xrange(nvertex, 2 * nvertex):
+                if (blossombase[b] >= 0 and blossomparent[b] == -1 and
+                        label[b] == 2 and
+                        (deltatype == -1 or dualvar[b] < delta)):
+                    delta = dualvar[b]
+                    deltatype = 4
+                    deltablossom = b
+            if deltatype == -1:
+                # no further improvement possible, the matching is optimum
+                deltatype = 1
+                delta = max(0, min(dualvar[:nvertex]))
+            for v in xrange(nvertex):
+                if label[inblossom[v]] == 1:
+                    dualvar[v] -= delta
+                elif label[inblossom[v]] == 2:
+                    dualvar[v] += delta
+            for b in xrange(nvertex, 2 * nvertex):
+                if blossombase[b] >= 0 and blossomparent[b] == -1:
+                    if label[b] == 1:
+                        dualvar[b] += delta
+                    elif label[b] == 2:
+                        dualvar[b] -= delta
+            if deltatype == 1:
+                break
+            elif deltatype == 2:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                if label[inblossom[i]] == 0:
+                    i, j = j, i
+                queue.append(i)
+            elif deltatype == 3:
+                allowedge[deltaedge] = True
+                (i, j, wt) = edges[deltaedge]
+                queue.append(i)
+            elif deltatype == 4:
+                expandBlossom(deltablossom, False)
+        if not augmented:
+            break
+        # end of the stage, expand the S-blossoms with zero dual
+        for b in xrange(nvertex, 2 * nvertex):
+            if (blossomparent[b] == -1 and blossombase[b] >= 0 and
+                    label[b] == 1 and dualvar[b] == 0):
+                expandBlossom(b, True)
+
+    for v in xrange(nvertex):
+        if mate[v] >= 0:
+            mate[v] = endpoint[mate[v]]
+    return mate
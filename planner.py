@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# planner.py -- format of a Swiss-system tournament by number of players
+#
+
+import bisect
+import collections
+
+# rounds of the swiss by number of participants, up to 409 players: the
+# players of RANGE_END[i] or less (and more than RANGE_END[i-1]) play
+# ROUNDS[i] rounds. Bigger fields play ceil(log2(players)) + 1 rounds
+RANGE_END = [4, 8, 16, 32, 64, 128, 226, 409]
+ROUNDS = [2, 3, 4, 5, 6, 7, 8, 9]
+
+MIN_TOP_PLAYERS = 8      # the cut of fields with 8 players or more
+MAX_TOP_PLAYERS = 64
+PLAYERS_BY_SEAT = 64     # players of the field by each player of the cut
+
+ACCELERATED_FIELD = 1024  # fields from this size use accelerated pairings
+ACCELERATED_ROUNDS = 2
+
+Format = collections.namedtuple(
+    'Format', 'rounds, top_players, rounds_single, accelerated_rounds')
+
+
+def swissRounds(participants):
+    ''' Returns the number of swiss rounds for a field of participants '''
+    if participants <= RANGE_END[-1]:
+        return ROUNDS[bisect.bisect_left(RANGE_END, participants)]
+    return (participants - 1).bit_length() + 1
+
+
+def topPlayers(participants):
+    ''' Returns the size of the cut to the single-elimination tournament:
+        4 players for small fields, the top 8 up to 1023 players, then it
+        grows by powers of 2 (a seat by PLAYERS_BY_SEAT players) up to the
+        top 64
+    '''
+    if participants < MIN_TOP_PLAYERS:
+        return 4
+    top = 1 << max((participants / PLAYERS_BY_SEAT).bit_length() - 1, 0)
+    return min(max(top, MIN_TOP_PLAYERS), MAX_TOP_PLAYERS)
+
+
+def planFormat(participants, top_players=None, accelerated_rounds=None):
+    ''' Plans the format of a tournament from the size of the field
+
+    Args:
+      participants: (int) the number of players
+      top_players: (int) the size of the cut, by default see topPlayers
+      accelerated_rounds: (int) the first rounds paired with accelerated
+                          pairings (see Swiss.swissPairings), by default
+                          ACCELERATED_ROUNDS for fields of ACCELERATED_FIELD
+                          players or more
+    Returns:
+      A Format (rounds, top_players, rounds_single, accelerated_rounds)
+    '''
+    if top_players is None:
+        top_players = topPlayers(participants)
+    if accelerated_rounds is None:
+        accelerated_rounds = (ACCELERATED_ROUNDS
+                              if participants >= ACCELERATED_FIELD else 0)
+    rounds = swissRounds(participants)
+    return Format(rounds, top_players, (top_players - 1).bit_length(),
+                  min(accelerated_rounds, rounds))
@@ -3,8 +3,13 @@
 # player.py -- player info of tournament
 #
 
+import array
+
+
 class Player(object):
 
+	__slots__ = ('wins', 'player_id', 'name', 'matches')
+
 	def __init__(self,wins, player_id, name,matches):
 		self.wins=wins
 		self.player_id=player_id
@@ -24,5 +29,71 @@ class Player(object):
 		return self.matches
 
 
+class PlayerTable(object):
+
+	''' Players of a round in parallel arrays (id, wins, matches, byes,
+	    points), sorted by standings.
+
+	    It's the input of the pairing engines: a row is an index, a score
+	    group is a range of indexes (see scoreGroups) and a Player is only
+	    built when a row is read with table[i]
+	'''
+
+	__slots__ = ('ids', 'names', 'wins', 'matches', 'byes', 'points')
+
+	def __init__(self, rows=()):
+		''' Args:
+		      rows: tuples (id, name, wins, matches[, byes, points]) sorted
+		            by standings
+		'''
+		self.ids = array.array('l')
+		self.names = list()
+		self.wins = array.array('l')
+		self.matches = array.array('l')
+		self.byes = array.array('l')
+		# POINTS is DOUBLE PRECISION in PLAYER_STANDINGS
+		self.points = array.array('d')
+		for row in rows:
+			self.append(*row)
+
+	@classmethod
+	def fromPlayers(cls, players):
+		return cls((p.player_id, p.name, p.wins, p.matches) for p in players)
+
+	def append(self, player_id, name, wins, matches, byes=0, points=0):
+		self.ids.append(player_id)
+		self.names.append(name)
+		self.wins.append(wins)
+		self.matches.append(matches)
+		# the players without matches have null byes and points
+		self.byes.append(byes or 0)
+		self.points.append(points or 0)
+
+	def __len__(self):
+		return len(self.ids)
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in xrange(*i.indices(len(self)))]
+		return Player(self.wins[i], self.ids[i], self.names[i], self.matches[i])
 
+	def reorder(self, order):
+		''' Returns a new table with the rows in the order of the indexes '''
+		table = PlayerTable()
+		for column in self.__slots__:
+			values = getattr(self, column)
+			getattr(table, column).extend(values[i] for i in order)
+		return table
 
+	def scoreGroups(self):
+		''' Returns the score groups as a list of (wins, start, end), the
+		    players of a group are the rows start to end-1. The groups follow
+		    the order of the table, from the highest wins
+		'''
+		groups = list()
+		start = 0
+		for i in xrange(1, len(self.wins) + 1):
+			if i == len(self.wins) or self.wins[i] != self.wins[start]:
+				groups.append((self.wins[start], start, i))
+				start = i
+		return groups
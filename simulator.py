@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+#
+# simulator.py -- Monte Carlo simulation of Swiss-system formats
+#
+# It plays many tournaments at once without database: the state of all the
+# events is kept in NumPy arrays (event x player) and the events are split
+# in chunks played by a pool of processes. The winner of a match is drawn
+# from the Elo win probability of the ratings of the players:
+#     python simulator.py [players] [events] [processes]
+
+import multiprocessing
+import sys
+import numpy
+import planner
+import bracket
+
+# the rules of tournament.TIE_BREAKS, without the database dependencies
+TIE_BREAKS = ('OPP_POINTS', 'BUCHHOLZ', 'MEDIAN_BUCHHOLZ', 'SONNEBORN_BERGER',
+              'CUMULATIVE', 'POINTS')
+RATING_MEAN = 1500.0
+RATING_SD = 200.0
+CHUNK_EVENTS = 500  # events played at once by a process
+
+
+def winProbability(rating1, rating2):
+    ''' Returns the Elo probability that the player of rating1 wins '''
+    return 1.0 / (1.0 + 10.0 ** ((rating2 - rating1) / 400.0))
+
+
+class SwissSimulation(object):
+
+    ''' A batch of Swiss-system events with the same format, simulated
+        with arrays of shape (events, players).
+
+        The pairings of a round sort the players of each event by wins (the
+        ties in random order) and pair them by consecutive positions, the
+        lowest player without a bye gets the bye if the number of players is
+        odd. Rematches are not avoided, for the pairing rules see
+        pairing.BlossomPairing. The accelerated rounds add a virtual win to
+        the top half by rating, as Swiss.acceleratedPlayers. The tie-breaks
+        follow UPDATETIEBREAKS of tournament.sql
+    '''
+
+    def __init__(self, ratings, rounds, rng, accelerated_rounds=0):
+        ''' Args:
+              ratings: (array) ratings of the players, shape (events, players)
+              rounds: (int) the swiss rounds
+              rng: (numpy.random.RandomState) the generator of the results
+              accelerated_rounds: (int) the first rounds with virtual wins
+        '''
+        self.ratings = ratings
+        self.events, self.players = ratings.shape
+        self.rounds = rounds
+        self.rng = rng
+        self.accelerated_rounds = accelerated_rounds
+        self.rows = numpy.arange(self.events)[:, None]
+        # the top half of the initial ranking (by rating) of each event
+        rank_ini = numpy.argsort(numpy.argsort(-ratings, axis=1), axis=1)
+        self.top_half = (rank_ini < self.players / 2).astype(numpy.int32)
+        # results by round: the opponent (-1 is a bye) and if it won
+        self.opponents = numpy.full((rounds, self.events, self.players), -1,
+                                    dtype=numpy.int32)
+        self.won = numpy.zeros((rounds, self.events, self.players), dtype=bool)
+        self.wins = numpy.zeros((self.events, self.players), dtype=numpy.int32)
+        self.had_bye = numpy.zeros((self.events, self.players), dtype=bool)
+
+    def pairRound(self, round_):
+        ''' Returns the pairs (first, second) of the round, arrays of shape
+            (events, players / 2), and the players with bye (or None)
+        '''
+        wins = self.wins
+        if round_ < self.accelerated_rounds:
+            wins = wins + self.top_half
+        noise = self.rng.random_sample((self.events, self.players))
+        order = numpy.lexsort((noise, -wins), axis=-1)
+        bye = None
+        if self.players % 2:
+            # the lowest player of the standings without a previous bye
+            candidates = ~self.had_bye[self.rows, order]
+            position = self.players - 1 - numpy.argmax(
+                candidates[:, ::-1], axis=1)
+            bye = order[numpy.arange(self.events), position]
+            keep = numpy.ones(order.shape, dtype=bool)
+            keep[numpy.arange(self.events), position] = False
+            order = order[keep].reshape(self.events, self.players - 1)
+        return order[:, 0::2], order[:, 1::2], bye
+
+    def playRound(self, round_):
+        first, second, bye = self.pairRound(round_)
+        probability = winProbability(self.ratings[self.rows, first],
+                                     self.ratings[self.rows, second])
+        first_won = self.rng.random_sample(probability.shape) < probability
+        opponents, won = self.opponents[round_], self.won[round_]
+        opponents[self.rows, first] = second
+        opponents[self.rows, second] = first
+        won[self.rows, first] = first_won
+        won[self.rows, second] = ~first_won
+        if bye is not None:
+            won[numpy.arange(self.events), bye] = True
+            self.had_bye[numpy.arange(self.events), bye] = True
+        self.wins += won
+
+    def play(self):
+        for round_ in xrange(self.rounds):
+            self.playRound(round_)
+
+    def tieBreaks(self):
+        ''' Returns a dict rule --> array (events, players) of the tie-breaks
+            at the end of the swiss rounds
+        '''
+        played = self.opponents >= 0
+        opponents = numpy.where(played, self.opponents, 0)
+        # points: the winner of a match adds the number of the round
+        round_number = numpy.arange(1, self.rounds + 1)[:, None, None]
+        points = (self.won & played) * round_number
+        points = points.sum(axis=0)
+        opp_wins = numpy.where(played, self.wins[self.rows, opponents], 0)
+        opp_points = numpy.where(played, points[self.rows, opponents], 0)
+        buchholz = opp_wins.sum(axis=0)
+        games = played.sum(axis=0)
+        high = numpy.where(played, opp_wins, -1).max(axis=0)
+        low = numpy.where(played, opp_wins, self.rounds + 1).min(axis=0)
+        median = numpy.where(games > 2, buchholz - high - low, buchholz)
+        # a win in the round r of R adds R-r+1, the byes too
+        cumulative = (self.won * (self.rounds + 1 - round_number)).sum(axis=0)
+        return {'OPP_POINTS': opp_points.sum(axis=0),
+                'BUCHHOLZ': buchholz,
+                'MEDIAN_BUCHHOLZ': median,
+                'SONNEBORN_BERGER': (opp_wins * self.won).sum(axis=0),
+                'CUMULATIVE': cumulative,
+                'POINTS': points}
+
+    def finalRanking(self, tie_breaks):
+        ''' Returns the players of each event sorted by wins and tie_breaks,
+            array (events, players)
+        '''
+        values = self.tieBreaks()
+        noise = self.rng.random_sample((self.events, self.players))
+        keys = [noise] + [-values[rule] for rule in reversed(tie_breaks)]
+        return numpy.lexsort(keys + [-self.wins], axis=-1)
+
+    def playKnockout(self, cut):
+        ''' Plays the single-elimination of the cut (events, top players)
+            with the bracket positions of bracket.seedOrder, returns the
+            champion of each event
+        '''
+        top = cut.shape[1]
+        size = 1 << (max(top, 2) - 1).bit_length()
+        order = numpy.array(bracket.seedOrder(size)) - 1
+        alive = numpy.where(order < top, cut[:, numpy.minimum(order, top - 1)],
+                            -1)
+        while alive.shape[1] > 1:
+            first, second = alive[:, 0::2], alive[:, 1::2]
+            probability = winProbability(
+                self.ratings[self.rows, numpy.maximum(first, 0)],
+                self.ratings[self.rows, numpy.maximum(second, 0)])
+            first_won = self.rng.random_sample(probability.shape) < probability
+            # a missing seed (-1) is a bye
+            first_won = numpy.where(second < 0, True,
+                                    numpy.where(first < 0, False, first_won))
+            alive = numpy.where(first_won, first, second)
+        return alive[:, 0]
+
+
+def simulateChunk(args):
+    ''' Plays a chunk of events, returns the counters of the statistics.
+        It's the task of the processes of the pool, see simulateFormat
+    '''
+    (players, events, rounds, top_players, accelerated_rounds, tie_breaks,
+     ratings, seed) = args
+    rng = numpy.random.RandomState(seed)
+    if ratings is None:
+        ratings = rng.normal(RATING_MEAN, RATING_SD, (events, players))
+    else:
+        ratings = numpy.tile(numpy.asarray(ratings, dtype=float), (events, 1))
+    simulation = SwissSimulation(ratings, rounds, rng, accelerated_rounds)
+    simulation.play()
+    ranking = simulation.finalRanking(tie_breaks)
+    cut = ranking[:, :top_players]
+    champion = simulation.playKnockout(cut)
+    # the true order of strength of each event
+    strength = numpy.argsort(-ratings, axis=1)
+    strongest = strength[:, 0]
+    rank_strongest = numpy.argmax(ranking == strongest[:, None], axis=1)
+    in_cut = (cut[:, :, None] == strength[:, None, :top_players]).any(axis=2)
+    return {'events': events,
+            'strongest_top': int((rank_strongest < top_players).sum()),
+            'strongest_first': int((rank_strongest == 0).sum()),
+            'strongest_champion': int((champion == strongest).sum()),
+            'rank_strongest': int(rank_strongest.sum()),
+            'true_top_in_cut': int(in_cut.sum()),
+            'undefeated': int((simulation.wins == rounds).sum())}
+
+
+def simulateFormat(players, events=1000, rounds=None, top_players=None,
+                   accelerated_rounds=None, tie_breaks=('OPP_POINTS', 'POINTS'),
+                   ratings=None, processes=None, seed=0):
+    ''' Simulates events of a Swiss-system format and returns its statistics
+
+    Args:
+      players: (int) the players of each event
+      events: (int) the number of events simulated
+      rounds, top_players, accelerated_rounds: the format, by default
+                                               planner.planFormat
+      tie_breaks: (list) rules of TIE_BREAKS to break the ties of wins
+      ratings: (list) the ratings of the players, by default random ratings
+               (normal, mean RATING_MEAN, sd RATING_SD) for each event
+      processes: (int) the processes of the pool, by default the CPUs,
+                 1 runs in this process
+      seed: (int) the seed of the results, the same seed gives the same
+            statistics
+    Returns:
+      A dict with the format and the statistics: the rate of events where
+      the strongest player makes the top, finishes first of the swiss and
+      wins the knockout, its average rank (1 is the first), the average
+      share of the true top players in the cut and the average number of
+      undefeated players after the swiss
+    '''
+    for rule in tie_breaks:
+        if rule not in TIE_BREAKS:
+            raise ValueError('Unknown tie-break rule %s, use one of %s'
+                             % (rule, ', '.join(TIE_BREAKS)))
+    if ratings is not None and len(ratings) != players:
+        raise ValueError('A rating is required by player')
+    plan = planner.planFormat(players, top_players, accelerated_rounds)
+    rounds = rounds or plan.rounds
+    top_players = min(plan.top_players, players)
+    accelerated_rounds = min(plan.accelerated_rounds, rounds)
+    tasks = list()
+    for chunk, start in enumerate(xrange(0, events, CHUNK_EVENTS)):
+        tasks.append((players, min(CHUNK_EVENTS, events - start), rounds,
+                      top_players, accelerated_rounds, tuple(tie_breaks),
+                      ratings, seed * 1000003 + chunk))
+    if processes == 1:
+        results = map(simulateChunk, tasks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(simulateChunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    total = dict()
+    for result in results:
+        for key, value in result.iteritems():
+            total[key] = total.get(key, 0) + value
+    events = float(total['events'])
+    return {'players': players,
+            'events': total['events'],
+            'rounds': rounds,
+            'top_players': top_players,
+            'accelerated_rounds': accelerated_rounds,
+            'tie_breaks': list(tie_breaks),
+            'strongest_top_rate': total['strongest_top'] / events,
+            'strongest_first_rate': total['strongest_first'] / events,
+            'strongest_champion_rate': total['strongest_champion'] / events,
+            'strongest_mean_rank': total['rank_strongest'] / events + 1,
+            'true_top_in_cut_rate':
+                total['true_top_in_cut'] / (events * top_players),
+            'undefeated_mean': total['undefeated'] / events}
+
+
+if __name__ == '__main__':
+    players = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    events = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    stats = simulateFormat(players, events, processes=processes)
+    for key in sorted(stats):
+        print '%s\t%s' % (key, stats[key])
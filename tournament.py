@@ -4,11 +4,257 @@
 #
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 import collections
+import itertools
+import contextlib
+import threading
+import logging
+import copy
+import functools
+import csv
+import json
+import time
 import random
 import player
+import pairing
+import bracket
+import planner
 import datetime
-import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+DSN = 'dbname=tournament'
+POOL_SIZE = 10  # connections shared by all the tournaments of the process
+POOL_TRANSACTIONS = 100  # connections of open transactions beyond POOL_SIZE
+POOL_TIMEOUT = 30.0  # seconds waiting for a connection of the pool
+FETCH_SIZE = 2000  # rows by round trip of the streamed reads
+REPORT_RETRIES = 5  # attempts of a report, see TournamentDb.upsertMatches
+REPORT_BACKOFF = 0.05  # seconds before the first retry, doubled by retry
+PRECOMPUTE_RESULTS = 4  # pairings kept by PairingPrecompute
+
+# hot statements, prepared once per connection and run with EXECUTE, see
+# TournamentDb.dbPrepared: name --> (types of the parameters, statement)
+PREPARED_STATEMENTS = {
+    'insert_match': (
+        'INTEGER, INTEGER, TIMESTAMP, INTEGER, INTEGER',
+        'INSERT INTO MATCHES (TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER, '
+        'LOSER) VALUES ($1, $2, $3, $4, $5)'),
+    'find_player': (
+        'TEXT',
+        'SELECT PLAYER_ID FROM PLAYERS WHERE FULL_NAME=$1'),
+    'update_last_tournament': (
+        'INTEGER, INTEGER',
+        'UPDATE PLAYERS SET LAST_TRNMNT_RGSTRD=$1 WHERE PLAYER_ID=$2'),
+    'insert_player': (
+        'TEXT, INTEGER',
+        "INSERT INTO PLAYERS (PLAYER_ID, FULL_NAME, LAST_TRNMNT_RGSTRD) "
+        "VALUES (NEXTVAL('ID_PLAYER_SEQUENCE'), $1, $2) RETURNING PLAYER_ID"),
+}
+
+# reads of the storage methods shared by TournamentDb and the asynchronous
+# tournament_async.AsyncTournamentDb, so both return the same rows
+STORAGE_QUERIES = {
+    'standings':
+        'SELECT PLAYER_ID, FULL_NAME, WINS, MATCHES, BYES, POINTS, RANK_INI '
+        'FROM F_STANDINGS(%s)',
+    'match_pairs':
+        'SELECT WINNER, LOSER FROM MATCHES WHERE TOURNAMENT_ID=%s',
+    'bye_players':
+        'SELECT WINNER FROM MATCHES WHERE LOSER=0 AND TOURNAMENT_ID=%s '
+        'ORDER BY ROUND DESC',
+}
+
+logger = logging.getLogger('tournament')
+
+# tie-break rules, columns of PLAYER_STANDINGS updated by UPDATETIEBREAKS
+TIE_BREAKS = ('OPP_POINTS', 'BUCHHOLZ', 'MEDIAN_BUCHHOLZ', 'SONNEBORN_BERGER',
+              'CUMULATIVE', 'POINTS')
+
+PlayerStandings = collections.namedtuple(
+    'playerStandings', 'id, name, wins, matches')
+
+
+def textStatement(name):
+    ''' Returns a statement of PREPARED_STATEMENTS as text, with the
+        parameters of psycopg2 (%s) instead of $1, $2...
+    '''
+    types, query = PREPARED_STATEMENTS[name]
+    query = query.replace('%', '%%')
+    for i in xrange(len(types.split(',')), 0, -1):
+        query = query.replace('$%s' % i, '%s')
+    return query
+
+
+def standingsKey(row):
+    ''' Sort key of a row of the in-memory standings, the same order of
+        F_STANDINGS: WINS DESC, BYES DESC, POINTS DESC (nulls first), RANK_INI
+    '''
+    player_id, name, wins, matches, byes, points, rank_ini = row
+    return (-wins, (0,) if byes is None else (1, -byes),
+            (0,) if points is None else (1, -points), rank_ini)
+
+
+def applyResult(standings, winner, loser, round_):
+    ''' Applies a match to the rows of the in-memory standings (a dict
+        player_id --> [id, name, wins, matches, byes, points, rank_ini]),
+        with the same rules of the trigger UPDATESTANDINGS
+
+    Returns:
+      False if a player has no row (nothing is applied), True otherwise
+    '''
+    rows = [standings.get(winner)]
+    if loser > 0:
+        rows.append(standings.get(loser))
+    if None in rows:
+        return False
+    for row in rows:
+        if row[4] is None:  # first match, the standings row is created
+            row[4], row[5] = 0, 0
+    row = rows[0]
+    row[2] += 1
+    row[3] += 1
+    if loser == 0:
+        row[4] += 1
+    elif row[5] is not None and round_ is not None:
+        row[5] += round_
+    else:
+        row[5] = None
+    if loser > 0:
+        rows[1][3] += 1
+    return True
+
+
+def acceleratePlayers(players, standings):
+    '''Adds a virtual win to the top half of the initial ranking, for the
+       accelerated rounds of large fields (see planner.planFormat)
+
+    With the virtual win the best seeds meet each other from the first
+    round, so the field is sorted in less rounds. It only changes the
+    players given to the pairing engine, not the standings
+    Args:
+      players: (player.PlayerTable) the players sorted by standings
+      standings: (dict) the in-memory standings, with the initial ranking
+    Returns:
+      A new PlayerTable with the virtual wins, sorted again by standings
+    '''
+    half = len(players) / 2
+    rank_ini = dict((row[0], row[6]) for row in standings.itervalues())
+    wins = [w + (1 if 0 < rank_ini[i] <= half else 0)
+            for i, w in itertools.izip(players.ids, players.wins)]
+    # a stable sort keeps the order of the standings between same wins
+    order = sorted(xrange(len(wins)), key=lambda i: -wins[i])
+    accelerated = players.reorder(order)
+    for row, i in enumerate(order):
+        accelerated.wins[row] = wins[i]
+    return accelerated
+
+
+# the input of a round's pairings, copied from the state of a tournament
+# (see Swiss.pairingSnapshot): the standings rows, the pairs already matched
+# and the players with a bye. Two snapshots are equal if they pair the same
+PairingSnapshot = collections.namedtuple(
+    'PairingSnapshot', 'round, standings, history, byes, accelerated')
+
+# the pairings of a round: tuples (id1, name1, id2, name2) and the (id, name)
+# of the round bye, None if the number of players is even
+RoundPairings = collections.namedtuple('RoundPairings', 'round, pairings, bye')
+
+
+def pairSnapshot(engine, snapshot):
+    ''' Pairs a round without side effects: nothing is written and the
+        snapshot is not changed, so it can run ahead of time, twice or in
+        another thread. Swiss.commitPairings applies the result
+
+    Args:
+      engine: the pairing engine (see pairing.py), it must be reentrant
+      snapshot: (PairingSnapshot) the state of the tournament
+    Returns:
+      A RoundPairings of the round of the snapshot
+    '''
+    players = player.PlayerTable(
+        row[:6] for row in sorted(snapshot.standings.itervalues(),
+                                  key=standingsKey))
+    if snapshot.accelerated:
+        players = acceleratePlayers(players, snapshot.standings)
+    pairs, player_bye = engine.pairRound(players, snapshot.history,
+                                         snapshot.byes)
+    bye = None
+    if player_bye is not None:
+        bye = (player_bye.getPlayerId(), player_bye.getName())
+    return RoundPairings(snapshot.round,
+                         [(p1.getPlayerId(), p1.getName(),
+                           p2.getPlayerId(), p2.getName()) for p1, p2 in pairs],
+                         bye)
+
+
+def speculateResult(snapshot, winner, loser, round_):
+    ''' Returns a copy of the snapshot with the result of a match applied,
+        the rows of the other players are shared
+    '''
+    standings = dict(snapshot.standings)
+    for player_id in (winner, loser):
+        if player_id in standings:
+            standings[player_id] = list(standings[player_id])
+    applyResult(standings, winner, loser, round_)
+    history = snapshot.history | frozenset([pairing.pairKey(winner, loser)])
+    byes = snapshot.byes | frozenset([winner]) if loser == 0 else snapshot.byes
+    return snapshot._replace(standings=standings, history=history, byes=byes)
+
+
+# columns of the exports (see Tournament.exportStandings), csv or jsonl
+EXPORT_FORMATS = ('csv', 'jsonl')
+STANDINGS_COLUMNS = ('player_id', 'full_name', 'wins', 'matches', 'byes',
+                     'points', 'rank_ini', 'rank_fin')
+MATCHES_COLUMNS = ('tournament_id', 'round', 'date_match', 'winner', 'loser')
+PAIRINGS_COLUMNS = ('id1', 'name1', 'id2', 'name2')
+
+
+def checkExportFormat(fmt):
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError('Unknown export format %s, use one of %s'
+                         % (fmt, ', '.join(EXPORT_FORMATS)))
+
+
+def writeRows(rows, columns, output, fmt):
+    ''' Writes rows to the file output, one by one, in the format of the
+        exports of PostgreSQL: CSV with header or a JSON object by line
+
+    Args:
+      rows: (iterable) tuples with the values of the columns
+      columns: (tuple) the names of the columns
+      output: (file) the file written
+      fmt: (string) 'csv' or 'jsonl'
+    '''
+    checkExportFormat(fmt)
+    if fmt == 'csv':
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+        return
+    for row in rows:
+        output.write(json.dumps(collections.OrderedDict(zip(columns, row)),
+                                default=lambda value: value.isoformat()))
+        output.write('\n')
+
+
+def apiOperation(method):
+    ''' Decorator of the API methods of Tournament: with the instrumentation
+        of the storage enabled (TournamentDb.enableStats), the statements of
+        a call are recorded by QueryStats as one operation, named after the
+        class and the method (e.g. Swiss.swissPairings). The API methods
+        called by another one are part of its operation
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stats = getattr(self.conn_trnmt_db, '_stats', None)
+        if stats is None:
+            return method(self, *args, **kwargs)
+        name = '%s.%s' % (type(self).__name__, method.__name__)
+        with stats.operation(name, self._round):
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class Tournament(object):
@@ -18,12 +264,28 @@ class Tournament(object):
         report matches, get standings.
     '''
 
-    def __init__(self):
+    def __init__(self, dsn=DSN, pool_size=POOL_SIZE, storage=None,
+                 journal=None):
         ''' inicialize the class and create an instance of TournamentDb
+
+        Args:
+          dsn: (string) the connection string of the database
+          pool_size: (int) the maximum number of connections shared by the
+                     tournaments with the same dsn
+          storage: (TournamentStorage) the storage of the tournament, by
+                   default a TournamentDb with dsn and pool_size. Use
+                   tournament_memory.MemoryTournamentDb to run without
+                   database
+          journal: (journal.MatchJournal) if it's given, reportMatch and
+                   reportRound append the results to the local journal and
+                   its flusher writes them to the storage
         '''
         self.statusConnect = False
-        self.conn_trnmt_db = TournamentDb()
+        if storage is None:
+            storage = TournamentDb(dsn, pool_size)
+        self.conn_trnmt_db = storage
         self.conn_trnmt_db.connect()
+        self._journal = journal
         self._tournament_id = None
         self._statusInit = False
         self._round = 0
@@ -31,7 +293,21 @@ class Tournament(object):
         self._participants = 0
         self._rounds_single=0
         self._top_players=0
-
+        self._accelerated_rounds = 0
+        self._match_history = None
+        # in-memory standings: player_id --> [id, name, wins, matches, byes,
+        # points, rank_ini], the same columns of F_STANDINGS
+        self._standings = None
+        self._standings_sorted = None
+        self._cache_generation = self.conn_trnmt_db._generation
+        # single-elimination bracket, built after the cut (see bracket.py)
+        self._bracket = None
+        # the pairs of the last round paired still without result, and the
+        # worker that pairs the next round ahead (see Swiss.startPrecompute)
+        self._open_boards = None
+        self._precompute = None
+
+    @apiOperation
     def setTournamentInfo(self, settings):
         '''Define an id for the tournament,in order to support multi-tournaments
 
@@ -47,69 +323,131 @@ class Tournament(object):
         '''
         self._tournament_id = settings[0]
         self._participants = settings[5]
-        query = 'SELECT COUNT(1) FROM TOURNAMENT WHERE TOURNAMENT_ID=%s'
-        data = (self._tournament_id,)
-        self.conn_trnmt_db._cursor.execute(query,data)
-        result = self.conn_trnmt_db._cursor.fetchone()
         print ' ---Setting Tournament---'
-        if (result[0]) >= 1:
+        if self.conn_trnmt_db.tournamentExists(self._tournament_id):
             print 'Tournament Id already registered, getting new one from seq'
-            query = '''SELECT NEXTVAL('ID_TOURNAMENT_SEQUENCE')'''
-            self.conn_trnmt_db._cursor.execute(query)
-            result = self.conn_trnmt_db._cursor.fetchone()
-            print 'The new Tournament Id is[', result[0], ']'
-            self._tournament_id = result[0]
-            settings[0] = result[0]
+            self._tournament_id = self.conn_trnmt_db.nextTournamentId()
+            print 'The new Tournament Id is[', self._tournament_id, ']'
+            settings[0] = self._tournament_id
         print settings
-        # range of participants to define number of rounds acording to swiss-system 
-        rang_ini = [3, 5,  9, 17, 33,  65, 128, 227]
-        rang_fin = [4, 8, 16, 32, 64, 128, 226, 409]
-        x, aux_round = 0, 2
-        for i in rang_ini:
-            if self._participants in xrange(i, rang_fin[x]+1):
-                self._total_rounds = aux_round
-                break
-            aux_round += 1
-            x += 1
-        if self._participants > 409:
-            self._total_rounds = 10
-        if self._participants >= 8:
-            self._rounds_single = 3 
-            self._top_players=8
-        else:
-            self._rounds_single = 2
-            self._top_players=4    
-        query = 'INSERT INTO TOURNAMENT (TOURNAMENT_ID, TOURNAMENT_NAME, \
-            TOURNAMENT_PLACE, START_DATE, END_DATE,NUMBER_PARTICIPANTS) \
-            VALUES (%s,%s,%s,%s,%s,%s);'
-        self.conn_trnmt_db.dbStatementCommit(query, settings)
+        # rounds, cut and accelerated pairings acording to the size of field
+        plan = planner.planFormat(self._participants)
+        self._total_rounds = plan.rounds
+        self._accelerated_rounds = plan.accelerated_rounds
+        self.setTopPlayers(plan.top_players)
+        self.conn_trnmt_db.insertTournament(settings)
         print 'Number of rounds to the Tournament [', self._total_rounds, ']'
 
-    def rankingInit(self):
+    @classmethod
+    def resume(cls, trnmnt_id, **kwargs):
+        '''Returns a tournament of this class with the state of an existing
+           tournament, ready to pair its next round (see resumeTournament)
+
+        Args:
+          trnmnt_id: (int) the id of the tournament
+          kwargs: the arguments of the constructor, e.g. dsn or storage
+        '''
+        tournament = cls(**kwargs)
+        tournament.resumeTournament(trnmnt_id)
+        return tournament
+
+    @apiOperation
+    def resumeTournament(self, trnmnt_id):
+        '''Loads an existing tournament, e.g. after a restart of the process
+
+        The format, the round, the match history, the standings and the
+        bracket are rebuilt from one read of the storage. The next round
+        is the one after the last reported match (or round bye), the
+        missing results of that round can still be reported with its
+        number. The knockout matches reported after the last save of the
+        bracket are applied to it
+
+        Args:
+          trnmnt_id: (int) the id of the tournament
+        '''
+        self.syncJournal()
+        state = self.conn_trnmt_db.tournamentState(trnmnt_id)
+        if state is None:
+            raise ValueError('The tournament %s does not exist' % trnmnt_id)
+        self.invalidateCaches()
+        self._tournament_id = trnmnt_id
+        self._participants = state['participants']
+        plan = planner.planFormat(self._participants)
+        self._total_rounds = plan.rounds
+        self._accelerated_rounds = plan.accelerated_rounds
+        self.setTopPlayers(plan.top_players)
+        self._standings = dict((row[0], list(row))
+                               for row in state['standings'])
+        self._match_history = set(pairing.pairKey(w, l)
+                                  for r, w, l in state['matches'])
+        self._statusInit = any(row[6] > 0 for row in state['standings'])
+        rounds = [r for r, w, l in state['matches'] if r is not None]
+        self._round = max(rounds) + 1 if rounds else int(self._statusInit)
+        if state['bracket'] is not None:
+            self._bracket = bracket.Bracket.fromJson(state['bracket'])
+            # the cut of the bracket may be other than the planned one
+            self.setTopPlayers(self._bracket.seedCount())
+            for round_, winner, loser in state['matches']:
+                if round_ > self._total_rounds:
+                    self._bracket.reportMatch(winner, loser)
+
+    def setTopPlayers(self, top_players):
+        ''' Defines the size of the cut to the single-elimination tournament
+
+        Args:
+          top_players: (int) the number of players of the cut (8, 16, 32,
+                       64...), it defines the rounds of the single-elimination
+                       tournament. If it isn't a power of 2 the best seeds
+                       have a bye in the first round, see bracket.Bracket
+        '''
+        if top_players < 2:
+            raise ValueError('The top players must be at least 2, not %s'
+                             % top_players)
+        self._top_players = top_players
+        self._rounds_single = (top_players - 1).bit_length()
+
+    @apiOperation
+    def rankingInit(self, seed=None, by_rating=False):
         ''' Adds an initial ranking randomly for the first round by shuffling
 
         According to Swiss-Style the participants registered in the tournament
         must be shuffled for the first round. In order to support 
         multi-tournaments the players must be registered to the tournament.
+        The ranking of all the players is assigned with one statement and
+        one commit.
+
+        Args:
+          seed: (hashable) seed of the shuffle, the same seed with the same
+                players gives the same ranking. None for a random ranking
+          by_rating: (bool) the ranking is ordered by the precomputed RATING
+                     of the players instead of shuffling
         '''
-        if self._statusInit == False:            
-            query = 'SELECT PLAYER_ID FROM PLAYERS_TOURNAMENT \
-                     WHERE TOURNAMENT_ID=%s'
-            data = (self._tournament_id,)
-            result = self.conn_trnmt_db.dbQuery(query, data)
-            random.shuffle(result)  # Shuffle the list of players
-            query = 'UPDATE PLAYERS_TOURNAMENT SET RANK_INI=%s \
-                     WHERE PLAYER_ID=%s AND TOURNAMENT_ID=%s'
-            # Each player registers to the tournament, according to the list 
-            # randomly, it assigns a consecutive ranking since 1
-            j = 1
-            for x in result:
-                data = (j, x[0], self._tournament_id)
-                self.conn_trnmt_db.dbStatementCommit(query, data)
-                j += 1
+        if self._statusInit == False:
+            if by_rating:
+                self.conn_trnmt_db.setRankingByRating(self._tournament_id)
+            else:
+                # sorted ids, so the seeded shuffle is reproducible
+                result = self.conn_trnmt_db.tournamentPlayerIds(
+                    self._tournament_id)
+                random.Random(seed).shuffle(result)  # Shuffle the list of players
+                # Each player gets the consecutive ranking (since 1) of its
+                # position in the shuffled list
+                self.conn_trnmt_db.setRankingInit(self._tournament_id, result)
+            self._standings = None
             self._statusInit = True
             self._round = 1
 
+    @apiOperation
+    def setPlayerRatings(self, ratings):
+        ''' Stores the RATING of the players, the order of the initial
+            ranking by rating (see rankingInit)
+
+        Args:
+          ratings: (dict) player_id --> rating, None removes the rating
+        '''
+        self.conn_trnmt_db.setRatings(ratings)
+
+    @apiOperation
     def reportMatch(self, winner, loser, round_=None, date_match=None):
         '''Records the outcome of a single match between two players.
         This is an extended method of reportMatch to support multi-tournaments
@@ -121,26 +459,182 @@ class Tournament(object):
           winner:  the id number of the player who won
           loser:  the id number of the player who lost
         '''
-        query = 'INSERT INTO MATCHES (TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER,\
-                 LOSER) VALUES (%s,%s,%s,%s,%s);'
-        data = (self._tournament_id, round_, date_match, winner, loser, )
-        self.conn_trnmt_db._cursor.execute(query, data)
+        if self._journal is not None:
+            self._journal.append(self._tournament_id, round_, date_match,
+                                 winner, loser)
+        else:
+            self.conn_trnmt_db.insertMatch(self._tournament_id, round_,
+                                           date_match, winner, loser)
+        if self._match_history is not None:
+            self._match_history.add(pairing.pairKey(winner, loser))
+        self.updateStandings(winner, loser, round_)
+        if self._bracket is not None:
+            self._bracket.reportMatch(winner, loser)
+        self.resultsReported([(winner, loser)])
+
+    @apiOperation
+    def reportRound(self, results, round_=None, date_match=None):
+        '''Records the outcome of all the matches of a round in one statement.
+        The trigger of MATCHES updates the standings of the whole round with a
+        single upsert. As reportMatch, the commit statement is responsibility
+        of the designer outside the method
+
+        Args:
+          results: (iterable) tuples (winner, loser) with the players' ids,
+                   loser 0 is a round bye
+          round_: (int) the round's id
+          date_match: (datetime) the date of the matches
+        '''
+        results = list(results)
+        if not results:
+            return
+        if self._journal is not None:
+            for winner, loser in results:
+                self._journal.append(self._tournament_id, round_, date_match,
+                                     winner, loser)
+        else:
+            self.conn_trnmt_db.insertMatches(self._tournament_id, round_,
+                                             date_match, results)
+        if self._match_history is not None:
+            self._match_history.update(
+                pairing.pairKey(w, l) for w, l in results)
+        for winner, loser in results:
+            self.updateStandings(winner, loser, round_)
+            if self._bracket is not None:
+                self._bracket.reportMatch(winner, loser)
+        self.resultsReported(results)
+
+    @apiOperation
+    def submitMatch(self, winner, loser, round_, date_match=None):
+        '''Reports a match from one of many scorekeeper stations, see
+           submitRound
+
+        Returns:
+          True if the result was stored or corrected, False if the same
+          result was already reported
+        '''
+        return self.submitRound([(winner, loser)], round_, date_match) > 0
+
+    @apiOperation
+    def submitRound(self, results, round_, date_match=None):
+        '''Reports matches safely from many stations at once: a match is
+           identified by the round and the pair of players, so a report
+           repeated (a retry, two stations) is ignored and a report with
+           the other winner corrects the result. Unlike reportRound it
+           commits, in its own short transaction retried after a
+           serialization failure or a deadlock: the pending writes must be
+           committed first (commitTournament), ValueError otherwise
+
+        Args:
+          results: (iterable) tuples (winner, loser) with the players' ids,
+                   loser 0 is a round bye
+          round_: (int) the round's id, part of the key of the matches
+          date_match: (datetime) the date of the matches
+        Returns:
+          The number of results stored or corrected
+        '''
+        if round_ is None:
+            raise ValueError('The round is required, it identifies a match')
+        results = list(results)
+        if not results:
+            return 0
+        # the journaled results first, a later report corrects them
+        self.syncJournal()
+        rows = self.conn_trnmt_db.upsertMatches(self._tournament_id, round_,
+                                                date_match, results)
+        for winner, loser, inserted in rows:
+            if self._match_history is not None:
+                self._match_history.add(pairing.pairKey(winner, loser))
+            if inserted:
+                self.updateStandings(winner, loser, round_)
+            else:
+                # a corrected result, the standings are loaded again
+                self._standings = None
+                self._standings_sorted = None
+            if self._bracket is not None:
+                self._bracket.reportMatch(winner, loser)
+        self.resultsReported([row[:2] for row in rows])
+        return len(rows)
+
+    def resultsReported(self, results):
+        '''Closes the boards of the results reported, and lets the worker of
+           the precompute pair the next round ahead (Swiss.startPrecompute)
+
+        Args:
+          results: (list) tuples (winner, loser)
+        '''
+        if self._open_boards is not None:
+            self._open_boards.difference_update(
+                pairing.pairKey(w, l) for w, l in results)
+        if self._precompute is not None:
+            self.precomputeNext()
+
+    def updateStandings(self, winner, loser, round_):
+        '''Applies a match to the in-memory standings, with the same rules of
+           the trigger UPDATESTANDINGS of the database (see tournament.sql)
+
+        Args:
+          winner:  the id number of the player who won
+          loser:  the id number of the player who lost, 0 for a round bye
+          round_: (int) the round's id
+        '''
+        if self._standings is None or loser is None or loser < 0:
+            return
+        if not applyResult(self._standings, winner, loser, round_):
+            # a player not loaded yet, it will be read from the database
+            self._standings = None
+            return
+        self._standings_sorted = None
+
+    def invalidateCaches(self):
+        '''Drops the in-memory history and standings, they are loaded again
+           from the database the next time they're used
+        '''
+        self._match_history = None
+        self._standings = None
+        self._standings_sorted = None
+        self._cache_generation = self.conn_trnmt_db._generation
+        self._bracket = None
+
+    def checkCaches(self):
+        '''Drops the in-memory data if the tables were deleted through
+           TournamentDb (deleteMatches, deletePlayers)
+        '''
+        if self._cache_generation != self.conn_trnmt_db._generation:
+            self.invalidateCaches()
+
+    def syncJournal(self):
+        '''Waits until the results of the journal are in the storage, it's
+           done before reading the matches or the standings from it
+        '''
+        if self._journal is not None:
+            self._journal.drain()
+
+    def loadMatchHistory(self):
+        '''Loads in memory the pairs of opponents already matched
+
+        The history is a set of canonical pairs (see pairKey), it's loaded
+        once per round and kept up to date by reportMatch, in this way
+        previusMatch doesn't need a round trip to the database
+        '''
+        self.syncJournal()
+        result = self.conn_trnmt_db.matchPairs(self._tournament_id)
+        self._match_history = set(pairing.pairKey(w, l) for w, l in result)
 
     def checkAlreadyRegistered(self, name):
         '''Verifies if player already registered in the DB
 
+        The ids already found are kept in the cache of TournamentDb, so
+        the next lookups of the same name don't query the database
+
         Args:
             name: (string) the player's full name 
         returns:
             if exists returns the id of the player otherwise 0
         '''
-        query = 'SELECT PLAYER_ID FROM PLAYERS WHERE FULL_NAME=%s'
-        data = (name,)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        if result and result[0] > 0:
-            return result[0]
-        return 0
+        return self.conn_trnmt_db.findPlayer(name)
 
+    @apiOperation
     def playerStandings(self):
         '''Returns a list of the players and their win records, sorted by wins.
            It supports multi-tournaments and multip-players
@@ -154,19 +648,104 @@ class Tournament(object):
             wins: the number of matches the player has won
             matches: the number of matches the player has played
         '''
-        standings = list()
-        player_standings = collections.namedtuple(
-            'playerStandings', 'id, name, wins, matches')
-        query = 'SELECT PLAYER_ID,FULL_NAME, WINS,MATCHES FROM V_STANDINGS \
-                 WHERE TOURNAMENT_ID=%s'
-        data = (self._tournament_id,)
-        self.conn_trnmt_db._cursor.execute(query, data)
-        # Adds the result of standings to the collection
-        for rows in map(player_standings._make,
-                        self.conn_trnmt_db._cursor.fetchall()):
-            standings.append(rows)
-        return standings
+        self.checkCaches()
+        if self._standings is None:
+            self.loadStandings()
+        if self._standings_sorted is None:
+            self._standings_sorted = [
+                PlayerStandings._make(row[:4])
+                for row in sorted(self._standings.itervalues(),
+                                  key=standingsKey)]
+        return list(self._standings_sorted)
+
+    def streamStandings(self, fetch_size=FETCH_SIZE):
+        '''Yields the standings of the tournament as playerStandings, read
+           from the storage by blocks of fetch_size rows instead of the
+           in-memory standings, so the memory doesn't depend on the field
+        '''
+        self.syncJournal()
+        for row in self.conn_trnmt_db.streamStandings(self._tournament_id,
+                                                      fetch_size):
+            yield PlayerStandings._make(row[:4])
+
+    @apiOperation
+    def exportStandings(self, output, fmt='csv'):
+        '''Writes the standings of the tournament (STANDINGS_COLUMNS) to the
+           file output, sorted as playerStandings
+
+        Args:
+          output: (file) the file written
+          fmt: (string) one of EXPORT_FORMATS, CSV with header or JSON Lines
+        '''
+        checkExportFormat(fmt)
+        self.syncJournal()
+        self.conn_trnmt_db.exportStandings(self._tournament_id, output, fmt)
+
+    @apiOperation
+    def exportMatches(self, output, fmt='csv', round_=None):
+        '''Writes the matches of the tournament (MATCHES_COLUMNS) to the file
+           output, the ones of a round if round_ is given, see
+           exportStandings
+        '''
+        checkExportFormat(fmt)
+        self.syncJournal()
+        self.conn_trnmt_db.exportMatches(self._tournament_id, output, fmt,
+                                         round_)
+
+    @apiOperation
+    def exportPairings(self, pairings, output, fmt='csv'):
+        '''Writes the pairings of a round (PAIRINGS_COLUMNS), as returned by
+           swissPairings or siglePairingElimination, to the file output
+        '''
+        writeRows(pairings, PAIRINGS_COLUMNS, output, fmt)
+
+    def standingsTable(self):
+        '''Returns the standings as a player.PlayerTable, the input of the
+           pairing engines. It's built from the in-memory standings, sorted
+           as playerStandings, with the byes and points of each player
+        '''
+        self.checkCaches()
+        if self._standings is None:
+            self.loadStandings()
+        return player.PlayerTable(
+            row[:6] for row in sorted(self._standings.itervalues(),
+                                      key=standingsKey))
+
+    def loadStandings(self):
+        '''Loads (resync) the in-memory standings of the tournament
+
+        playerStandings is served from memory, reportMatch and reportRound
+        keep it up to date and a rollback drops it. This method reads it
+        again from the database, e.g. when other processes report matches
+        of the same tournament
+        '''
+        self.syncJournal()
+        result = self.conn_trnmt_db.standings(self._tournament_id)
+        self._standings = dict((row[0], list(row)) for row in result)
+        self._standings_sorted = None
+
+    @apiOperation
+    def checkStandings(self):
+        '''Verifies the in-memory standings against PLAYER_STANDINGS
 
+        Returns:
+          mismatches: (list) ids of the players whose wins, matches, byes or
+                      points are different in the database, empty if the
+                      standings are consistent
+        '''
+        self.checkCaches()
+        if self._standings is None:
+            return []
+        self.syncJournal()
+        stored = dict((row[0], tuple(row[1:])) for row in
+                      self.conn_trnmt_db.storedStandings(self._tournament_id))
+        mismatches = list()
+        for player_id, row in self._standings.iteritems():
+            if tuple(row[2:6]) != stored.get(player_id, (0, 0, None, None)):
+                mismatches.append(player_id)
+        return mismatches
+
+    @apiOperation
     def registerPlayer(self, name):
         '''Adds a player to the tournament database.
 
@@ -174,22 +753,33 @@ class Tournament(object):
         is handled by the SQL database schema using ID_PLAYER_SEQUENCE.)
         Args:
           name: the player's full name (need not be unique).
+        Returns:
+          player_id: (int) the id of the player, new or already registered
         '''
-        c = self.checkAlreadyRegistered(name)
-        if c > 0:
-            # If exist the player (name) only to update the last tournament
-            # that it's participating
-            query = 'UPDATE PLAYERS SET LAST_TRNMNT_RGSTRD=%s \
-                     WHERE PLAYER_ID=%s'
-            data = (self._tournament_id, c)
-            self.conn_trnmt_db.dbStatementCommit(query, data)
-        else:
-            # Register as new player in the database
-            query = '''INSERT INTO PLAYERS (PLAYER_ID, FULL_NAME, \
-            LAST_TRNMNT_RGSTRD) VALUES (nextval('id_player_sequence'),%s,%s);'''
-            data = (name, self._tournament_id)
-            self.conn_trnmt_db.dbStatementCommit(query, data)
+        player_id = self.conn_trnmt_db.registerPlayer(self._tournament_id, name)
+        self._standings = None
+        return player_id
+
+    @apiOperation
+    def registerPlayers(self, names):
+        '''Adds many players to the tournament database with a single commit.
+
+        The names already registered are resolved in one query, the new
+        players are inserted in one statement, and the trigger of PLAYERS
+        registers all of them to the tournament at once. The players already
+        registered to this tournament are skipped, and the ids are kept in
+        the cache of TournamentDb for the next lookups.
+        Args:
+          names: (iterable) the players' full names
+        Returns:
+          player_ids: (dict) the id of each name
+        '''
+        player_ids = self.conn_trnmt_db.registerPlayers(self._tournament_id,
+                                                        names)
+        self._standings = None
+        return player_ids
 
+    @apiOperation
     def previusMatch(self, player1, player2):
         '''Verify if the opponents have already matched
 
@@ -202,97 +792,120 @@ class Tournament(object):
           True in case if already exists a previous match
           False otherwise
         '''
-        matchedBoolean = False
-        query = 'SELECT COUNT(1)TOT FROM MATCHES WHERE TOURNAMENT_ID=%s \
-                AND WINNER IN(%s,%s) AND LOSER IN(%s,%s)'
-        data = (self._tournament_id, player1, player2, player1, player2)
-        self.conn_trnmt_db._cursor.execute(query,data)
-        result = self.conn_trnmt_db._cursor.fetchone()
-        if result[0] > 0:
-            matchedBoolean = True
-        return matchedBoolean    
+        self.checkCaches()
+        if self._match_history is None:
+            self.loadMatchHistory()
+        return pairing.pairKey(player1, player2) in self._match_history
 
+    @apiOperation
     def siglePairingElimination(self):
-        '''Create a sub-tournament with top 8 players to determine the winner
-        This sub-tournament has tree rounds based on the number of players (8)
-
+        '''Create a sub-tournament with top players to determine the winner
+        This sub-tournament has log2(N) rounds for a cut of N players (3
+        rounds for the top 8)
+
+        The bracket is built in memory from the seeding of RANK_FIN at the
+        first round, reportMatch advances the winners, so the next rounds
+        don't query the matches. The bracket is saved once per round in
+        TOURNAMENT.BRACKET
         Returns
           pairings: (list) for each round returns a list of pairings 
                     for the match
         '''
-        pairings = list()
         if self._total_rounds+1 == self._round:
-            query = 'SELECT PLAYER_ID, FULL_NAME FROM V_STANDINGS \
-            WHERE TOURNAMENT_ID=%s AND RANK_FIN >0 AND RANK_FIN<=8 \
-            ORDER BY RANK_FIN'
-            data = (self._tournament_id,)
-        else:
-            query = 'SELECT C.PLAYER_ID, C.FULL_NAME \
-                FROM MATCHES A, PLAYERS_TOURNAMENT B, V_STANDINGS C \
-                WHERE A.WINNER=B.PLAYER_ID AND B.PLAYER_ID=C.PLAYER_ID \
-                AND A.ROUND=%s AND B.RANK_FIN >0 AND B.RANK_FIN<=8 \
-                AND A.TOURNAMENT_ID=B.TOURNAMENT_ID \
-                AND B.TOURNAMENT_ID=C.TOURNAMENT_ID \
-                AND B.TOURNAMENT_ID=%s ORDER BY B.RANK_FIN'
-            data = (self._round-1, self._tournament_id)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        len_res = len(result)
-        group_a, group_b = result[:len_res/2], result[len_res/2:]
-        revers = reversed(group_b)
-        for i in group_a:
-            j = next(revers)
-            pairings.append((i[0], i[1], j[0], j[1]))
+            result = self.conn_trnmt_db.cutPlayers(self._tournament_id,
+                                                   self._top_players)
+            self._bracket = bracket.Bracket(result)
+        elif self._bracket is None:
+            self.loadBracket()
+        pairings = self._bracket.pairings()
+        self.saveBracket()
         self._round += 1
 
         return pairings
 
+    @apiOperation
+    def saveBracket(self):
+        '''Stores the bracket in the table TOURNAMENT, one write and commit'''
+
+        self.conn_trnmt_db.saveBracket(self._tournament_id,
+                                       self._bracket.toJson())
+
+    @apiOperation
+    def loadBracket(self):
+        '''Loads the bracket saved by saveBracket, the matches reported after
+           the last save must be reported again
+        '''
+        document = self.conn_trnmt_db.loadBracket(self._tournament_id)
+        if document is None:
+            raise ValueError('The tournament %s has no bracket, the top players'
+                             ' must be defined first' % self._tournament_id)
+        self._bracket = bracket.Bracket.fromJson(document)
+
+    @apiOperation
     def setWinnerTournament(self):
         ''' Update the winner and second place of the tournament in the DB
 
         After finished the single-elimination-tournament should be invoke this
         method to update in the table Tournament the winner and second place. 
         It uses xml data to store values (player_id,full_name), this might be
-        useful for future use in a web page
-
-        '''
-        xmlTemplate = """<root><player><id>%(player_id)s</id> \
-                        <name>%(full_name)s</name></player></root>"""
-        query = '''SELECT 'player_id' AS ID,WINNER ,'full_name' AS NAME, \
-                FULL_NAME FROM MATCHES A, PLAYERS B \
-                WHERE TOURNAMENT_ID=%s AND WINNER=PLAYER_ID AND ROUND=%s'''
-        data = (self._tournament_id, self._total_rounds+self._rounds_single)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        for i in result:
-            result = list(i)
-        it = iter(result)
-        winner = xmlTemplate % dict(zip(it, it))
-        query = '''SELECT 'player_id' AS ID,loser ,'full_name' AS NAME, \
-                FULL_NAME FROM MATCHES A, PLAYERS B \
-                WHERE TOURNAMENT_ID=%s AND LOSER=PLAYER_ID AND ROUND=%s'''
-        data = (self._tournament_id, self._total_rounds+self._rounds_single)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        for i in result:
-            result = list(i)
-        it = iter(result)
-        second_place = xmlTemplate % dict(zip(it, it))
-        query = 'UPDATE TOURNAMENT SET WINNER=%s, SECOND_PLACE=%s \
-                     WHERE TOURNAMENT_ID=%s'
-        data = (winner, second_place, self._tournament_id)
-        self.conn_trnmt_db.dbStatementCommit(query, data)
-        root = ET.fromstring(winner)
-        for elem in root.findall('player'):
-            name_winner = elem.find('name').text
+        useful for future use in a web page. The finalists come from the
+        bracket, the final bracket is saved with the same statement
+
+        '''
+        xmlTemplate = """<root><player><id>%s</id> \
+                        <name>%s</name></player></root>"""
+        if self._bracket is None:
+            self.loadBracket()
+        if not self._bracket.finished():
+            raise ValueError('The single-elimination tournament is not over')
+        id_winner, name_winner = self._bracket.winner()
+        winner = xmlTemplate % (id_winner, escape(name_winner))
+        id_second, name_second = self._bracket.secondPlace()
+        second_place = xmlTemplate % (id_second, escape(name_second))
+        self.conn_trnmt_db.setWinner(self._tournament_id, winner, second_place,
+                                     self._bracket.toJson())
         print 'THE WINNER OF THE TOURNAMENT IS [', name_winner, ']'
         print '\n'
 
+    @apiOperation
+    def purgeTournament(self, trnmnt_id=None):
+        '''Removes a tournament from the database (by default this one): its
+           partitions of MATCHES and PLAYER_STANDINGS are dropped, not
+           deleted row by row
+
+        Args:
+          trnmnt_id: (int) the id of the tournament
+        '''
+        self.syncJournal()
+        self.conn_trnmt_db.purgeTournament(trnmnt_id or self._tournament_id)
+
+    @apiOperation
+    def archiveTournament(self, trnmnt_id=None):
+        '''Archives a finished tournament (by default this one): its
+           partitions of MATCHES and PLAYER_STANDINGS are detached to the
+           schema ARCHIVE, the tournament and its ranking are kept
+
+        Args:
+          trnmnt_id: (int) the id of the tournament
+        '''
+        self.syncJournal()
+        self.conn_trnmt_db.archiveTournament(trnmnt_id or self._tournament_id)
+
     def closeTournament(self):
         self.conn_trnmt_db.closeConnect()
 
+    @apiOperation
     def commitTournament(self):
         self.conn_trnmt_db.commit()
+        if self._journal is not None:
+            self._journal.sync()
 
+    @apiOperation
     def rolllbackTournament(self):
         self.conn_trnmt_db.rollback()
+        # the matches not committed are gone, the history and standings
+        # must be loaded again
+        self.invalidateCaches()
 
 
 class Swiss(Tournament):
@@ -302,14 +915,160 @@ class Swiss(Tournament):
         in case of odd participants, and a method to break tied stands
     '''
 
-    def __init__(self):
+    def __init__(self, pairing_engine='blossom', dsn=DSN, pool_size=POOL_SIZE,
+                 storage=None, journal=None):
+        ''' inicialize the tournament with the engine used by swissPairings
+
+        Args:
+          pairing_engine: 'blossom' (default) pairs the whole round as a
+                          maximum weight matching, 'random' uses the original
+                          heuristic of random opponents, otherwise an object
+                          with the method pairRound (see pairing.py)
+          dsn, pool_size, storage, journal: the storage settings, see
+                                            Tournament
+        '''
         self.statusConnect = False
-        Tournament.__init__(self)
+        Tournament.__init__(self, dsn, pool_size, storage, journal)
+        if pairing_engine == 'blossom':
+            pairing_engine = pairing.BlossomPairing()
+        self._pairing_engine = pairing_engine
+        self._tie_breaks = ('OPP_POINTS', 'POINTS')
 
+    @apiOperation
     def swissPairings(self):
         '''Returns a list of pairs of players for the next round of a match.
            It supports multip-players and multi-tournaments
 
+        The pairings are computed by the engine of the tournament, if the
+        number of players is odd, the remaining player gets a round bye.
+
+        Returns:
+          A list of tuples, each of which contains (id1, name1, id2, name2)
+            id1: the first player's unique id
+            name1: the first player's name
+            id2: the second player's unique id
+            name2: the second player's name
+        '''
+        if self._pairing_engine == 'random':
+            return self.randomPairings()
+        snapshot = self.pairingSnapshot()
+        result = None
+        if self._precompute is not None:
+            # the pairings of the worker are used if they were computed from
+            # the same state, e.g. the outcome of the last board speculated
+            result = self._precompute.lookup(snapshot)
+        if result is None:
+            result = pairSnapshot(self._pairing_engine, snapshot)
+        return self.commitPairings(result)
+
+    @apiOperation
+    def pairingSnapshot(self):
+        '''Returns the state paired by pairSnapshot for the next round, a
+           PairingSnapshot with copies of the in-memory standings and match
+           history. The history is loaded again (after the journal) once per
+           round, see memorySnapshot
+        '''
+        self.checkCaches()
+        if self._standings is None:
+            self.loadStandings()
+        self.loadMatchHistory()
+        return self.memorySnapshot()
+
+    def memorySnapshot(self):
+        '''Returns the PairingSnapshot of the in-memory standings and match
+           history as they are, kept up to date by the reports: nothing is
+           read from the storage nor waited from the journal. The players
+           with a bye come from the history (the pairs with 0)
+
+        Returns:
+          A PairingSnapshot, None if the standings or the history are not
+          loaded (e.g. after a corrected result or a rollback)
+        '''
+        if self._standings is None or self._match_history is None:
+            return None
+        history = frozenset(self._match_history)
+        return PairingSnapshot(
+            self._round,
+            dict((k, list(v)) for k, v in self._standings.iteritems()),
+            history, frozenset(b for a, b in history if a == 0),
+            self._round <= self._accelerated_rounds)
+
+    @apiOperation
+    def commitPairings(self, result):
+        '''Applies the pairings of a round computed by pairSnapshot: the
+           round bye is reported and the tournament moves to the next round
+
+        Args:
+          result: (RoundPairings) the pairings of the current round
+        Returns:
+          The pairings, a list of tuples (id1, name1, id2, name2)
+        '''
+        if result.round != self._round:
+            raise ValueError('The pairings of round %s are stale, the next '
+                             'round is %s' % (result.round, self._round))
+        self._open_boards = None
+        if result.bye is not None:
+            print 'Player with round bye'
+            print result.bye
+            self.roundBye(result.bye[0], self._round)
+        self._open_boards = set(pairing.pairKey(p[0], p[2])
+                                for p in result.pairings)
+        self._round += 1
+        return list(result.pairings)
+
+    def startPrecompute(self):
+        '''Starts a worker thread that pairs the next round while the
+           results come in: provisional pairings after each result and, when
+           one board is left, the pairings of both of its outcomes, so
+           swissPairings returns at once when the last board reports. The
+           pairing engine must be reentrant
+        '''
+        if self._pairing_engine == 'random':
+            raise ValueError('The random pairings are not precomputed')
+        if self._precompute is None:
+            self._precompute = PairingPrecompute(self._pairing_engine)
+            self._precompute.start()
+
+    def stopPrecompute(self):
+        if self._precompute is not None:
+            self._precompute.close()
+            self._precompute = None
+
+    def precomputeNext(self):
+        '''Gives the worker the snapshots of the next round, called after
+           each result. The provisional pairings are skipped while the
+           worker is busy, the latest result makes the next ones
+        '''
+        if self._open_boards is None or self._round > self._total_rounds:
+            return
+        if len(self._open_boards) > 1 and self._precompute.busy():
+            return
+        # the result just reported is in the in-memory state, the reporting
+        # thread doesn't read the history again nor drain the journal. The
+        # dropped caches are loaded by the next swissPairings
+        self.checkCaches()
+        snapshot = self.memorySnapshot()
+        if snapshot is None:
+            return
+        if len(self._open_boards) == 1:
+            (id1, id2), = self._open_boards
+            round_ = self._round - 1
+            snapshots = [speculateResult(snapshot, id1, id2, round_),
+                         speculateResult(snapshot, id2, id1, round_)]
+        else:
+            snapshots = [snapshot]
+        self._precompute.submit(snapshots)
+
+    def acceleratedPlayers(self, players):
+        '''The players with the virtual wins of the accelerated rounds, see
+           acceleratePlayers
+        '''
+        return acceleratePlayers(players, self._standings)
+
+    def randomPairings(self):
+        '''Returns a list of pairs of players for the next round of a match.
+           It's the original heuristic, it picks the opponents randomly
+
         Assuming that there are an even number of players registered, each player
         appears exactly once in the pairings.  Each player is paired with another
         player with an equal or nearly-equal win record, that is, a player adjacent
@@ -327,23 +1086,26 @@ class Swiss(Tournament):
         prev_last_player = None
         bck_last_player = list()
         players_bye = list()
-        query_stands = self.playerStandings()
-        # Convert the list (query_stands) into dictionary and create the pairs for the
-        # next round randomly; it takes WINS as key. If there are an odd number,
-        # assigns the last player of dictionary to a round bye.
+        players = self.standingsTable()
+        self.loadMatchHistory()
+        # Convert the score groups of the standings into dictionary and create
+        # the pairs for the next round randomly; it takes WINS as key. If
+        # there are an odd number, assigns the last player of dictionary to a
+        # round bye.
         # Make match with priority (player-round_bye), avoids to pair players
         # again
         v_stndgs = collections.defaultdict(list)
-        for i, n, w, m in query_stands:
-            # win-->key,(player object)-->item-info
-            v_stndgs[w].append(player.Player(w, i, n, m))
+        for w, start, end in players.scoreGroups():
+            # win-->key,(player objects)-->item-info
+            v_stndgs[w] = players[start:end]
         max_len_stnds = len(v_stndgs)
         count_keys = 1
         print '*****    Standings   *****'
         print ('ID\tNAME\t\tWINS')
         print ('---------------------------')
         players_bye = self.getPlayersBye(self._tournament_id)
-        for k in v_stndgs.iterkeys():
+        # the score groups from the lowest to the highest wins
+        for k in sorted(v_stndgs):
             for w in v_stndgs[k]:
                 print w.getPlayerId(), '\t', w.getName()[:13], '\t', w.getWins()
             pairings_tmp = list()
@@ -364,7 +1126,8 @@ class Swiss(Tournament):
                         print 'Player with round bye'
                         print (actual_player.getPlayerId(),
                                actual_player.getName())
-                        self.roundBye(actual_player, self._round)
+                        self.roundBye(actual_player.getPlayerId(),
+                                      self._round)
                     else:
                         # make pairing last player of previous key with the
                         # last one of dict
@@ -485,7 +1248,7 @@ class Swiss(Tournament):
             match_with_bye = True
         return val_rndm, match_with_bye
 
-    def roundBye(self, player, round_):
+    def roundBye(self, player_id, round_):
         ''' Sets up a player-round-bye when there are an odd number of players
 
         When the number of participants is not an even number, according to 
@@ -493,13 +1256,13 @@ class Swiss(Tournament):
         the player remaining receives a bye, equaling one match win.
 
         Args:
-          id_player: (int) the player's unique id
+          player_id: (int) the player's unique id
           round_: (int) the round's id
         '''
         current_date = datetime.datetime.now()
         current_date = current_date.replace(microsecond=0)
         loser = 0
-        self.reportMatch(player.getPlayerId(), loser, round_, current_date)
+        self.reportMatch(player_id, loser, round_, current_date)
 
     def getPlayersBye(self, list_):
         '''Verify if there's a player who had a round bye to be paired
@@ -512,12 +1275,7 @@ class Swiss(Tournament):
         Returns:
           Index_list: (int) The index in the list if found a player-bye
         '''
-        query = 'SELECT WINNER FROM MATCHES where LOSER=0 and \
-                TOURNAMENT_ID=%s ORDER BY ROUND DESC'
-        data = (self._tournament_id,)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-
-        return result
+        return self.conn_trnmt_db.byePlayers(self._tournament_id)
 
     def checkPlayersBye(self, list_current, list_byes):
         index_list = -1
@@ -531,133 +1289,596 @@ class Swiss(Tournament):
                 idx += 1
         return index_list
 
-    def tieBreakRule(self, wins_select, sum_wins):
-        ''' Select players who are tied with same score, using tie-break rule
-
-        In cases where players have same score at the end of the swiss
-        tournament, this uses best points-oponents rule to break players
-        that are tied
-        Args:
-          wins_select: (list) a list of group of wins with final standings
-          sum_wins: (int) the number of wins that produce tied players
-        '''
-        # complex query statement to get opponents points of players with same
-        # wins. It selects the necessary players with highest points opponents
-        # to complete The top 8 ( check the last part of statement LIMIT %s)
-        # the second level to break tied players is players points
-        query = 'SELECT PLAYER_TIED,FULL_NAME, SUM(POINTS_OP)TOT_POINTS_OP FROM (\
-            SELECT WINNER AS PLAYER_TIED,SUM(POINTS)AS POINTS_OP \
-            FROM PLAYER_STANDINGS A, MATCHES B\
-            WHERE WINNER IN(SELECT PLAYER_ID FROM PLAYER_STANDINGS \
-            WHERE WINS=%s AND TOURNAMENT_ID=A.TOURNAMENT_ID ORDER BY POINTS DESC) \
-            AND A.PLAYER_ID=B.LOSER AND A.TOURNAMENT_ID=B.TOURNAMENT_ID \
-            AND A.TOURNAMENT_ID=%s GROUP BY WINNER,PLAYER_ID \
-            UNION ALL \
-            SELECT LOSER,SUM(POINTS) FROM PLAYER_STANDINGS A, \
-            MATCHES B \
-            WHERE LOSER IN(SELECT PLAYER_ID FROM PLAYER_STANDINGS \
-            WHERE WINS=%s AND TOURNAMENT_ID=A.TOURNAMENT_ID ORDER BY POINTS DESC) \
-            AND A.PLAYER_ID=B.WINNER AND A.TOURNAMENT_ID=B.TOURNAMENT_ID \
-            AND A.TOURNAMENT_ID=%s GROUP BY LOSER,PLAYER_ID ORDER BY 1) C, \
-            PLAYERS D WHERE C.PLAYER_TIED=D.PLAYER_ID \
-            GROUP BY C.PLAYER_TIED,D.FULL_NAME ORDER BY TOT_POINTS_OP DESC LIMIT %s'
-        limit_ = self._top_players-int(sum_wins) # the rest of players necessary to complete the top
-        data = (wins_select[0], self._tournament_id, wins_select[0],
-                self._tournament_id, limit_)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        return result
+    def setTieBreaks(self, tie_breaks):
+        ''' Defines the order of the tie-break rules to rank tied players
 
-    def topEightPlayers(self):
-        ''' Determines the top 8 players after finished the swiss Tournament
+        Args:
+          tie_breaks: (list) columns of PLAYER_STANDINGS from TIE_BREAKS,
+                      e.g. ('BUCHHOLZ', 'SONNEBORN_BERGER', 'POINTS')
+        '''
+        for rule in tie_breaks:
+            if rule not in TIE_BREAKS:
+                raise ValueError('Unknown tie-break rule %s, use one of %s'
+                                 % (rule, ', '.join(TIE_BREAKS)))
+        self._tie_breaks = tuple(tie_breaks)
+
+    @apiOperation
+    def updateTieBreaks(self):
+        ''' Updates the tie-break columns of the standings of the tournament
+
+        The function UPDATETIEBREAKS (see tournament.sql) computes all of them
+        with a single statement from the matches reported. The pairings don't
+        read them, so it's only executed where they're read: finalRanking and
+        topPlayers, which commit it with their read. As reportMatch, the
+        commit is responsibility of the caller
+        '''
+        self.syncJournal()
+        self.conn_trnmt_db.updateTieBreaks(self._tournament_id)
 
-        It considers players' points to stablish the ranking. 
-        This method calls tie-break-rule to select players who are tied wit 
-        same score. 
+    @apiOperation
+    def finalRanking(self):
+        ''' Returns the ranking of all the players of the tournament, sorted
+            by wins and the tie-break rules, with a single indexed read
+
+        The tie-breaks are updated and read in a short transaction, it's
+        committed after the read so the update doesn't keep the standings
+        locked.
         Returns:
-          final_players: list() The list of 8 players with best standings
-        '''
-        query = 'SELECT WINS, COUNT(1) AS TOT FROM \
-                (SELECT WINS FROM V_STANDINGS WHERE TOURNAMENT_ID=%s \
-                ORDER BY WINS DESC, POINTS DESC) A \
-                GROUP BY WINS ORDER BY WINS DESC'
-        data = (self._tournament_id,)
-        result = self.conn_trnmt_db.dbQuery(query, data)
-        sum_wins = 0
-        sum_aux = 0
-        final_players = list()        
-        tie_break=False
-        for rows in result:
-            sum_wins = sum_wins+rows[1]
-            if sum_wins <= self._top_players:
-                final_players.append(
-                    self.conn_trnmt_db.getFinalPlayers(
-                        self._tournament_id, rows[0]))
-                sum_aux = sum_wins
-            else:
-                final_players.append(self.tieBreakRule(rows, sum_aux))                    
-                break
-        query = 'UPDATE PLAYERS_TOURNAMENT SET RANK_FIN=%s WHERE PLAYER_ID=%s \
-                AND TOURNAMENT_ID=%s'
-        z = 1
-        for x in final_players:
-            for y in x:
-                data = (z, y[0], self._tournament_id)
-                result = self.conn_trnmt_db._cursor.execute(query, data)
-                z += 1
+          A list of tuples (id, name, wins, tie-break values...) with a value
+          for each tie-break rule of the tournament
+        '''
+        self.updateTieBreaks()
+        ranking = self.conn_trnmt_db.finalRanking(self._tournament_id,
+                                                  self._tie_breaks)
+        self.conn_trnmt_db.commit()
+        return ranking
+
+    @apiOperation
+    def topPlayers(self, top_players=None):
+        ''' Determines the top N players after finished the swiss Tournament
+
+        The cut is computed by one statement: the players are numbered with
+        ROW_NUMBER() over wins and the tie-break rules of the tournament, and
+        RANK_FIN is written for the whole field with the same UPDATE (0 for
+        the players out of the cut). Only one commit is done.
+        Args:
+          top_players: (int) the size of the cut, a power of 2 (4, 8, 16,
+                       32, 64...). By default the one of the tournament, see
+                       setTopPlayers
+        Returns:
+          final_players: list() The list of N players with best standings,
+                         grouped by wins: [[(id, name), ...], ...]
+        '''
+        if top_players is not None:
+            self.setTopPlayers(top_players)
+        self.updateTieBreaks()
+        result = sorted(self.conn_trnmt_db.cutTopPlayers(
+            self._tournament_id, self._tie_breaks, self._top_players))
         self.conn_trnmt_db.commit()
+        final_players = [[(row[2], row[3]) for row in group] for wins, group
+                         in itertools.groupby(result, lambda row: row[1])]
         return final_players
 
+    @apiOperation
+    def topEightPlayers(self):
+        ''' Determines the top players after finished the swiss Tournament,
+            the cut of the tournament (8, or 4 for less than 8 players), see
+            topPlayers
+        '''
+        return self.topPlayers()
+
+
+class TournamentStorage(object):
+
+    ''' Interface of the storage of a tournament, Tournament and Swiss only
+        use these operations. TournamentDb implements them on PostgreSQL
+        (tournament.sql) and tournament_memory.MemoryTournamentDb in memory.
+
+        The writes are done inside a transaction that is finished by commit
+        or rollback, the methods documented with "commit" finish it
+        themselves. The attribute _generation must be incremented when the
+        players or the matches are deleted, see Tournament.checkCaches
+    '''
+
+    _generation = 0
 
-class TournamentDb(object):
+    def connect(self):
+        raise NotImplementedError
+
+    def closeConnect(self):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def rollback(self):
+        raise NotImplementedError
+
+    def roundTrips(self):
+        '''Returns the number of round trips to the database'''
+        raise NotImplementedError
+
+    def deleteMatches(self):
+        '''Remove all the match records (commit)'''
+        raise NotImplementedError
+
+    def deletePlayers(self):
+        '''Remove all the player records (commit)'''
+        raise NotImplementedError
+
+    def purgeTournament(self, trnmnt_id):
+        '''Removes a tournament with its players' registrations, matches and
+           standings (commit)
+        '''
+        raise NotImplementedError
+
+    def archiveTournament(self, trnmnt_id):
+        '''Moves the matches and the standings of a finished tournament out
+           of the tables of the active tournaments (commit)
+        '''
+        raise NotImplementedError
+
+    def countPlayers(self):
+        '''Returns the number of players currently registered'''
+        raise NotImplementedError
+
+    def tournamentExists(self, trnmnt_id):
+        raise NotImplementedError
+
+    def nextTournamentId(self):
+        '''Returns a new id of tournament from the sequence'''
+        raise NotImplementedError
+
+    def insertTournament(self, settings):
+        '''Stores a tournament (commit), see Tournament.setTournamentInfo
+
+        Args:
+          settings: (list) [id, name, place, date_start, date_end,
+                    number of participants]
+        '''
+        raise NotImplementedError
+
+    def tournamentState(self, trnmnt_id):
+        '''Returns the state of a tournament to resume it, in one round trip,
+           None if the tournament doesn't exist
+
+        Returns:
+          A dict with participants (int), bracket (JSON document or None),
+          standings (rows as standings) and matches (rows (round, winner,
+          loser), in the order of the rounds)
+        '''
+        raise NotImplementedError
+
+    def findPlayer(self, name):
+        '''Returns the id of the player with the full name, 0 if it's not
+           registered
+        '''
+        raise NotImplementedError
+
+    def registerPlayer(self, trnmnt_id, name):
+        '''Registers the player to the tournament, it's created if the name
+           doesn't exist (commit). Returns the id of the player
+        '''
+        raise NotImplementedError
+
+    def registerPlayers(self, trnmnt_id, names):
+        '''Registers many players to the tournament, the players already
+           registered to it are skipped (commit)
+
+        Returns:
+          player_ids: (dict) the id of each name
+        '''
+        raise NotImplementedError
+
+    def tournamentPlayerIds(self, trnmnt_id):
+        '''Returns the ids of the players of the tournament, sorted'''
+        raise NotImplementedError
+
+    def setRankingInit(self, trnmnt_id, player_ids):
+        '''The initial ranking is the position (since 1) of each player in
+           player_ids (commit)
+        '''
+        raise NotImplementedError
+
+    def setRatings(self, ratings):
+        '''Stores the ratings (dict player_id --> rating) of the players
+           (commit)
+        '''
+        raise NotImplementedError
+
+    def setRankingByRating(self, trnmnt_id):
+        '''The initial ranking is the order by rating of the players, the
+           ones without rating last by id (commit)
+        '''
+        raise NotImplementedError
+
+    def insertMatch(self, trnmnt_id, round_, date_match, winner, loser):
+        '''Stores a match and updates the standings of both players with the
+           rules of UPDATESTANDINGS (tournament.sql), loser 0 is a round bye
+        '''
+        raise NotImplementedError
+
+    def insertMatches(self, trnmnt_id, round_, date_match, results,
+                      skip_stored=False):
+        '''Stores the matches (winner, loser) of a round, see insertMatch.
+           A match of a pair already stored in the round breaks the unique
+           index MATCHES_IDX02, with skip_stored it's skipped instead
+        '''
+        raise NotImplementedError
+
+    def upsertMatches(self, trnmnt_id, round_, date_match, results):
+        '''Stores the matches (winner, loser) of a round by their natural key
+           (round and pair of players) in its own transaction (commit). A
+           match already stored with the same winner is skipped, with the
+           other winner the result and the standings are corrected. It
+           raises ValueError if a transaction is open, it isn't committed
+           on behalf of the caller
+
+        Returns:
+          The rows (winner, loser, inserted) of the matches stored,
+          inserted is False for the corrected ones
+        '''
+        raise NotImplementedError
+
+    def journalWatermark(self, journal_id):
+        '''Returns the last record of the journal written to the matches, 0
+           for a new journal (see journal.MatchJournal)
+        '''
+        raise NotImplementedError
+
+    def setJournalWatermark(self, journal_id, seq):
+        '''Moves the watermark of the journal, inside the transaction of the
+           matches of its records
+        '''
+        raise NotImplementedError
+
+    def matchPairs(self, trnmnt_id):
+        '''Returns the (winner, loser) of all the matches of the tournament'''
+        raise NotImplementedError
+
+    def byePlayers(self, trnmnt_id):
+        '''Returns the rows (player_id,) of the round byes, the last first'''
+        raise NotImplementedError
+
+    def standings(self, trnmnt_id):
+        '''Returns the rows (id, name, wins, matches, byes, points, rank_ini)
+           of the players of the tournament, in the order of F_STANDINGS
+        '''
+        raise NotImplementedError
+
+    def storedStandings(self, trnmnt_id):
+        '''Returns the rows (id, wins, matches, byes, points) of the players
+           with matches
+        '''
+        raise NotImplementedError
+
+    def streamStandings(self, trnmnt_id, fetch_size):
+        '''Yields the rows of standings, reading fetch_size rows at once'''
+        raise NotImplementedError
+
+    def streamMatches(self, trnmnt_id, fetch_size):
+        '''Yields the rows (tournament_id, round, date_match, winner, loser)
+           of the matches of a tournament, of all of them if trnmnt_id is
+           None, reading fetch_size rows at once
+        '''
+        raise NotImplementedError
+
+    def exportStandings(self, trnmnt_id, output, fmt):
+        '''Writes the rows of STANDINGS_COLUMNS of a tournament to the file
+           output, in the order of F_STANDINGS (see writeRows)
+        '''
+        raise NotImplementedError
+
+    def exportMatches(self, trnmnt_id, output, fmt, round_=None):
+        '''Writes the rows of MATCHES_COLUMNS of a tournament, or of all of
+           them if trnmnt_id is None, to the file output
+        '''
+        raise NotImplementedError
+
+    def updateTieBreaks(self, trnmnt_id):
+        '''Updates the tie-breaks (TIE_BREAKS) of the players, with the rules
+           of UPDATETIEBREAKS (tournament.sql)
+        '''
+        raise NotImplementedError
+
+    def finalRanking(self, trnmnt_id, tie_breaks):
+        '''Returns the rows (id, name, wins, tie-break values...) of the
+           players with matches, sorted by wins and the tie_breaks
+        '''
+        raise NotImplementedError
+
+    def cutTopPlayers(self, trnmnt_id, tie_breaks, top_players):
+        '''Numbers the players by wins, tie_breaks and initial ranking, and
+           sets RANK_FIN of the first top_players (0 for the rest)
+
+        Returns:
+          The rows (rank_fin, wins, id, name) of the players of the cut
+        '''
+        raise NotImplementedError
+
+    def cutPlayers(self, trnmnt_id, top_players):
+        '''Returns the rows (id, name) of the players of the cut, sorted by
+           RANK_FIN
+        '''
+        raise NotImplementedError
+
+    def saveBracket(self, trnmnt_id, document):
+        '''Stores the JSON document of the bracket (commit)'''
+        raise NotImplementedError
+
+    def loadBracket(self, trnmnt_id):
+        '''Returns the JSON document of the bracket, None if there isn't'''
+        raise NotImplementedError
+
+    def setWinner(self, trnmnt_id, winner, second_place, document):
+        '''Stores the winner and second place (xml) and the final bracket
+           (commit)
+        '''
+        raise NotImplementedError
+
+
+class TournamentDb(TournamentStorage):
 
     ''' Class object that implements the logic to work with database Tournament
         It contains methods to connect with, querys, and some useful operations
         on the database.
     '''
 
-    def __init__(self):
+    def __init__(self, dsn=DSN, pool_size=POOL_SIZE):
+        ''' inicialize the access to the database, the connections come
+            from a pool shared by all the instances with the same dsn
+
+        Args:
+          dsn: (string) the connection string of the database
+          pool_size: (int) the maximum number of connections of the pool
+        '''
         self.statusConnect = False
-        self._connection = None
-        self._cursor = None
+        self._dsn = dsn
+        self._pool_size = pool_size
+        self._pool = None
+        self._connection = None  # connection kept while a transaction is open
+        self._lock = threading.RLock()
+        self._player_ids = dict()  # cache of full_name --> player_id
+        self._generation = 0  # incremented when the tables are deleted
+        self._round_trips = 0  # statements, commits and rollbacks sent
+        self._stats = None  # QueryStats when the instrumentation is enabled
+        self._streams = 0  # named cursors opened, see dbStream
+        self._prepared = True  # hot statements with EXECUTE, see dbPrepared
 
     def connect(self):
-        '''Connect to the PostgreSQL database.Returns a database connection'''
+        '''Gets the pool of connections to the PostgreSQL database'''
 
-        connection = psycopg2.connect(
-            'dbname=tournament')
-        self._connection = connection
-        self._cursor = connection.cursor()
+        self._pool = ConnectionPool.getPool(self._dsn, self._pool_size)
         self.statusConnect = True
         print ('connection to DB is open')
 
-    def dbQuery(self, query, data=None):
+    @contextlib.contextmanager
+    def cursor(self, keep=False):
+        '''Yields a cursor scoped to one operation
+
+        The connection comes from the pool and it's given back after the
+        operation, unless a transaction is open: in that case the same
+        connection is used until commit or rollback.
+        Args:
+          keep: (bool) the operation writes without commit, the connection
+                is kept by this instance until commit or rollback
+        '''
+        with self._lock:
+            connection = self._connection
+            if connection is None:
+                connection = self._pool.getconn()
+            cursor = connection.cursor()
+            self._round_trips += 1
+            try:
+                yield cursor
+            except Exception:
+                if self._connection is None:
+                    self._pool.putconn(connection)
+                raise
+            finally:
+                cursor.close()
+            if keep:
+                if self._connection is None:
+                    # the transaction lasts until the caller commits, it
+                    # doesn't hold a slot of the pool meanwhile
+                    self._pool.keepconn(connection)
+                self._connection = connection
+            elif self._connection is None:
+                self._pool.putconn(connection)
+
+    def execute(self, cursor, query, data=None):
+        '''Executes a statement in the cursor, it's recorded if the
+           instrumentation is enabled (see enableStats)
+        '''
+        if self._stats is None:
+            if data:
+                cursor.execute(query, data)
+            else:
+                cursor.execute(query)
+            return
+        start_time = time.time()
         if data:
-            self._cursor.execute(query, data)
-            r = self._cursor.fetchall()
+            cursor.execute(query, data)
         else:
-            self._cursor.execute(query)
-            r = self._cursor.fetchall()
+            cursor.execute(query)
+        self._stats.recordStatement(query, time.time() - start_time,
+                                    cursor.rowcount)
+
+    def dbQuery(self, query, data=None):
+        with self.cursor() as cursor:
+            self.execute(cursor, query, data)
+            r = cursor.fetchall()
+        return r
+
+    def dbQueryOne(self, query, data=None):
+        with self.cursor() as cursor:
+            self.execute(cursor, query, data)
+            r = cursor.fetchone()
+        return r
+
+    def dbPrepared(self, name, data, keep=False):
+        '''Runs a statement of PREPARED_STATEMENTS, it's prepared the first
+           time it runs in each connection of the pool and then it's only
+           executed, without parsing and planning it again
+
+        Args:
+          name: (string) the name of the statement
+          data: (tuple) the parameters
+          keep: (bool) the statement writes, the transaction is kept open
+                as dbExecute
+        Returns:
+          The rows of the statement if any, otherwise None
+        '''
+        types, query = PREPARED_STATEMENTS[name]
+        if not self._prepared:
+            # the same statement sent as text, e.g. to compare them
+            query = textStatement(name)
+            with self.cursor(keep) as cursor:
+                self.execute(cursor, query, data)
+                return cursor.fetchall() if cursor.description else None
+        with self.cursor(keep) as cursor:
+            prepared = self._pool.preparedStatements(cursor.connection)
+            if name not in prepared:
+                # PREPARE isn't transactional, it lasts as the connection
+                self.execute(cursor, 'PREPARE %s (%s) AS %s'
+                             % (name, types, query))
+                self._round_trips += 1
+                prepared.add(name)
+            self.execute(cursor, 'EXECUTE %s (%s)'
+                         % (name, ', '.join(['%s'] * len(data))), data)
+            return cursor.fetchall() if cursor.description else None
+
+    def setPrepared(self, enabled):
+        '''Runs the statements of PREPARED_STATEMENTS prepared (default) or
+           as text, see dbPrepared
+        '''
+        self._prepared = enabled
+
+    def dbStream(self, query, data=None, fetch_size=FETCH_SIZE):
+        '''Yields the rows of a query through a named (server-side) cursor,
+           fetch_size rows by round trip
+
+        It uses the connection of the open transaction, otherwise one of
+        the pool until the stream is exhausted or closed. A commit or a
+        rollback of the open transaction ends the stream
+        '''
+        with self._lock:
+            connection = self._connection
+            own = connection is None
+            if own:
+                connection = self._pool.getconn()
+            self._streams += 1
+            name = 'stream_%s_%s' % (id(self), self._streams)
+        try:
+            cursor = connection.cursor(name)
+            try:
+                self.execute(cursor, query, data)
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    self._round_trips += 1
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield row
+            finally:
+                cursor.close()
+        finally:
+            if own:
+                # the cursor opened a transaction, only to read
+                connection.rollback()
+                self._pool.putconn(connection)
+
+    def dbCopyOut(self, query, data, output, fmt):
+        '''Writes the result of a query to the file output with COPY TO
+           STDOUT, the rows are written as they're received
+
+        Args:
+          fmt: (string) 'csv' with header, or 'jsonl' with ROW_TO_JSON of
+               each row
+        '''
+        checkExportFormat(fmt)
+        with self.cursor() as cursor:
+            query = cursor.mogrify(query, data)
+            if fmt == 'csv':
+                copy = 'COPY (%s) TO STDOUT WITH (FORMAT CSV, HEADER)' % query
+            else:
+                # the quote and the delimiter are never found in the JSON,
+                # so the lines are written without escapes
+                copy = ("COPY (SELECT ROW_TO_JSON(T) FROM (%s) T) TO STDOUT "
+                        "WITH (FORMAT CSV, QUOTE E'\\x01', "
+                        "DELIMITER E'\\x02')" % query)
+            cursor.copy_expert(copy, output)
+
+    def dbExecute(self, query, data=None):
+        '''Executes a statement inside the open transaction, the commit is
+            responsibility of the caller. Returns the rows of the statement
+            if any (RETURNING), otherwise None
+        '''
+        with self.cursor(keep=True) as cursor:
+            self.execute(cursor, query, data)
+            r = cursor.fetchall() if cursor.description else None
         return r
 
+    def enableStats(self, log=False):
+        '''Starts recording every statement of this instance: the API method
+           that called it, the fingerprint, latency, rows and commits, see
+           QueryStats. The instrumentation is disabled by default
+
+        Args:
+          log: (bool) logs each statement and each finished operation with
+               the logger 'tournament' (level DEBUG and INFO)
+        '''
+        self._stats = QueryStats(log)
+
+    def disableStats(self):
+        if self._stats is not None:
+            self._stats.finishOperation()
+        self._stats = None
+
+    def getStats(self):
+        '''Returns the stats recorded since enableStats as a dict, None if
+           the instrumentation is disabled
+        '''
+        if self._stats is None:
+            return None
+        return self._stats.export()
+
     def dbStatementCommit(self, query, data=None):
-        if data:
-            self._cursor.execute(query, data)
-            self._connection.commit()
-        else:
-            self._cursor.execute(query)
-            self._connection.commit()
+        r = self.dbExecute(query, data)
+        self.commit()
+        return r
 
     def deleteMatches(self):
-        '''Remove all the match records from the database.'''
+        '''Remove all the match records from the database, the partitions
+           are emptied by TRUNCATE instead of deleting row by row.'''
 
-        query = 'DELETE FROM MATCHES'
+        query = 'TRUNCATE MATCHES'
         self.dbStatementCommit(query)
+        self._generation += 1
 
     def deletePlayers(self):
         '''Remove all the player records from the database.'''
 
-        query = 'DELETE FROM PLAYERS'
+        query = 'TRUNCATE PLAYERS'
         self.dbStatementCommit(query)
+        self._player_ids.clear()
+        self._generation += 1
+
+    def purgeTournament(self, trnmnt_id):
+        '''PURGETOURNAMENT drops the partitions of the tournament'''
+        query = 'SELECT PURGETOURNAMENT(%s)'
+        data = (trnmnt_id,)
+        self.dbStatementCommit(query, data)
+        self._generation += 1
+
+    def archiveTournament(self, trnmnt_id):
+        '''ARCHIVETOURNAMENT detaches the partitions of the tournament to
+           the schema ARCHIVE
+        '''
+        query = 'SELECT ARCHIVETOURNAMENT(%s)'
+        data = (trnmnt_id,)
+        self.dbStatementCommit(query, data)
+        self._generation += 1
 
     def countPlayers(self):
         '''Returns the number of players currently registered.
@@ -666,31 +1887,673 @@ class TournamentDb(object):
           total_players: (int) the total count of players
         '''
         query = 'SELECT COUNT(1) as TOTAL_PLAYERS FROM PLAYERS'
-        self._cursor.execute(query)
-        r = self._cursor.fetchone()
+        r = self.dbQueryOne(query)
         return r[0]
 
-    def getFinalPlayers(self, trnmnt_id, wins_select):
-        ''' Returns players standings from the database with the 
-            condition of wins
+    def roundTrips(self):
+        '''Returns the number of round trips to the database of this instance:
+           statements, commits and rollbacks
+        '''
+        return self._round_trips
+
+    def tournamentExists(self, trnmnt_id):
+        query = 'SELECT COUNT(1) FROM TOURNAMENT WHERE TOURNAMENT_ID=%s'
+        data = (trnmnt_id,)
+        return self.dbQueryOne(query, data)[0] >= 1
+
+    def nextTournamentId(self):
+        query = '''SELECT NEXTVAL('ID_TOURNAMENT_SEQUENCE')'''
+        return self.dbQueryOne(query)[0]
+
+    def insertTournament(self, settings):
+        query = 'INSERT INTO TOURNAMENT (TOURNAMENT_ID, TOURNAMENT_NAME, \
+            TOURNAMENT_PLACE, START_DATE, END_DATE,NUMBER_PARTICIPANTS) \
+            VALUES (%s,%s,%s,%s,%s,%s);'
+        self.dbStatementCommit(query, settings)
+
+    def tournamentState(self, trnmnt_id):
+        '''One query: the standings and the matches are aggregated as JSON
+           arrays in the row of the tournament
+        '''
+        query = 'SELECT T.NUMBER_PARTICIPANTS, T.BRACKET, \
+            (SELECT JSON_AGG(JSON_BUILD_ARRAY(S.PLAYER_ID, S.FULL_NAME, \
+                S.WINS, S.MATCHES, S.BYES, S.POINTS, S.RANK_INI)) \
+                FROM F_STANDINGS(T.TOURNAMENT_ID) S), \
+            (SELECT JSON_AGG(JSON_BUILD_ARRAY(M.ROUND, M.WINNER, M.LOSER) \
+                ORDER BY M.ROUND) \
+                FROM MATCHES M WHERE M.TOURNAMENT_ID=T.TOURNAMENT_ID) \
+            FROM TOURNAMENT T WHERE T.TOURNAMENT_ID=%s'
+        data = (trnmnt_id,)
+        result = self.dbQueryOne(query, data)
+        if result is None:
+            return None
+        participants, document, standings, matches = result
+        # the names of the JSON arrays are decoded as unicode
+        return {'participants': participants,
+                'bracket': document,
+                'standings': [(i, n.encode('utf-8'), w, m, b, p, r)
+                              for i, n, w, m, b, p, r in standings or ()],
+                'matches': [tuple(row) for row in matches or ()]}
+
+    def findPlayer(self, name):
+        if name in self._player_ids:
+            return self._player_ids[name]
+        result = self.dbPrepared('find_player', (name,))
+        if result and result[0][0] > 0:
+            self._player_ids[name] = result[0][0]
+            return result[0][0]
+        return 0
+
+    def registerPlayer(self, trnmnt_id, name):
+        player_id = self.findPlayer(name)
+        if player_id > 0:
+            # If exist the player (name) only to update the last tournament
+            # that it's participating
+            self.dbPrepared('update_last_tournament', (trnmnt_id, player_id),
+                            keep=True)
+        else:
+            # Register as new player in the database
+            player_id = self.dbPrepared('insert_player', (name, trnmnt_id),
+                                        keep=True)[0][0]
+            self._player_ids[name] = player_id
+        self.commit()
+        return player_id
+
+    def registerPlayers(self, trnmnt_id, names):
+        '''The names already registered are resolved in one query, the new
+           players are inserted in one statement, and the trigger of PLAYERS
+           registers all of them to the tournament at once
+        '''
+        names = list(collections.OrderedDict.fromkeys(names))
+        player_ids = dict()
+        if not names:
+            return player_ids
+        query = 'SELECT DISTINCT ON (A.FULL_NAME) A.FULL_NAME, A.PLAYER_ID, \
+                 B.PLAYER_ID IS NOT NULL FROM PLAYERS A \
+                 LEFT OUTER JOIN PLAYERS_TOURNAMENT B ON \
+                 (A.PLAYER_ID=B.PLAYER_ID AND B.TOURNAMENT_ID=%s) \
+                 WHERE A.FULL_NAME = ANY(%s) ORDER BY A.FULL_NAME, A.PLAYER_ID'
+        data = (trnmnt_id, names)
+        to_update = list()
+        for name, player_id, in_tournament in self.dbQuery(query, data):
+            player_ids[name] = player_id
+            if not in_tournament:
+                to_update.append(player_id)
+        new_names = [n for n in names if n not in player_ids]
+        if to_update:
+            # update the last tournament, the trigger registers them
+            query = 'UPDATE PLAYERS SET LAST_TRNMNT_RGSTRD=%s \
+                     WHERE PLAYER_ID = ANY(%s)'
+            data = (trnmnt_id, to_update)
+            self.dbExecute(query, data)
+        if new_names:
+            query = '''INSERT INTO PLAYERS (PLAYER_ID, FULL_NAME, \
+                     LAST_TRNMNT_RGSTRD) SELECT nextval('id_player_sequence'), \
+                     NAME, %s FROM UNNEST(%s::TEXT[]) AS T(NAME) \
+                     RETURNING FULL_NAME, PLAYER_ID'''
+            data = (trnmnt_id, new_names)
+            player_ids.update(self.dbExecute(query, data))
+        self.commit()
+        self._player_ids.update(player_ids)
+        return player_ids
+
+    def tournamentPlayerIds(self, trnmnt_id):
+        query = 'SELECT PLAYER_ID FROM PLAYERS_TOURNAMENT \
+                 WHERE TOURNAMENT_ID=%s ORDER BY PLAYER_ID'
+        data = (trnmnt_id,)
+        return [x[0] for x in self.dbQuery(query, data)]
+
+    def setRankingInit(self, trnmnt_id, player_ids):
+        query = 'UPDATE PLAYERS_TOURNAMENT A SET RANK_INI=B.RANK \
+            FROM UNNEST(%s::INTEGER[]) WITH ORDINALITY AS B(PLAYER_ID, RANK) \
+            WHERE A.PLAYER_ID=B.PLAYER_ID AND A.TOURNAMENT_ID=%s'
+        data = (list(player_ids), trnmnt_id)
+        self.dbStatementCommit(query, data)
+
+    def setRatings(self, ratings):
+        query = 'UPDATE PLAYERS A SET RATING=B.RATING FROM \
+            UNNEST(%s::INTEGER[], %s::DOUBLE PRECISION[]) \
+            AS B(PLAYER_ID, RATING) WHERE A.PLAYER_ID=B.PLAYER_ID'
+        data = (list(ratings.iterkeys()), list(ratings.itervalues()))
+        self.dbStatementCommit(query, data)
+
+    def setRankingByRating(self, trnmnt_id):
+        query = 'UPDATE PLAYERS_TOURNAMENT A SET RANK_INI=B.RANK FROM \
+            (SELECT C.PLAYER_ID, ROW_NUMBER() OVER (ORDER BY \
+            D.RATING DESC NULLS LAST, C.PLAYER_ID) AS RANK \
+            FROM PLAYERS_TOURNAMENT C, PLAYERS D \
+            WHERE C.PLAYER_ID=D.PLAYER_ID AND C.TOURNAMENT_ID=%s) B \
+            WHERE A.PLAYER_ID=B.PLAYER_ID AND A.TOURNAMENT_ID=%s'
+        data = (trnmnt_id, trnmnt_id)
+        self.dbStatementCommit(query, data)
+
+    def insertMatch(self, trnmnt_id, round_, date_match, winner, loser):
+        data = (trnmnt_id, round_, date_match, winner, loser)
+        self.dbPrepared('insert_match', data, keep=True)
+
+    def insertMatches(self, trnmnt_id, round_, date_match, results,
+                      skip_stored=False):
+        '''The trigger of MATCHES updates the standings of the whole round
+           with a single upsert
+        '''
+        winners = [r[0] for r in results]
+        losers = [r[1] for r in results]
+        query = 'INSERT INTO MATCHES (TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER,\
+                 LOSER) SELECT %s::INTEGER, %s::INTEGER, %s::TIMESTAMP, \
+                 WINNER, LOSER FROM UNNEST(%s::INTEGER[], %s::INTEGER[]) \
+                 AS T(WINNER, LOSER)'
+        if skip_stored:
+            query += ' ON CONFLICT DO NOTHING'
+        data = (trnmnt_id, round_, date_match, winners, losers)
+        self.dbExecute(query, data)
+
+    def upsertMatches(self, trnmnt_id, round_, date_match, results):
+        '''One short transaction: the advisory locks of the boards and a
+           single upsert on MATCHES_IDX02, the triggers STANDINGS and
+           STANDINGS_UPD apply the new and the corrected results. The
+           locks are taken in order, the key of a board is (tournament,
+           lowest player), so the stations of other boards don't wait
+        '''
+        # the last report of each pair, a statement can't upsert a row twice
+        reports = collections.OrderedDict(
+            (pairing.pairKey(w, l), (w, l)) for w, l in results)
+        boards = sorted(set(lo if lo > 0 else hi for lo, hi in reports))
+        winners = [w for w, l in reports.itervalues()]
+        losers = [l for w, l in reports.itervalues()]
+        lock = 'SELECT PG_ADVISORY_XACT_LOCK(%s, B) \
+                FROM UNNEST(%s::INTEGER[]) AS T(B)'
+        query = 'INSERT INTO MATCHES AS M (TOURNAMENT_ID, ROUND, DATE_MATCH, \
+                 WINNER, LOSER) SELECT %s::INTEGER, %s::INTEGER, \
+                 %s::TIMESTAMP, WINNER, LOSER \
+                 FROM UNNEST(%s::INTEGER[], %s::INTEGER[]) AS T(WINNER, LOSER) \
+                 ON CONFLICT (TOURNAMENT_ID, ROUND, LEAST(WINNER, LOSER), \
+                 GREATEST(WINNER, LOSER)) DO UPDATE SET \
+                 WINNER=EXCLUDED.WINNER, LOSER=EXCLUDED.LOSER, \
+                 DATE_MATCH=EXCLUDED.DATE_MATCH \
+                 WHERE M.WINNER<>EXCLUDED.WINNER \
+                 RETURNING WINNER, LOSER, XMAX=0'
+        data = (trnmnt_id, round_, date_match, winners, losers)
+        with self._lock:
+            if self._connection is not None:
+                raise ValueError('The reports of the tournament %s need their '
+                                 'own transaction, commit or rollback the '
+                                 'open one first' % trnmnt_id)
+        for attempt in xrange(REPORT_RETRIES):
+            try:
+                self.dbExecute(lock, (trnmnt_id, boards))
+                rows = self.dbExecute(query, data)
+                self.commit()
+                return rows
+            except psycopg2.extensions.TransactionRollbackError as ex:
+                self.rollback()
+                if attempt == REPORT_RETRIES - 1:
+                    raise
+                logger.info('report of tournament %s retried: %s',
+                            trnmnt_id, ex)
+                time.sleep(REPORT_BACKOFF * (2 ** attempt) *
+                           (0.5 + random.random()))
+
+    def journalWatermark(self, journal_id):
+        query = 'SELECT SEQ FROM JOURNAL_WATERMARK WHERE JOURNAL_ID=%s'
+        data = (journal_id,)
+        result = self.dbQueryOne(query, data)
+        return 0 if result is None else result[0]
+
+    def setJournalWatermark(self, journal_id, seq):
+        query = 'INSERT INTO JOURNAL_WATERMARK (JOURNAL_ID, SEQ) \
+                 VALUES (%s, %s) ON CONFLICT (JOURNAL_ID) DO UPDATE \
+                 SET SEQ=GREATEST(JOURNAL_WATERMARK.SEQ, EXCLUDED.SEQ)'
+        data = (journal_id, seq)
+        self.dbExecute(query, data)
+
+    def matchPairs(self, trnmnt_id):
+        data = (trnmnt_id,)
+        return self.dbQuery(STORAGE_QUERIES['match_pairs'], data)
+
+    def byePlayers(self, trnmnt_id):
+        data = (trnmnt_id,)
+        return self.dbQuery(STORAGE_QUERIES['bye_players'], data)
+
+    def standings(self, trnmnt_id):
+        data = (trnmnt_id,)
+        return self.dbQuery(STORAGE_QUERIES['standings'], data)
+
+    def storedStandings(self, trnmnt_id):
+        query = 'SELECT PLAYER_ID, WINS, MATCHES, BYES, POINTS \
+                 FROM PLAYER_STANDINGS WHERE TOURNAMENT_ID=%s'
+        data = (trnmnt_id,)
+        return self.dbQuery(query, data)
+
+    def streamStandings(self, trnmnt_id, fetch_size):
+        data = (trnmnt_id,)
+        return self.dbStream(STORAGE_QUERIES['standings'], data, fetch_size)
+
+    def streamMatches(self, trnmnt_id, fetch_size):
+        query = 'SELECT TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER, LOSER \
+                 FROM MATCHES'
+        if trnmnt_id is None:
+            return self.dbStream(query, fetch_size=fetch_size)
+        query += ' WHERE TOURNAMENT_ID=%s'
+        return self.dbStream(query, (trnmnt_id,), fetch_size)
+
+    def exportStandings(self, trnmnt_id, output, fmt):
+        query = 'SELECT %s FROM F_STANDINGS(%%s)' % ', '.join(
+            STANDINGS_COLUMNS)
+        data = (trnmnt_id,)
+        self.dbCopyOut(query, data, output, fmt)
+
+    def exportMatches(self, trnmnt_id, output, fmt, round_=None):
+        query = 'SELECT %s FROM MATCHES WHERE TRUE' % ', '.join(
+            MATCHES_COLUMNS)
+        data = list()
+        if trnmnt_id is not None:
+            query += ' AND TOURNAMENT_ID=%s'
+            data.append(trnmnt_id)
+        if round_ is not None:
+            query += ' AND ROUND=%s'
+            data.append(round_)
+        self.dbCopyOut(query, data, output, fmt)
+
+    def updateTieBreaks(self, trnmnt_id):
+        query = 'SELECT UPDATETIEBREAKS(%s)'
+        data = (trnmnt_id,)
+        self.dbExecute(query, data)
+
+    def tieBreakOrder(self, tie_breaks, alias=''):
+        ''' Returns the ORDER BY of the final ranking: wins and the tie-break
+            rules (the names come from TIE_BREAKS)
+
         Args:
-          wins_select: (int) the value of wins to do the query
+          alias: (string) prefix of the columns, e.g. 'A.'
         '''
-        query = 'SELECT PLAYER_ID, FULL_NAME FROM V_STANDINGS WHERE \
-                TOURNAMENT_ID=%s AND WINS=%s'
-        data = (trnmnt_id, wins_select)
-        result = self.dbQuery(query, data)
-        return result
+        return ', '.join('%s%s DESC' % (alias, rule)
+                         for rule in ('WINS',) + tuple(tie_breaks))
+
+    def finalRanking(self, trnmnt_id, tie_breaks):
+        query = 'SELECT A.PLAYER_ID, B.FULL_NAME, A.WINS, %s \
+            FROM PLAYER_STANDINGS A, PLAYERS B \
+            WHERE A.PLAYER_ID=B.PLAYER_ID AND A.TOURNAMENT_ID=%%s \
+            ORDER BY %s' % (', '.join('A.%s' % r for r in tie_breaks),
+                            self.tieBreakOrder(tie_breaks))
+        data = (trnmnt_id,)
+        return self.dbQuery(query, data)
+
+    def cutTopPlayers(self, trnmnt_id, tie_breaks, top_players):
+        '''One statement: ROW_NUMBER() over wins and the tie-breaks, and
+           RANK_FIN is written for the whole field with the same UPDATE. The
+           field are the players of the tournament as in F_STANDINGS, the
+           ones without standings rank after the others with 0 wins
+        '''
+        query = 'UPDATE PLAYERS_TOURNAMENT B SET RANK_FIN = \
+                CASE WHEN C.RN<=%%s THEN C.RN ELSE 0 END \
+                FROM (SELECT D.PLAYER_ID, E.FULL_NAME, COALESCE(A.WINS,0) AS WINS, \
+                ROW_NUMBER() OVER (ORDER BY COALESCE(A.WINS,0) DESC, \
+                A.PLAYER_ID IS NULL, %s, D.RANK_INI) AS RN \
+                FROM PLAYERS_TOURNAMENT D \
+                JOIN PLAYERS E ON (E.PLAYER_ID=D.PLAYER_ID) \
+                LEFT OUTER JOIN PLAYER_STANDINGS A ON \
+                (A.PLAYER_ID=D.PLAYER_ID AND A.TOURNAMENT_ID=D.TOURNAMENT_ID) \
+                WHERE D.TOURNAMENT_ID=%%s) C \
+                WHERE B.PLAYER_ID=C.PLAYER_ID \
+                AND B.TOURNAMENT_ID=%%s AND (C.RN<=%%s OR B.RANK_FIN>0) \
+                RETURNING B.RANK_FIN, C.WINS, B.PLAYER_ID, C.FULL_NAME' % (
+                    ', '.join('A.%s DESC' % rule for rule in tie_breaks))
+        data = (top_players, trnmnt_id, trnmnt_id, top_players)
+        return [row for row in self.dbExecute(query, data) if row[0] > 0]
+
+    def cutPlayers(self, trnmnt_id, top_players):
+        query = 'SELECT PLAYER_ID, FULL_NAME FROM F_STANDINGS(%s) \
+            WHERE RANK_FIN >0 AND RANK_FIN<=%s ORDER BY RANK_FIN'
+        data = (trnmnt_id, top_players)
+        return self.dbQuery(query, data)
+
+    def saveBracket(self, trnmnt_id, document):
+        query = 'UPDATE TOURNAMENT SET BRACKET=%s WHERE TOURNAMENT_ID=%s'
+        data = (document, trnmnt_id)
+        self.dbStatementCommit(query, data)
+
+    def loadBracket(self, trnmnt_id):
+        query = 'SELECT BRACKET FROM TOURNAMENT WHERE TOURNAMENT_ID=%s'
+        data = (trnmnt_id,)
+        result = self.dbQueryOne(query, data)
+        return None if result is None else result[0]
+
+    def setWinner(self, trnmnt_id, winner, second_place, document):
+        query = 'UPDATE TOURNAMENT SET WINNER=%s, SECOND_PLACE=%s, BRACKET=%s \
+                     WHERE TOURNAMENT_ID=%s'
+        data = (winner, second_place, document, trnmnt_id)
+        self.dbStatementCommit(query, data)
 
     def closeConnect(self):
-        ''' Close the connection to the database tournament'''
+        ''' Gives back the connection to the pool, the transaction not
+            committed is discarded'''
 
-        self._connection.close()
+        self.rollback()
         print 'Connection is closed'
 
     def rollback(self):
         ''' Rollback transaction'''
-        self._connection.rollback()
+        with self._lock:
+            if self._connection is not None:
+                connection, self._connection = self._connection, None
+                self._round_trips += 1
+                connection.rollback()
+                self._pool.putconn(connection)
 
     def commit(self):
-        self._connection.commit()
+        with self._lock:
+            if self._connection is not None:
+                connection, self._connection = self._connection, None
+                self._round_trips += 1
+                if self._stats is not None:
+                    self._stats.recordCommit()
+                try:
+                    connection.commit()
+                finally:
+                    self._pool.putconn(connection)
+
+
+class PairingPrecompute(object):
+
+    ''' Worker thread that pairs rounds ahead of time with pairSnapshot.
+
+        The snapshots submitted replace the ones still waiting (only the
+        latest state matters), and the last PRECOMPUTE_RESULTS pairings are
+        kept with their snapshot. lookup returns the pairings of a snapshot
+        equal to the current state of the tournament, waiting for the worker
+        if it's computing them, so a precomputed round is always the one
+        pairSnapshot would return. See Swiss.startPrecompute
+    '''
+
+    def __init__(self, engine):
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._waiting = list()  # snapshots to pair, in order
+        self._current = None  # the snapshot being paired
+        self._results = collections.deque(maxlen=PRECOMPUTE_RESULTS)
+        self._thread = None
+        self._closing = False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run,
+                                            name='pairing-precompute')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def busy(self):
+        with self._lock:
+            return self._current is not None or bool(self._waiting)
+
+    def submit(self, snapshots):
+        ''' Replaces the snapshots waiting to be paired, the ones already
+            paired or being paired are skipped
+        '''
+        with self._lock:
+            self._waiting = [
+                snapshot for snapshot in snapshots
+                if snapshot != self._current and
+                not any(snapshot == done for done, _ in self._results)]
+            self._changed.notify_all()
+
+    def lookup(self, snapshot):
+        ''' Returns the RoundPairings of a snapshot equal to this one, None if
+            it isn't paired nor waiting to be paired
+        '''
+        with self._lock:
+            while True:
+                for done, result in self._results:
+                    if done == snapshot:
+                        return result
+                if snapshot != self._current and snapshot not in self._waiting:
+                    return None
+                self._changed.wait()
+
+    def run(self):
+        while True:
+            with self._lock:
+                while not self._waiting and not self._closing:
+                    self._changed.wait()
+                if self._closing:
+                    return
+                self._current = snapshot = self._waiting.pop(0)
+            try:
+                result = pairSnapshot(self._engine, snapshot)
+            except Exception as ex:
+                logger.warning('pairings of round %s not precomputed: %s',
+                               snapshot.round, ex)
+                result = None
+            with self._lock:
+                if result is not None:
+                    self._results.append((snapshot, result))
+                self._current = None
+                self._changed.notify_all()
+
+    def close(self):
+        ''' Stops the worker, the pairings waiting are dropped '''
+        with self._lock:
+            self._closing = True
+            self._waiting = list()
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class QueryStats(object):
+
+    ''' Statements recorded by the instrumentation of TournamentDb.
+
+        The caller of a statement is the API method of a Tournament in
+        progress in the thread (e.g. Swiss.swissPairings, see apiOperation),
+        one call to that method is a logical operation. The stats are kept
+        by fingerprint (the text of the statement with the blanks collapsed,
+        the values are parameters) and by operation, with the statements of
+        each round
+    '''
+
+    def __init__(self, log=False):
+        self._log = log
+        self._fingerprints = dict()  # query --> fingerprint
+        self._statements = dict()
+        self._operations = dict()
+        self._local = threading.local()  # operation in progress by thread
+
+    def fingerprint(self, query):
+        fingerprint = self._fingerprints.get(query)
+        if fingerprint is None:
+            fingerprint = self._fingerprints[query] = ' '.join(query.split())
+        return fingerprint
+
+    @contextlib.contextmanager
+    def operation(self, name, round_):
+        ''' The statements of the block are one call of the operation name,
+            in an operation already in progress they're part of that one
+        '''
+        if getattr(self._local, 'operation', None) is not None:
+            yield
+            return
+        self.beginOperation(name, round_)
+        try:
+            yield
+        finally:
+            self.finishOperation()
+
+    def beginOperation(self, name, round_):
+        operation = self._operations.setdefault(name, {
+            'calls': 0, 'statements': 0, 'rows': 0, 'seconds': 0.0,
+            'commits': 0, 'rounds': dict()})
+        operation['calls'] += 1
+        self._local.operation = {'name': name, 'round': round_,
+                                 'statements': 0, 'rows': 0, 'seconds': 0.0,
+                                 'commits': 0, 'total': operation}
+        return self._local.operation
+
+    def currentOperation(self):
+        ''' Returns the stats of the operation of the current statement, a
+            statement out of the API methods is an operation by itself
+        '''
+        operation = getattr(self._local, 'operation', None)
+        if operation is None:
+            operation = self.beginOperation('(no operation)', None)
+            operation['single'] = True
+        return operation
+
+    def finishOperation(self):
+        operation = getattr(self._local, 'operation', None)
+        if operation is None:
+            return
+        self._local.operation = None
+        if self._log:
+            logger.info('%s round %s: %s statements, %s rows, %s commits, '
+                        '%.3fs', operation['name'], operation['round'],
+                        operation['statements'], operation['rows'],
+                        operation['commits'], operation['seconds'])
+
+    def recordStatement(self, query, seconds, rows):
+        operation = self.currentOperation()
+        fingerprint = self.fingerprint(query)
+        rows = max(rows, 0)
+        for stats in (operation, operation['total']):
+            stats['statements'] += 1
+            stats['rows'] += rows
+            stats['seconds'] += seconds
+        rounds = operation['total']['rounds']
+        rounds[operation['round']] = rounds.get(operation['round'], 0) + 1
+        statement = self._statements.setdefault(fingerprint, {
+            'count': 0, 'rows': 0, 'seconds': 0.0, 'callers': dict()})
+        statement['count'] += 1
+        statement['rows'] += rows
+        statement['seconds'] += seconds
+        callers = statement['callers']
+        callers[operation['name']] = callers.get(operation['name'], 0) + 1
+        if self._log:
+            logger.debug('%s: %.6fs %s rows: %s', operation['name'], seconds,
+                         rows, fingerprint)
+        if operation.get('single'):
+            self.finishOperation()
+
+    def recordCommit(self):
+        operation = self.currentOperation()
+        operation['commits'] += 1
+        operation['total']['commits'] += 1
+        if operation.get('single'):
+            self.finishOperation()
+
+    def export(self):
+        ''' Returns the stats as a dict:
+            {'statements': {fingerprint: {'count', 'rows', 'seconds',
+                                          'callers': {operation: count}}},
+             'operations': {operation: {'calls', 'statements', 'rows',
+                                        'seconds', 'commits',
+                                        'rounds': {round: statements}}}}
+        '''
+        return copy.deepcopy({'statements': self._statements,
+                              'operations': self._operations})
+
+
+class ConnectionPool(object):
+
+    ''' Bounded pool of connections safe to share across threads, the
+        callers wait for a free connection instead of failing when all of
+        them are in use, up to POOL_TIMEOUT. There is one pool by dsn and
+        size, see getPool
+
+        The pool_size slots are for the operations: a connection kept by an
+        open transaction of the caller (keepconn) gives its slot back, so
+        the tournaments waiting for a commit don't block the others. Up to
+        POOL_TRANSACTIONS of them are opened beyond pool_size
+    '''
+
+    _pools = dict()
+    _pools_lock = threading.Lock()
+
+    def __init__(self, dsn, pool_size):
+        # psycopg2 closes the connections returned above minconn, so all of
+        # them are kept open to be reused
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            pool_size, pool_size + POOL_TRANSACTIONS, dsn)
+        self._slots = threading.Condition(threading.Lock())
+        self._free_slots = pool_size
+        self._kept = set()  # connections of open transactions, no slot
+        self._prepared = dict()  # connection --> names of PREPARE done
+        self._prepared_lock = threading.Lock()
+
+    @classmethod
+    def getPool(cls, dsn=DSN, pool_size=POOL_SIZE):
+        ''' Returns the shared pool of the dsn, it's created the first time'''
+        with cls._pools_lock:
+            key = (dsn, pool_size)
+            if key not in cls._pools:
+                cls._pools[key] = cls(dsn, pool_size)
+            return cls._pools[key]
+
+    @classmethod
+    def closePools(cls):
+        ''' Closes all the connections of all the pools'''
+        with cls._pools_lock:
+            for pool in cls._pools.values():
+                pool._pool.closeall()
+                pool._prepared.clear()
+            cls._pools.clear()
+
+    def preparedStatements(self, connection):
+        ''' Returns the set of the statements prepared in the connection, the
+            caller adds the ones it prepares
+        '''
+        with self._prepared_lock:
+            return self._prepared.setdefault(connection, set())
+
+    def getconn(self, timeout=POOL_TIMEOUT):
+        ''' Returns a connection, it waits for a free slot up to timeout
+            seconds and then raises psycopg2.pool.PoolError
+        '''
+        deadline = time.time() + timeout
+        with self._slots:
+            while not self._free_slots:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise psycopg2.pool.PoolError(
+                        'no connection of the pool is free after %s seconds'
+                        % timeout)
+                self._slots.wait(remaining)
+            self._free_slots -= 1
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self.releaseSlot()
+            raise
+
+    def keepconn(self, connection):
+        ''' The connection is kept by a transaction of the caller until
+            putconn, its slot is free for the other operations
+        '''
+        with self._slots:
+            if connection not in self._kept:
+                self._kept.add(connection)
+                self._free_slots += 1
+                self._slots.notify()
+
+    def releaseSlot(self):
+        with self._slots:
+            self._free_slots += 1
+            self._slots.notify()
+
+    def putconn(self, connection):
+        # the pool rollbacks the transaction left open, if any, and it
+        # closes the connection if it's broken
+        try:
+            self._pool.putconn(connection)
+        finally:
+            if connection.closed:
+                # the pool opens a new connection, without statements
+                # prepared
+                with self._prepared_lock:
+                    self._prepared.pop(connection, None)
+            with self._slots:
+                if connection in self._kept:
+                    self._kept.discard(connection)
+                else:
+                    self._free_slots += 1
+                    self._slots.notify()
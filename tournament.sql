@@ -7,14 +7,23 @@
 -- these lines here.
 
 DROP VIEW IF EXISTS V_STANDINGS;
+DROP FUNCTION IF EXISTS F_STANDINGS(INTEGER);
+DROP FUNCTION IF EXISTS UPDATETIEBREAKS(INTEGER);
+DROP FUNCTION IF EXISTS PURGETOURNAMENT(INTEGER);
+DROP FUNCTION IF EXISTS ARCHIVETOURNAMENT(INTEGER);
 DROP TABLE IF EXISTS TOURNAMENT;
 DROP TABLE IF EXISTS MATCHES;
 DROP TABLE IF EXISTS PLAYERS;
 DROP TABLE IF EXISTS PLAYER_STANDINGS;
 DROP TABLE IF EXISTS PLAYERS_TOURNAMENT;
+DROP TABLE IF EXISTS JOURNAL_WATERMARK;
 DROP SEQUENCE IF EXISTS ID_TOURNAMENT_SEQUENCE;
 DROP SEQUENCE IF EXISTS ID_PLAYER_SEQUENCE;
 
+-- the archived tournaments (ARCHIVETOURNAMENT) are kept when the schema is
+-- created again
+CREATE SCHEMA IF NOT EXISTS ARCHIVE;
+
 
 
 CREATE TABLE TOURNAMENT (
@@ -25,16 +34,34 @@ CREATE TABLE TOURNAMENT (
 	END_DATE DATE, 
 	NUMBER_PARTICIPANTS INTEGER, 
 	WINNER XML, 
-	SECOND_PLACE XML);
+	SECOND_PLACE XML,
+	BRACKET JSON);
 
+-- MATCHES and PLAYER_STANDINGS have a partition by tournament (PostgreSQL
+-- 11 or later), created with the tournament (trigger TOURNAMENTPARTITIONS):
+-- the statements of a tournament only touch its partitions, and a finished
+-- tournament is purged or archived dropping or detaching them. The rows of
+-- tournaments without a row in TOURNAMENT go to the DEFAULT partitions
 CREATE TABLE MATCHES ( 
 	TOURNAMENT_ID INTEGER, 
 	ROUND INTEGER, 
 	DATE_MATCH TIMESTAMP, 
 	WINNER INTEGER, 
-	LOSER INTEGER );
+	LOSER INTEGER ) PARTITION BY LIST (TOURNAMENT_ID);
+
+CREATE TABLE MATCHES_DEFAULT PARTITION OF MATCHES DEFAULT;
 
 CREATE INDEX MATCHES_IDX01 ON MATCHES (TOURNAMENT_ID,WINNER,LOSER);
+-- natural key of a match: a pair of players (in any order) plays once a round,
+-- the reports of many stations are upserts on it (see TournamentDb.upsertMatches)
+CREATE UNIQUE INDEX MATCHES_IDX02 ON MATCHES
+	(TOURNAMENT_ID, ROUND, LEAST(WINNER,LOSER), GREATEST(WINNER,LOSER));
+
+-- last record of each local journal (journal.py) written to MATCHES, it's
+-- moved in the same transaction of the batch of matches
+CREATE TABLE JOURNAL_WATERMARK (
+	JOURNAL_ID TEXT PRIMARY KEY,
+	SEQ BIGINT NOT NULL);
 
 CREATE TABLE PLAYERS (
 	PLAYER_ID INTEGER PRIMARY KEY,
@@ -42,7 +69,8 @@ CREATE TABLE PLAYERS (
 	BIRTHDATE DATE,
 	AGE INTEGER,
 	REGISTER_DATE DATE,
-	LAST_TRNMNT_RGSTRD INTEGER);
+	LAST_TRNMNT_RGSTRD INTEGER,
+	RATING DOUBLE PRECISION);
 
 CREATE INDEX PLAYERS_IDX01 ON PLAYERS(PLAYER_ID);
 CREATE INDEX PLAYERS_IDX02 ON PLAYERS(FULL_NAME);
@@ -55,9 +83,23 @@ CREATE TABLE PLAYER_STANDINGS (
 	MATCHES INTEGER,
 	BYES INTEGER,
 	POINTS DOUBLE PRECISION,
-	TOURNAMENT_ID INTEGER );
+	TOURNAMENT_ID INTEGER,
+	-- tie-breaks, updated once per round by UPDATETIEBREAKS
+	OPP_POINTS DOUBLE PRECISION DEFAULT 0,
+	BUCHHOLZ INTEGER DEFAULT 0,
+	MEDIAN_BUCHHOLZ INTEGER DEFAULT 0,
+	SONNEBORN_BERGER INTEGER DEFAULT 0,
+	CUMULATIVE INTEGER DEFAULT 0 ) PARTITION BY LIST (TOURNAMENT_ID);
+
+CREATE TABLE PLAYER_STANDINGS_DEFAULT PARTITION OF PLAYER_STANDINGS DEFAULT;
 
 ALTER TABLE PLAYER_STANDINGS ADD PRIMARY KEY (PLAYER_ID,TOURNAMENT_ID);
+-- covering index of the standings of one tournament, in the order of F_STANDINGS
+CREATE INDEX PLAYER_STANDINGS_IDX01 ON PLAYER_STANDINGS
+	(TOURNAMENT_ID, WINS DESC, BYES DESC, POINTS DESC, PLAYER_ID, MATCHES, TIEDS);
+-- final ranking with the default tie-breaks (opponents points, points)
+CREATE INDEX PLAYER_STANDINGS_IDX02 ON PLAYER_STANDINGS
+	(TOURNAMENT_ID, WINS DESC, OPP_POINTS DESC, POINTS DESC);
 
 
 CREATE TABLE PLAYERS_TOURNAMENT (
@@ -68,31 +110,131 @@ CREATE TABLE PLAYERS_TOURNAMENT (
 ALTER TABLE PLAYERS_TOURNAMENT ADD PRIMARY KEY (PLAYER_ID,TOURNAMENT_ID);
 CREATE INDEX PLAYER_TRNMNT_IDX01 ON PLAYERS_TOURNAMENT(TOURNAMENT_ID);
 
+-- Standings of all the tournaments, to read the standings of one tournament
+-- use F_STANDINGS, which is sorted and only touches the rows of the tournament
 CREATE VIEW V_STANDINGS AS 
 	SELECT A.PLAYER_ID, A.FULL_NAME, COALESCE(B.WINS,0) WINS, 
     COALESCE(B.MATCHES,0) MATCHES,B.BYES, B.POINTS, A.RANK_INI,A.RANK_FIN, A.TOURNAMENT_ID FROM 
     (SELECT C.PLAYER_ID,C.FULL_NAME,D.RANK_INI,D.RANK_FIN,D.TOURNAMENT_ID 
     FROM PLAYERS C, PLAYERS_TOURNAMENT D WHERE C.PLAYER_ID=D.PLAYER_ID) A 
     LEFT OUTER JOIN PLAYER_STANDINGS B ON 
-    (A.PLAYER_ID=B.PLAYER_ID AND B.TOURNAMENT_ID=A.TOURNAMENT_ID)
-    ORDER BY TOURNAMENT_ID, WINS DESC, BYES DESC, POINTS DESC,TIEDS;
+    (A.PLAYER_ID=B.PLAYER_ID AND B.TOURNAMENT_ID=A.TOURNAMENT_ID);
+
+-- Standings of one tournament, sorted. It's a SQL function that the planner
+-- inlines, so the filter by tournament uses the indexes before the joins
+-- and the sort, no matter how many tournaments are stored
+CREATE OR REPLACE FUNCTION F_STANDINGS(P_TOURNAMENT_ID INTEGER)
+	RETURNS TABLE (PLAYER_ID INTEGER, FULL_NAME TEXT, WINS INTEGER, MATCHES INTEGER,
+		BYES INTEGER, POINTS DOUBLE PRECISION, RANK_INI INTEGER, RANK_FIN INTEGER,
+		TOURNAMENT_ID INTEGER) AS $F_STANDINGS$
+	SELECT D.PLAYER_ID, C.FULL_NAME, COALESCE(B.WINS,0), COALESCE(B.MATCHES,0),
+		B.BYES, B.POINTS, D.RANK_INI, D.RANK_FIN, D.TOURNAMENT_ID
+	FROM PLAYERS_TOURNAMENT D
+	JOIN PLAYERS C ON (C.PLAYER_ID=D.PLAYER_ID)
+	LEFT OUTER JOIN PLAYER_STANDINGS B ON
+		(B.PLAYER_ID=D.PLAYER_ID AND B.TOURNAMENT_ID=D.TOURNAMENT_ID)
+	WHERE D.TOURNAMENT_ID=P_TOURNAMENT_ID
+	ORDER BY COALESCE(B.WINS,0) DESC, B.BYES DESC, B.POINTS DESC, B.TIEDS, D.RANK_INI;
+$F_STANDINGS$ LANGUAGE SQL STABLE;
 
 
+CREATE OR REPLACE FUNCTION ADDTOURNAMENTPARTITIONS() RETURNS TRIGGER AS $ADDTOURNAMENTPARTITIONS$
+	BEGIN
+	-- The partitions of MATCHES and PLAYER_STANDINGS of a new tournament,
+	-- MATCHES_<id> and PLAYER_STANDINGS_<id>
+
+		EXECUTE FORMAT('CREATE TABLE IF NOT EXISTS MATCHES_%s PARTITION OF MATCHES FOR VALUES IN (%s)',
+			NEW.TOURNAMENT_ID, NEW.TOURNAMENT_ID);
+		EXECUTE FORMAT('CREATE TABLE IF NOT EXISTS PLAYER_STANDINGS_%s PARTITION OF PLAYER_STANDINGS FOR VALUES IN (%s)',
+			NEW.TOURNAMENT_ID, NEW.TOURNAMENT_ID);
+		RETURN NULL;
+	END;
+
+$ADDTOURNAMENTPARTITIONS$ LANGUAGE PLPGSQL;
+
+CREATE TRIGGER TOURNAMENTPARTITIONS
+	AFTER INSERT ON TOURNAMENT
+	FOR EACH ROW
+	EXECUTE PROCEDURE ADDTOURNAMENTPARTITIONS();
+
+CREATE OR REPLACE FUNCTION PURGETOURNAMENT(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $PURGETOURNAMENT$
+	BEGIN
+	-- Removes a tournament: its partitions are dropped instead of deleting
+	-- the rows one by one, the rows of the DEFAULT partitions are deleted
+
+		EXECUTE FORMAT('DROP TABLE IF EXISTS MATCHES_%s, PLAYER_STANDINGS_%s',
+			P_TOURNAMENT_ID, P_TOURNAMENT_ID);
+		DELETE FROM MATCHES_DEFAULT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		DELETE FROM PLAYER_STANDINGS_DEFAULT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		DELETE FROM PLAYERS_TOURNAMENT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		-- the players are registered again if the id of the tournament is
+		-- used again (see REGPLAYERTOURNAMENT)
+		UPDATE PLAYERS SET LAST_TRNMNT_RGSTRD=NULL
+			WHERE LAST_TRNMNT_RGSTRD=P_TOURNAMENT_ID;
+		DELETE FROM TOURNAMENT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+	END;
+
+$PURGETOURNAMENT$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION ARCHIVETOURNAMENT(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $ARCHIVETOURNAMENT$
+	BEGIN
+	-- Detaches the partitions of a finished tournament and moves them to the
+	-- schema ARCHIVE (ARCHIVE.MATCHES_<id>, ARCHIVE.PLAYER_STANDINGS_<id>).
+	-- The tournament and its players (PLAYERS_TOURNAMENT) are kept
+
+		EXECUTE FORMAT('ALTER TABLE MATCHES DETACH PARTITION MATCHES_%s',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE PLAYER_STANDINGS DETACH PARTITION PLAYER_STANDINGS_%s',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE MATCHES_%s SET SCHEMA ARCHIVE',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE PLAYER_STANDINGS_%s SET SCHEMA ARCHIVE',
+			P_TOURNAMENT_ID);
+	END;
+
+$ARCHIVETOURNAMENT$ LANGUAGE PLPGSQL;
+
 CREATE SEQUENCE ID_PLAYER_SEQUENCE START 101 MAXVALUE 999999;
 CREATE SEQUENCE ID_TOURNAMENT_SEQUENCE START 10001 MAXVALUE 99999;
 
 CREATE OR REPLACE FUNCTION REGPLAYERTOURNAMENT() RETURNS TRIGGER AS $REGPLAYERTOURNAMENT$
 	BEGIN
-		INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID,RANK_INI,RANK_FIN,TOURNAMENT_ID)
-			VALUES(NEW.PLAYER_ID,0,0,NEW.LAST_TRNMNT_RGSTRD);
+	-- Statement trigger, it registers to their last tournament all the players
+	-- inserted by the statement (NEW_PLAYERS), in a single insert. An update
+	-- only registers the players whose LAST_TRNMNT_RGSTRD changed (OLD_PLAYERS
+	-- joined to NEW_PLAYERS): a transition table can't be used with UPDATE OF
+	-- LAST_TRNMNT_RGSTRD, and another update (e.g. a new RATING) mustn't
+	-- register again a player to a purged tournament
+
+		IF TG_OP = 'INSERT' THEN
+			INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID,RANK_INI,RANK_FIN,TOURNAMENT_ID)
+				SELECT PLAYER_ID,0,0,LAST_TRNMNT_RGSTRD FROM NEW_PLAYERS
+				WHERE LAST_TRNMNT_RGSTRD IS NOT NULL
+				ON CONFLICT (PLAYER_ID,TOURNAMENT_ID) DO NOTHING;
+		ELSE
+			INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID,RANK_INI,RANK_FIN,TOURNAMENT_ID)
+				SELECT N.PLAYER_ID,0,0,N.LAST_TRNMNT_RGSTRD
+				FROM NEW_PLAYERS N JOIN OLD_PLAYERS O ON (O.PLAYER_ID=N.PLAYER_ID)
+				WHERE N.LAST_TRNMNT_RGSTRD IS NOT NULL
+				AND N.LAST_TRNMNT_RGSTRD IS DISTINCT FROM O.LAST_TRNMNT_RGSTRD
+				ON CONFLICT (PLAYER_ID,TOURNAMENT_ID) DO NOTHING;
+		END IF;
 		RETURN NULL;
 	END;
 
 $REGPLAYERTOURNAMENT$ LANGUAGE PLPGSQL;
 
+-- A trigger with transition tables supports only one event (PostgreSQL 10+)
 CREATE TRIGGER PLAYERTOURNAMENT
-	AFTER INSERT OR UPDATE ON PLAYERS
-	FOR EACH ROW
+	AFTER INSERT ON PLAYERS
+	REFERENCING NEW TABLE AS NEW_PLAYERS
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE REGPLAYERTOURNAMENT();
+
+CREATE TRIGGER PLAYERTOURNAMENT_UPD
+	AFTER UPDATE ON PLAYERS
+	REFERENCING OLD TABLE AS OLD_PLAYERS NEW TABLE AS NEW_PLAYERS
+	FOR EACH STATEMENT
 	EXECUTE PROCEDURE REGPLAYERTOURNAMENT();
 
 CREATE OR REPLACE FUNCTION UPDATESTANDINGS() RETURNS TRIGGER AS $UPDATESTANDINGS$
@@ -101,32 +243,25 @@ CREATE OR REPLACE FUNCTION UPDATESTANDINGS() RETURNS TRIGGER AS $UPDATESTANDINGS
 	-- Winner +1, loser nothing, player-bye +1. 
 	-- Also update the points for each player. The rule of points is increment by the value of round 
 	-- winner +$round, loser nothing, player-bye nothing
+	-- It's a statement trigger, all the matches inserted by the statement
+	-- (NEW_MATCHES) are added up by player and applied with a single upsert
 
-		IF NEW.LOSER=0 THEN -- This is the rule of player with round bye
-			UPDATE PLAYER_STANDINGS SET WINS=WINS+1, MATCHES=MATCHES+1, BYES=BYES+1
-				WHERE PLAYER_ID=NEW.WINNER AND TOURNAMENT_ID=NEW.TOURNAMENT_ID;
-			IF NOT FOUND THEN
-				INSERT INTO PLAYER_STANDINGS (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
-					VALUES (NEW.WINNER, 1,0,0,1,1,0,NEW.TOURNAMENT_ID);
-			END IF;
-		END IF;
-
-		IF NEW.LOSER>0 THEN
-		    -- This update the winner
-			UPDATE PLAYER_STANDINGS SET WINS=WINS+1, MATCHES=MATCHES+1, POINTS=POINTS+NEW.ROUND
-				WHERE PLAYER_ID=NEW.WINNER AND TOURNAMENT_ID=NEW.TOURNAMENT_ID;
-			IF NOT FOUND THEN
-				INSERT INTO PLAYER_STANDINGS (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
-					VALUES (NEW.WINNER, 1,0,0,1,0,NEW.ROUND,NEW.TOURNAMENT_ID);
-			END IF;
-		    -- This update the loser
-			UPDATE PLAYER_STANDINGS SET LOSSES=LOSSES+1, MATCHES=MATCHES+1
-				WHERE PLAYER_ID=NEW.LOSER AND TOURNAMENT_ID=NEW.TOURNAMENT_ID;
-			IF NOT FOUND THEN
-			INSERT INTO PLAYER_STANDINGS (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
-				VALUES (NEW.LOSER, 0,1,0,1,0,0,NEW.TOURNAMENT_ID);
-			END IF;
-		END IF;
+		INSERT INTO PLAYER_STANDINGS AS S (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
+			SELECT PLAYER_ID, SUM(WINS), SUM(LOSSES), 0, SUM(MATCHES), SUM(BYES), SUM(POINTS), TOURNAMENT_ID
+			FROM (
+				-- winners and players with round bye (LOSER=0)
+				SELECT WINNER AS PLAYER_ID, 1 AS WINS, 0 AS LOSSES, 1 AS MATCHES,
+					CASE WHEN LOSER=0 THEN 1 ELSE 0 END AS BYES,
+					CASE WHEN LOSER=0 THEN 0 ELSE ROUND END AS POINTS, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, 1, 1, 0, 0, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>0) R
+			GROUP BY PLAYER_ID, TOURNAMENT_ID
+		ON CONFLICT (PLAYER_ID, TOURNAMENT_ID) DO UPDATE SET
+			WINS=S.WINS+EXCLUDED.WINS, LOSSES=S.LOSSES+EXCLUDED.LOSSES,
+			MATCHES=S.MATCHES+EXCLUDED.MATCHES, BYES=S.BYES+EXCLUDED.BYES,
+			POINTS=S.POINTS+EXCLUDED.POINTS;
 		RETURN NULL;
 	END;
 
@@ -134,10 +269,95 @@ $UPDATESTANDINGS$ LANGUAGE PLPGSQL;
 
 CREATE TRIGGER STANDINGS
 	AFTER INSERT ON MATCHES
-	FOR EACH ROW
+	REFERENCING NEW TABLE AS NEW_MATCHES
+	FOR EACH STATEMENT
 	EXECUTE PROCEDURE UPDATESTANDINGS();
 
+CREATE OR REPLACE FUNCTION CORRECTSTANDINGS() RETURNS TRIGGER AS $CORRECTSTANDINGS$
+	BEGIN
+	-- Statement trigger of the corrected results (an upsert of a match with
+	-- other winner): the old result of each match (OLD_MATCHES) is taken
+	-- away and the new one (NEW_MATCHES) is added, with the rules of
+	-- UPDATESTANDINGS and a single upsert
 
+		INSERT INTO PLAYER_STANDINGS AS S (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
+			SELECT PLAYER_ID, SUM(WINS), SUM(LOSSES), 0, SUM(MATCHES), SUM(BYES), SUM(POINTS), TOURNAMENT_ID
+			FROM (
+				SELECT WINNER AS PLAYER_ID, 1 AS WINS, 0 AS LOSSES, 1 AS MATCHES,
+					CASE WHEN LOSER=0 THEN 1 ELSE 0 END AS BYES,
+					CASE WHEN LOSER=0 THEN 0 ELSE ROUND END AS POINTS, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, 1, 1, 0, 0, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>0
+				UNION ALL
+				SELECT WINNER, -1, 0, -1, CASE WHEN LOSER=0 THEN -1 ELSE 0 END,
+					CASE WHEN LOSER=0 THEN 0 ELSE -ROUND END, TOURNAMENT_ID
+				FROM OLD_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, -1, -1, 0, 0, TOURNAMENT_ID
+				FROM OLD_MATCHES WHERE LOSER>0) R
+			GROUP BY PLAYER_ID, TOURNAMENT_ID
+		ON CONFLICT (PLAYER_ID, TOURNAMENT_ID) DO UPDATE SET
+			WINS=S.WINS+EXCLUDED.WINS, LOSSES=S.LOSSES+EXCLUDED.LOSSES,
+			MATCHES=S.MATCHES+EXCLUDED.MATCHES, BYES=S.BYES+EXCLUDED.BYES,
+			POINTS=S.POINTS+EXCLUDED.POINTS;
+		RETURN NULL;
+	END;
 
+$CORRECTSTANDINGS$ LANGUAGE PLPGSQL;
 
+CREATE TRIGGER STANDINGS_UPD
+	AFTER UPDATE ON MATCHES
+	REFERENCING OLD TABLE AS OLD_MATCHES NEW TABLE AS NEW_MATCHES
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE CORRECTSTANDINGS();
 
+CREATE OR REPLACE FUNCTION UPDATETIEBREAKS(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $UPDATETIEBREAKS$
+	-- This function updates in one statement the tie-breaks of all the players
+	-- of a tournament, from its matches and the current standings:
+	-- OPP_POINTS: sum of the points of the opponents
+	-- BUCHHOLZ: sum of the wins of the opponents
+	-- MEDIAN_BUCHHOLZ: Buchholz without the best and the worst opponent
+	-- SONNEBORN_BERGER: sum of the wins of the opponents defeated
+	-- CUMULATIVE: sum of the score after each round, a win in round r of R
+	--             rounds adds R-r+1 (a round bye counts as a win)
+	-- The statement is run by EXECUTE so it's planned with the value of the
+	-- tournament, and the UPDATE only touches the partition of the tournament
+	BEGIN
+	EXECUTE $TIEBREAKS$
+	WITH GAMES AS (
+		SELECT WINNER AS PLAYER_ID, LOSER AS OPPONENT, 1 AS WON FROM MATCHES
+			WHERE TOURNAMENT_ID=$1 AND LOSER>0
+		UNION ALL
+		SELECT LOSER, WINNER, 0 FROM MATCHES
+			WHERE TOURNAMENT_ID=$1 AND LOSER>0),
+	OPPONENTS AS (
+		SELECT G.PLAYER_ID, COUNT(1) AS TOT, SUM(S.POINTS) AS OPP_POINTS,
+			SUM(S.WINS) AS BUCHHOLZ, MAX(S.WINS) AS BEST, MIN(S.WINS) AS WORST,
+			SUM(S.WINS*G.WON) AS SONNEBORN_BERGER
+		FROM GAMES G, PLAYER_STANDINGS S
+		WHERE S.PLAYER_ID=G.OPPONENT AND S.TOURNAMENT_ID=$1
+		GROUP BY G.PLAYER_ID),
+	PROGRESS AS (
+		SELECT A.WINNER AS PLAYER_ID, SUM(B.LAST_ROUND-A.ROUND+1) AS CUMULATIVE
+		FROM MATCHES A, (SELECT MAX(ROUND) AS LAST_ROUND FROM MATCHES
+			WHERE TOURNAMENT_ID=$1) B
+		WHERE A.TOURNAMENT_ID=$1 AND A.LOSER>=0
+		GROUP BY A.WINNER),
+	TIEBREAKS AS (
+		SELECT COALESCE(O.PLAYER_ID,P.PLAYER_ID) AS PLAYER_ID,
+			COALESCE(O.OPP_POINTS,0) AS OPP_POINTS, COALESCE(O.BUCHHOLZ,0) AS BUCHHOLZ,
+			CASE WHEN O.TOT>2 THEN O.BUCHHOLZ-O.BEST-O.WORST
+				ELSE COALESCE(O.BUCHHOLZ,0) END AS MEDIAN_BUCHHOLZ,
+			COALESCE(O.SONNEBORN_BERGER,0) AS SONNEBORN_BERGER,
+			COALESCE(P.CUMULATIVE,0) AS CUMULATIVE
+		FROM OPPONENTS O FULL OUTER JOIN PROGRESS P ON (O.PLAYER_ID=P.PLAYER_ID))
+	UPDATE PLAYER_STANDINGS S SET OPP_POINTS=T.OPP_POINTS, BUCHHOLZ=T.BUCHHOLZ,
+		MEDIAN_BUCHHOLZ=T.MEDIAN_BUCHHOLZ, SONNEBORN_BERGER=T.SONNEBORN_BERGER,
+		CUMULATIVE=T.CUMULATIVE
+	FROM TIEBREAKS T
+	WHERE S.PLAYER_ID=T.PLAYER_ID AND S.TOURNAMENT_ID=$1
+	$TIEBREAKS$ USING P_TOURNAMENT_ID;
+	END;
+$UPDATETIEBREAKS$ LANGUAGE PLPGSQL;
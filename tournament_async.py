@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+#
+# tournament_async.py -- asyncio API of the Swiss-system tournament
+#
+
+import psycopg2
+import psycopg2.extensions
+import datetime
+import trollius as asyncio
+from trollius import From, Return
+import pairing
+import player
+import tournament
+
+
+class AsyncTournamentDb(object):
+
+    ''' Class object that implements the access to the database Tournament
+        from an event loop (trollius, the asyncio of python 2).
+        It keeps a pool of asynchronous connections of psycopg2, a query
+        waits on the socket of its connection, so a slow query doesn't stop
+        the other tournaments served by the same loop. The asynchronous
+        connections are always in autocommit mode.
+        The storage methods are coroutines with the statements and the rows
+        of tournament.TournamentDb (PREPARED_STATEMENTS, STORAGE_QUERIES).
+    '''
+
+    def __init__(self, dsn=tournament.DSN, pool_size=tournament.POOL_SIZE,
+                 loop=None):
+        ''' Args:
+              dsn: (string) the connection string of the database
+              pool_size: (int) the maximum number of connections
+              loop: the event loop, by default the current one
+        '''
+        self.statusConnect = False
+        self._dsn = dsn
+        self._pool_size = pool_size
+        self._loop = loop or asyncio.get_event_loop()
+        self._free = asyncio.Queue(loop=self._loop)
+        self._opened = 0
+
+    @asyncio.coroutine
+    def connect(self):
+        '''Opens the first connection, the others are opened on demand'''
+
+        connection = yield From(self._open())
+        self._free.put_nowait(connection)
+        self.statusConnect = True
+        print ('connection to DB is open')
+
+    @asyncio.coroutine
+    def _open(self):
+        self._opened += 1
+        try:
+            connection = psycopg2.connect(self._dsn, async_=1)
+            yield From(self._wait(connection))
+        except Exception:
+            self._opened -= 1
+            raise
+        raise Return(connection)
+
+    @asyncio.coroutine
+    def _wait(self, connection):
+        ''' Waits until the connection finished its operation, the socket
+            of the connection is watched by the event loop
+        '''
+        while True:
+            state = connection.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            future = asyncio.Future(loop=self._loop)
+            ready = lambda: future.done() or future.set_result(None)
+            fd = connection.fileno()
+            if state == psycopg2.extensions.POLL_READ:
+                self._loop.add_reader(fd, ready)
+                try:
+                    yield From(future)
+                finally:
+                    self._loop.remove_reader(fd)
+            elif state == psycopg2.extensions.POLL_WRITE:
+                self._loop.add_writer(fd, ready)
+                try:
+                    yield From(future)
+                finally:
+                    self._loop.remove_writer(fd)
+            else:
+                raise psycopg2.OperationalError(
+                    'poll() returned %s' % state)
+
+    @asyncio.coroutine
+    def _acquire(self):
+        if self._free.empty() and self._opened < self._pool_size:
+            connection = yield From(self._open())
+        else:
+            connection = yield From(self._free.get())
+        raise Return(connection)
+
+    def _release(self, connection):
+        if connection.closed:
+            self._opened -= 1
+        else:
+            self._free.put_nowait(connection)
+
+    @asyncio.coroutine
+    def dbQuery(self, query, data=None):
+        ''' Executes a statement, returns its rows (or None if the statement
+            doesn't return rows)
+        '''
+        connection = yield From(self._acquire())
+        try:
+            cursor = connection.cursor()
+            if data:
+                cursor.execute(query, data)
+            else:
+                cursor.execute(query)
+            yield From(self._wait(connection))
+            r = cursor.fetchall() if cursor.description else None
+            cursor.close()
+        finally:
+            self._release(connection)
+        raise Return(r)
+
+    @asyncio.coroutine
+    def findPlayer(self, name):
+        '''Returns the id of the player, 0 if it isn't registered'''
+
+        query = tournament.textStatement('find_player')
+        result = yield From(self.dbQuery(query, (name,)))
+        raise Return(result[0][0] if result else 0)
+
+    @asyncio.coroutine
+    def registerPlayer(self, trnmnt_id, name):
+        '''Registers a player to the tournament, new or already in PLAYERS,
+           see TournamentDb.registerPlayer
+
+        Returns:
+          The id of the player
+        '''
+        player_id = yield From(self.findPlayer(name))
+        if player_id > 0:
+            query = tournament.textStatement('update_last_tournament')
+            yield From(self.dbQuery(query, (trnmnt_id, player_id)))
+        else:
+            query = tournament.textStatement('insert_player')
+            result = yield From(self.dbQuery(query, (name, trnmnt_id)))
+            player_id = result[0][0]
+        raise Return(player_id)
+
+    @asyncio.coroutine
+    def insertMatch(self, trnmnt_id, round_, date_match, winner, loser):
+        '''Stores a match, the trigger of MATCHES updates the standings'''
+
+        query = tournament.textStatement('insert_match')
+        data = (trnmnt_id, round_, date_match, winner, loser)
+        yield From(self.dbQuery(query, data))
+
+    @asyncio.coroutine
+    def standings(self, trnmnt_id):
+        '''Returns the rows (id, name, wins, matches, byes, points, rank_ini)
+           in the order of F_STANDINGS, see TournamentStorage.standings
+        '''
+        query = tournament.STORAGE_QUERIES['standings']
+        result = yield From(self.dbQuery(query, (trnmnt_id,)))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def matchPairs(self, trnmnt_id):
+        query = tournament.STORAGE_QUERIES['match_pairs']
+        result = yield From(self.dbQuery(query, (trnmnt_id,)))
+        raise Return(result)
+
+    @asyncio.coroutine
+    def byePlayers(self, trnmnt_id):
+        query = tournament.STORAGE_QUERIES['bye_players']
+        result = yield From(self.dbQuery(query, (trnmnt_id,)))
+        raise Return(result)
+
+    def closeConnect(self):
+        ''' Close the connections to the database tournament'''
+
+        while not self._free.empty():
+            self._free.get_nowait().close()
+            self._opened -= 1
+        print 'Connection is closed'
+
+
+class AsyncSwiss(object):
+
+    ''' Asynchronous version of the swiss tournament for an event loop, it
+        serves a tournament already registered (see Tournament.setTournamentInfo).
+        Every statement is committed by itself (autocommit).
+    '''
+
+    def __init__(self, conn_trnmt_db, tournament_id, round_=1,
+                 pairing_engine=None):
+        ''' Args:
+              conn_trnmt_db: (AsyncTournamentDb) shared by the tournaments
+              tournament_id: (int) the id of the tournament
+              round_: (int) the next round to pair
+              pairing_engine: an object with the method pairRound,
+                              by default pairing.BlossomPairing
+        '''
+        self.conn_trnmt_db = conn_trnmt_db
+        self._tournament_id = tournament_id
+        self._round = round_
+        self._pairing_engine = pairing_engine or pairing.BlossomPairing()
+        self._match_history = None
+
+    @asyncio.coroutine
+    def registerPlayer(self, name):
+        '''Adds a player to the tournament database, see Tournament
+
+        Returns:
+          The id of the player
+        '''
+        player_id = yield From(self.conn_trnmt_db.registerPlayer(
+            self._tournament_id, name))
+        raise Return(player_id)
+
+    @asyncio.coroutine
+    def reportMatch(self, winner, loser, round_=None, date_match=None):
+        '''Records the outcome of a single match between two players'''
+
+        yield From(self.conn_trnmt_db.insertMatch(
+            self._tournament_id, round_, date_match, winner, loser))
+        if self._match_history is not None:
+            self._match_history.add(pairing.pairKey(winner, loser))
+
+    @asyncio.coroutine
+    def playerStandings(self):
+        '''Returns a list of the players and their win records, sorted by
+           wins, see Tournament.playerStandings
+        '''
+        result = yield From(self.conn_trnmt_db.standings(self._tournament_id))
+        raise Return([tournament.PlayerStandings._make(row[:4])
+                      for row in result])
+
+    @asyncio.coroutine
+    def swissPairings(self):
+        '''Returns a list of pairs of players for the next round of a match,
+           see Swiss.swissPairings. The standings, the history and the byes
+           are queried at the same time
+        '''
+        standings, history, byes = yield From(asyncio.gather(
+            self.conn_trnmt_db.standings(self._tournament_id),
+            self.conn_trnmt_db.matchPairs(self._tournament_id),
+            self.conn_trnmt_db.byePlayers(self._tournament_id),
+            loop=self.conn_trnmt_db._loop))
+        self._match_history = set(pairing.pairKey(w, l) for w, l in history)
+        # the rows of F_STANDINGS are in the order of the in-memory
+        # standings of Swiss (standingsKey), with the byes and the points
+        pairs, player_bye = self._pairing_engine.pairRound(
+            player.PlayerTable(row[:6] for row in standings),
+            self._match_history, set(row[0] for row in byes))
+        if player_bye is not None:
+            current_date = datetime.datetime.now().replace(microsecond=0)
+            yield From(self.reportMatch(player_bye.getPlayerId(), 0,
+                                        self._round, current_date))
+        pairings = [(p1.getPlayerId(), p1.getName(),
+                     p2.getPlayerId(), p2.getName()) for p1, p2 in pairs]
+        self._round += 1
+        raise Return(pairings)
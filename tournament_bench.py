@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+#
+# tournament_bench.py -- benchmarks of the tournament database
+#
+# Run it against a database created with tournament.sql, it inserts and
+# deletes benchmark rows, so don't use the database of real tournaments:
+#     python tournament_bench.py standings [--dsn DSN] [--tournaments N]
+#                                          [--players N]
+#     python tournament_bench.py lifecycle [--dsn DSN] [--sizes 16 1024 ...]
+#                                          [--seed N] [--output FILE] [--stats]
+#                                          [--memory]
+
+import argparse
+import contextlib
+import datetime
+import json
+import platform
+import random
+import time
+import tournament
+import tournament_memory
+
+BENCH_DSN = 'dbname=tournament_bench'
+FIELD_SIZES = (16, 128, 1024, 10000, 100000)
+
+
+def populateHistory(db, tournaments, players):
+    ''' Inserts tournaments of history with their players and standings,
+        using set-based statements (generate_series)
+
+    Args:
+      db: (TournamentDb) the connection to the database
+      tournaments: (int) the number of tournaments to insert
+      players: (int) the players of each tournament
+    Returns:
+      ids: (list) the ids of the new tournaments
+    '''
+    query = '''INSERT INTO TOURNAMENT (TOURNAMENT_ID, TOURNAMENT_NAME, \
+            NUMBER_PARTICIPANTS) SELECT nextval('ID_TOURNAMENT_SEQUENCE'), \
+            'benchmark ' || G, %s FROM generate_series(1, %s) G \
+            RETURNING TOURNAMENT_ID'''
+    ids = [r[0] for r in db.dbExecute(query, (players, tournaments))]
+    # the trigger registers the players to the first tournament
+    query = '''INSERT INTO PLAYERS (PLAYER_ID, FULL_NAME, LAST_TRNMNT_RGSTRD) \
+            SELECT nextval('id_player_sequence'), 'benchmark player ' || G, %s \
+            FROM generate_series(1, %s) G RETURNING PLAYER_ID'''
+    player_ids = [r[0] for r in db.dbExecute(query, (ids[0], players))]
+    query = 'INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID, RANK_INI, RANK_FIN, \
+            TOURNAMENT_ID) SELECT P, 0, 0, T FROM UNNEST(%s::INTEGER[]) P, \
+            UNNEST(%s::INTEGER[]) T ON CONFLICT DO NOTHING'
+    db.dbExecute(query, (player_ids, ids))
+    query = 'INSERT INTO PLAYER_STANDINGS (PLAYER_ID, WINS, LOSSES, TIEDS, \
+            MATCHES, BYES, POINTS, TOURNAMENT_ID) \
+            SELECT PLAYER_ID, W, 6-W, 0, 6, 0, W*3, TOURNAMENT_ID FROM \
+            (SELECT PLAYER_ID, TOURNAMENT_ID, (random()*6)::INTEGER AS W \
+            FROM PLAYERS_TOURNAMENT WHERE TOURNAMENT_ID = ANY(%s)) A'
+    db.dbExecute(query, (ids,))
+    db.commit()
+    db.dbStatementCommit('ANALYZE')
+    return ids
+
+
+def timeQuery(db, query, data, repeat=20):
+    ''' Returns the average time (ms) of a query '''
+    db.dbQuery(query, data)  # warm up
+    start_time = time.time()
+    for i in xrange(repeat):
+        db.dbQuery(query, data)
+    return (time.time() - start_time) * 1000.0 / repeat
+
+
+def benchStandings(db, tournaments=1000, players=64, steps=(10, 100, 1000)):
+    ''' Compares the standings of one tournament read from V_STANDINGS
+        (global view) and F_STANDINGS (tournament-scoped function) while
+        the history grows until the given number of tournaments
+    '''
+    print 'Standings of one tournament (%s players), average ms' % players
+    print 'TOURNAMENTS\tV_STANDINGS\tF_STANDINGS'
+    stored = 0
+    ids = list()
+    for step in steps:
+        if step > tournaments:
+            break
+        ids.extend(populateHistory(db, step - stored, players))
+        stored = step
+        view_ms = timeQuery(db, 'SELECT PLAYER_ID, FULL_NAME, WINS, MATCHES \
+            FROM V_STANDINGS WHERE TOURNAMENT_ID=%s \
+            ORDER BY WINS DESC, BYES DESC, POINTS DESC', (ids[-1],))
+        func_ms = timeQuery(db, 'SELECT PLAYER_ID, FULL_NAME, WINS, MATCHES \
+            FROM F_STANDINGS(%s)', (ids[-1],))
+        print '%s\t\t%.3f\t\t%.3f' % (stored, view_ms, func_ms)
+
+
+def benchPrepared(db, statements=10000):
+    ''' Compares the hot statements of PREPARED_STATEMENTS sent as text and
+        executed prepared (see TournamentDb.dbPrepared), the time by
+        statement in milliseconds. The writes are rolled back
+    '''
+    runs = (('insertMatch', lambda i: db.insertMatch(0, 1, None, i, -1)),
+            ('findPlayer', lambda i: db.findPlayer('Unknown Player %s' % i)))
+    print 'STATEMENT\t\tTEXT (ms)\tPREPARED (ms)'
+    for name, run in runs:
+        times = list()
+        for prepared in (False, True):
+            db.setPrepared(prepared)
+            # the statement is prepared before the timing, its key 0 isn't
+            # used again in the round of the timed matches
+            run(0)
+            start_time = time.time()
+            for i in xrange(1, statements + 1):
+                run(i)
+            times.append((time.time() - start_time) * 1000 / statements)
+            db.rollback()
+        print '%-16s\t%.4f\t\t%.4f' % (name, times[0], times[1])
+    db.setPrepared(True)
+
+
+@contextlib.contextmanager
+def timePhase(phases, name, db):
+    ''' Adds the time (seconds) and the round trips to the database of the
+        block to the phase name of phases
+    '''
+    phase = phases.setdefault(name, {'seconds': 0.0, 'round_trips': 0})
+    round_trips = db.roundTrips()
+    start_time = time.time()
+    yield phase
+    phase['seconds'] += time.time() - start_time
+    phase['round_trips'] += db.roundTrips() - round_trips
+
+
+def reportResults(swiss, pairings, round_, rng):
+    ''' Reports the matches of the pairings, the winner of each match is
+        chosen by the seeded generator rng
+    '''
+    for id1, name1, id2, name2 in pairings:
+        if rng.random() < 0.5:
+            swiss.reportMatch(id1, id2, round_)
+        else:
+            swiss.reportMatch(id2, id1, round_)
+    swiss.commitTournament()
+
+
+def benchLifecycle(dsn, participants, seed=0, stats=False, memory=False):
+    ''' Runs a whole tournament of participants players: registration,
+        initial ranking, the swiss rounds, the cut and the knockout phase.
+        The names, the initial ranking and the results come from the seed,
+        so two runs with the same seed play the same tournament
+
+    Args:
+      stats: (bool) records the statements of each API method, see
+             TournamentDb.enableStats
+      memory: (bool) runs without database, on MemoryTournamentDb
+    Returns:
+      A dict with the time and the round trips of each phase, and of each
+      swiss round
+    '''
+    rng = random.Random(seed)
+    storage = tournament_memory.MemoryTournamentDb() if memory else None
+    swiss = tournament.Swiss(dsn=dsn, storage=storage)
+    db = swiss.conn_trnmt_db
+    stats = stats and not memory
+    # the players of a previous run would be registered as known players
+    db.deleteMatches()
+    db.deletePlayers()
+    if stats:
+        db.enableStats()
+    tournament_id = db.nextTournamentId()
+    swiss.setTournamentInfo([tournament_id, 'benchmark %s' % participants,
+                             'benchmark', datetime.date.today(),
+                             datetime.date.today(), participants])
+    phases = dict()
+    rounds = list()
+    with timePhase(phases, 'registerPlayer', db):
+        for i in xrange(participants):
+            swiss.registerPlayer('Benchmark Player %06d' % i)
+    with timePhase(phases, 'rankingInit', db):
+        swiss.rankingInit(seed=seed)
+    for round_ in xrange(1, swiss._total_rounds + 1):
+        swiss_round = dict()
+        with timePhase(swiss_round, 'swissPairings', db):
+            pairings = swiss.swissPairings()
+        with timePhase(swiss_round, 'reportMatch', db):
+            reportResults(swiss, pairings, round_, rng)
+        with timePhase(swiss_round, 'playerStandings', db):
+            swiss.playerStandings()
+        for name, phase in swiss_round.iteritems():
+            total = phases.setdefault(name, {'seconds': 0.0, 'round_trips': 0})
+            total['seconds'] += phase['seconds']
+            total['round_trips'] += phase['round_trips']
+        swiss_round['round'] = round_
+        rounds.append(swiss_round)
+    with timePhase(phases, 'topEightPlayers', db):
+        swiss.topEightPlayers()
+    with timePhase(phases, 'knockout', db):
+        round_ = swiss._total_rounds + 1
+        for i in xrange(swiss._rounds_single):
+            reportResults(swiss, swiss.siglePairingElimination(), round_, rng)
+            round_ += 1
+        swiss.setWinnerTournament()
+    result = {'players': participants,
+              'swiss_rounds': swiss._total_rounds,
+              'top_players': swiss._top_players,
+              'phases': phases,
+              'rounds': rounds}
+    if stats:
+        result['stats'] = db.getStats()
+        db.disableStats()
+    swiss.closeTournament()
+    return result
+
+
+def benchLifecycles(dsn, sizes=FIELD_SIZES, seed=0, output=None,
+                    stats=False, memory=False):
+    ''' Runs benchLifecycle for each field size, prints the phases and
+        writes the results as JSON to the file output
+    '''
+    results = list()
+    for participants in sizes:
+        result = benchLifecycle(dsn, participants, seed, stats, memory)
+        results.append(result)
+        print 'Field of %s players, %s swiss rounds, top %s' % (
+            participants, result['swiss_rounds'], result['top_players'])
+        print 'PHASE\t\t\tSECONDS\t\tROUND TRIPS'
+        for name, phase in sorted(result['phases'].iteritems()):
+            print '%-16s\t%.3f\t\t%s' % (name, phase['seconds'],
+                                          phase['round_trips'])
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'seed': seed,
+                       'date': datetime.datetime.now().isoformat(),
+                       'python': platform.python_version(),
+                       'results': results}, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of the tournament database')
+    parser.add_argument('--dsn', default=BENCH_DSN)
+    commands = parser.add_subparsers(dest='command')
+    standings = commands.add_parser(
+        'standings', help='standings read while the history grows')
+    standings.add_argument('--tournaments', type=int, default=1000)
+    standings.add_argument('--players', type=int, default=64)
+    prepared = commands.add_parser(
+        'prepared', help='hot statements as text and prepared')
+    prepared.add_argument('--statements', type=int, default=10000)
+    lifecycle = commands.add_parser(
+        'lifecycle', help='phases of whole tournaments by field size')
+    lifecycle.add_argument('--sizes', type=int, nargs='+',
+                           default=list(FIELD_SIZES))
+    lifecycle.add_argument('--seed', type=int, default=0)
+    lifecycle.add_argument('--output', default='bench_results.json',
+                           help='file of the JSON results')
+    lifecycle.add_argument('--stats', action='store_true',
+                           help='add the statements of each API method')
+    lifecycle.add_argument('--memory', action='store_true',
+                           help='run without database (MemoryTournamentDb)')
+    args = parser.parse_args()
+    if args.command == 'standings':
+        db = tournament.TournamentDb(args.dsn)
+        db.connect()
+        benchStandings(db, args.tournaments, args.players)
+        db.closeConnect()
+    elif args.command == 'prepared':
+        db = tournament.TournamentDb(args.dsn)
+        db.connect()
+        benchPrepared(db, args.statements)
+        db.closeConnect()
+    else:
+        benchLifecycles(args.dsn, args.sizes, args.seed, args.output,
+                        args.stats, args.memory)
@@ -0,0 +1,481 @@
+#!/usr/bin/env python
+#
+# tournament_memory.py -- in-memory storage of the Swiss-system tournament
+#
+
+import collections
+import pairing
+import tournament
+
+# columns of a row of standings, the same of PLAYER_STANDINGS
+WINS, LOSSES, TIEDS, MATCHES, BYES, POINTS = range(6)
+TIE_BREAK_COLUMN = dict((rule, 6 + i)
+                        for i, rule in enumerate(tournament.TIE_BREAKS[:-1]))
+TIE_BREAK_COLUMN['POINTS'] = POINTS
+
+_MISSING = object()
+
+
+def descending(value):
+    ''' Sort key of a column in descending order, the nulls first as
+        PostgreSQL does with DESC
+    '''
+    return (0,) if value is None else (1, -value)
+
+
+class MemoryTournamentDb(tournament.TournamentStorage):
+
+    ''' Storage of the tournaments in memory, without database.
+
+        It keeps the same tables of tournament.sql in dicts, and applies in
+        Python the rules of the triggers: the players are registered to their
+        last tournament (REGPLAYERTOURNAMENT), the standings are updated by
+        each match (UPDATESTANDINGS) and the tie-breaks are computed by
+        updateTieBreaks (UPDATETIEBREAKS). A rollback undoes the writes since
+        the last commit, the sequences are not undone (as in PostgreSQL).
+        An instance is not shared between threads.
+    '''
+
+    def __init__(self):
+        self.statusConnect = False
+        self._generation = 0
+        self._player_seq = 101  # ID_PLAYER_SEQUENCE
+        self._tournament_seq = 10001  # ID_TOURNAMENT_SEQUENCE
+        self._tournaments = dict()  # id --> {column: value}
+        self._players = dict()  # player_id --> [full_name, last_trnmnt, rating]
+        self._player_ids = dict()  # full_name --> lowest player_id
+        # trnmnt_id --> {player_id: [rank_ini, rank_fin]}
+        self._players_trnmnt = collections.defaultdict(dict)
+        # trnmnt_id --> [(round, date_match, winner, loser)]
+        self._matches = collections.defaultdict(list)
+        # trnmnt_id --> {(round, lowest, highest): True}, the unique index
+        # MATCHES_IDX02
+        self._match_keys = collections.defaultdict(dict)
+        # trnmnt_id --> {player_id: [wins, losses, tieds, matches, byes,
+        # points, opp_points, buchholz, median_buchholz, sonneborn_berger,
+        # cumulative]}
+        self._standings = collections.defaultdict(dict)
+        self._watermarks = dict()  # journal_id --> seq
+        # trnmnt_id --> (matches, standings) of the archived tournaments
+        self._archive = dict()
+        self._undo = list()
+
+    def connect(self):
+        self.statusConnect = True
+
+    def closeConnect(self):
+        self.rollback()
+
+    def commit(self):
+        del self._undo[:]
+
+    def rollback(self):
+        while self._undo:
+            container, key, value = self._undo.pop()
+            if isinstance(container, list):
+                del container[value:]
+            elif value is _MISSING:
+                del container[key]
+            else:
+                container[key] = value
+
+    def remember(self, container, key):
+        ''' Keeps the value of container[key] to be restored by rollback '''
+        value = container.get(key, _MISSING)
+        if isinstance(value, list):
+            value = list(value)
+        self._undo.append((container, key, value))
+
+    def rememberList(self, rows):
+        ''' Keeps the length of rows, the appended rows are removed by
+            rollback
+        '''
+        self._undo.append((rows, None, len(rows)))
+
+    def roundTrips(self):
+        return 0
+
+    def deleteMatches(self):
+        # as TRUNCATE MATCHES, the standings are kept
+        self._matches.clear()
+        self._match_keys.clear()
+        self.commit()
+        self._generation += 1
+
+    def deletePlayers(self):
+        self._players.clear()
+        self._player_ids.clear()
+        self._players_trnmnt.clear()
+        self._standings.clear()
+        self.commit()
+        self._generation += 1
+
+    def purgeTournament(self, trnmnt_id):
+        # as PURGETOURNAMENT, the players are kept without last tournament
+        for row in self._players.itervalues():
+            if row[1] == trnmnt_id:
+                row[1] = None
+        self._tournaments.pop(trnmnt_id, None)
+        self._players_trnmnt.pop(trnmnt_id, None)
+        self._matches.pop(trnmnt_id, None)
+        self._match_keys.pop(trnmnt_id, None)
+        self._standings.pop(trnmnt_id, None)
+        self.commit()
+        self._generation += 1
+
+    def archiveTournament(self, trnmnt_id):
+        # as ARCHIVETOURNAMENT, the matches and the standings are moved
+        self._archive[trnmnt_id] = (self._matches.pop(trnmnt_id, list()),
+                                    self._standings.pop(trnmnt_id, dict()))
+        self._match_keys.pop(trnmnt_id, None)
+        self.commit()
+        self._generation += 1
+
+    def countPlayers(self):
+        return len(self._players)
+
+    def tournamentExists(self, trnmnt_id):
+        return trnmnt_id in self._tournaments
+
+    def nextTournamentId(self):
+        self._tournament_seq += 1
+        return self._tournament_seq - 1
+
+    def insertTournament(self, settings):
+        if settings[0] in self._tournaments:
+            raise ValueError('The tournament %s already exists' % settings[0])
+        self._tournaments[settings[0]] = dict(zip(
+            ('name', 'place', 'start_date', 'end_date', 'participants'),
+            settings[1:6]))
+        self.commit()
+
+    def tournamentState(self, trnmnt_id):
+        if trnmnt_id not in self._tournaments:
+            return None
+        tournament = self._tournaments[trnmnt_id]
+        # ORDER BY ROUND, the nulls last
+        matches = sorted(self._matches[trnmnt_id],
+                         key=lambda match: (match[0] is None, match[0]))
+        return {'participants': tournament['participants'],
+                'bracket': tournament.get('bracket'),
+                'standings': self.standings(trnmnt_id),
+                'matches': [(r, w, l) for r, d, w, l in matches]}
+
+    def findPlayer(self, name):
+        return self._player_ids.get(name, 0)
+
+    def registerToTournament(self, trnmnt_id, player_id):
+        ''' Sets the last tournament of the player and registers it to the
+            tournament, as the trigger REGPLAYERTOURNAMENT
+        '''
+        self.remember(self._players, player_id)
+        self._players[player_id][1] = trnmnt_id
+        players = self._players_trnmnt[trnmnt_id]
+        if player_id not in players:
+            self.remember(players, player_id)
+            players[player_id] = [0, 0]
+
+    def newPlayer(self, trnmnt_id, name):
+        player_id = self._player_seq
+        self._player_seq += 1
+        self.remember(self._players, player_id)
+        self._players[player_id] = [name, trnmnt_id, None]
+        if name not in self._player_ids:
+            self.remember(self._player_ids, name)
+            self._player_ids[name] = player_id
+        self.registerToTournament(trnmnt_id, player_id)
+        return player_id
+
+    def registerPlayer(self, trnmnt_id, name):
+        player_id = self.findPlayer(name)
+        if player_id > 0:
+            self.registerToTournament(trnmnt_id, player_id)
+        else:
+            player_id = self.newPlayer(trnmnt_id, name)
+        self.commit()
+        return player_id
+
+    def registerPlayers(self, trnmnt_id, names):
+        player_ids = dict()
+        for name in names:
+            if name not in player_ids:
+                player_id = self.findPlayer(name)
+                if player_id > 0:
+                    self.registerToTournament(trnmnt_id, player_id)
+                else:
+                    player_id = self.newPlayer(trnmnt_id, name)
+                player_ids[name] = player_id
+        self.commit()
+        return player_ids
+
+    def tournamentPlayerIds(self, trnmnt_id):
+        return sorted(self._players_trnmnt[trnmnt_id])
+
+    def setRankingInit(self, trnmnt_id, player_ids):
+        players = self._players_trnmnt[trnmnt_id]
+        for rank, player_id in enumerate(player_ids, 1):
+            if player_id in players:
+                players[player_id][0] = rank
+        self.commit()
+
+    def setRatings(self, ratings):
+        for player_id, rating in ratings.iteritems():
+            if player_id in self._players:
+                self.remember(self._players, player_id)
+                self._players[player_id][2] = rating
+        self.commit()
+
+    def setRankingByRating(self, trnmnt_id):
+        # ORDER BY RATING DESC NULLS LAST, PLAYER_ID
+        def ratingKey(player_id):
+            rating = self._players[player_id][2]
+            return (rating is None, -rating if rating is not None else 0,
+                    player_id)
+        self.setRankingInit(trnmnt_id, sorted(
+            self._players_trnmnt[trnmnt_id], key=ratingKey))
+
+    def insertMatch(self, trnmnt_id, round_, date_match, winner, loser):
+        self.insertMatches(trnmnt_id, round_, date_match, [(winner, loser)])
+
+    def insertMatches(self, trnmnt_id, round_, date_match, results,
+                      skip_stored=False):
+        matches = self._matches[trnmnt_id]
+        standings = self._standings[trnmnt_id]
+        keys = self._match_keys[trnmnt_id]
+        # as the unique index MATCHES_IDX02 the statement fails as a whole
+        # (or skips the duplicates, ON CONFLICT DO NOTHING), a null round is
+        # never a duplicate
+        if round_ is not None:
+            new_keys = [(round_,) + pairing.pairKey(w, l) for w, l in results]
+            if skip_stored:
+                kept = list()
+                for key, result in zip(new_keys, results):
+                    if key not in keys:
+                        self.remember(keys, key)
+                        keys[key] = True
+                        kept.append(result)
+                results = kept
+            elif (len(set(new_keys)) < len(new_keys) or
+                    any(key in keys for key in new_keys)):
+                raise ValueError('Duplicate match of round %s in the '
+                                 'tournament %s' % (round_, trnmnt_id))
+            else:
+                for key in new_keys:
+                    self.remember(keys, key)
+                    keys[key] = True
+        self.rememberList(matches)
+        for winner, loser in results:
+            matches.append((round_, date_match, winner, loser))
+            # the rules of the trigger UPDATESTANDINGS
+            if loser < 0:
+                continue
+            bye = 1 if loser == 0 else 0
+            points = 0 if bye else round_
+            self.addStandings(standings, winner, 1, 0, bye, points)
+            if loser > 0:
+                self.addStandings(standings, loser, 0, 1, 0, 0)
+
+    def addStandings(self, standings, player_id, wins, losses, byes, points):
+        self.remember(standings, player_id)
+        row = standings.get(player_id)
+        if row is None:
+            standings[player_id] = [wins, losses, 0, 1, byes, points,
+                                    0, 0, 0, 0, 0]
+            return
+        row[WINS] += wins
+        row[LOSSES] += losses
+        row[MATCHES] += 1
+        row[BYES] += byes
+        if row[POINTS] is None or points is None:
+            row[POINTS] = None
+        else:
+            row[POINTS] += points
+
+    def upsertMatches(self, trnmnt_id, round_, date_match, results):
+        if self._undo:
+            raise ValueError('The reports of the tournament %s need their '
+                             'own transaction, commit or rollback the open '
+                             'one first' % trnmnt_id)
+        matches = self._matches[trnmnt_id]
+        standings = self._standings[trnmnt_id]
+        stored = dict((pairing.pairKey(w, l), i)
+                      for i, (r, d, w, l) in enumerate(matches) if r == round_)
+        reports = collections.OrderedDict(
+            (pairing.pairKey(w, l), (w, l)) for w, l in results)
+        rows = list()
+        for key, (winner, loser) in reports.iteritems():
+            i = stored.get(key)
+            if i is None:
+                self.insertMatches(trnmnt_id, round_, date_match,
+                                   [(winner, loser)])
+                stored[key] = len(matches) - 1
+                rows.append((winner, loser, True))
+                continue
+            old_winner, old_loser = matches[i][2:]
+            if old_winner == winner:
+                continue
+            # the rules of the trigger CORRECTSTANDINGS
+            for player_id, won, sign in ((old_winner, 1, -1), (old_loser, 0, -1),
+                                         (winner, 1, 1), (loser, 0, 1)):
+                if player_id <= 0:
+                    continue
+                self.remember(standings, player_id)
+                row = standings[player_id]
+                row[WINS] += sign * won
+                row[LOSSES] += sign * (1 - won)
+                if won and row[POINTS] is not None and round_ is not None:
+                    row[POINTS] += sign * round_
+            matches[i] = (round_, date_match, winner, loser)
+            rows.append((winner, loser, False))
+        self.commit()
+        return rows
+
+    def journalWatermark(self, journal_id):
+        return self._watermarks.get(journal_id, 0)
+
+    def setJournalWatermark(self, journal_id, seq):
+        self.remember(self._watermarks, journal_id)
+        self._watermarks[journal_id] = max(seq,
+                                           self.journalWatermark(journal_id))
+
+    def matchPairs(self, trnmnt_id):
+        return [(w, l) for r, d, w, l in self._matches[trnmnt_id]]
+
+    def byePlayers(self, trnmnt_id):
+        byes = [(r, w) for r, d, w, l in self._matches[trnmnt_id] if l == 0]
+        byes.sort(key=lambda bye: descending(bye[0]))
+        return [(w,) for r, w in byes]
+
+    def standings(self, trnmnt_id):
+        standings = self._standings[trnmnt_id]
+        rows = list()
+        for player_id, (rank_ini, rank_fin) in \
+                self._players_trnmnt[trnmnt_id].iteritems():
+            row = standings.get(player_id)
+            if row is None:
+                rows.append((player_id, self._players[player_id][0], 0, 0,
+                             None, None, rank_ini))
+            else:
+                rows.append((player_id, self._players[player_id][0],
+                             row[WINS], row[MATCHES], row[BYES], row[POINTS],
+                             rank_ini))
+        rows.sort(key=tournament.standingsKey)
+        return rows
+
+    def storedStandings(self, trnmnt_id):
+        return [(player_id, row[WINS], row[MATCHES], row[BYES], row[POINTS])
+                for player_id, row in self._standings[trnmnt_id].iteritems()]
+
+    def streamStandings(self, trnmnt_id, fetch_size):
+        # the rows are already in memory
+        return iter(self.standings(trnmnt_id))
+
+    def streamMatches(self, trnmnt_id, fetch_size):
+        trnmnt_ids = (sorted(self._matches) if trnmnt_id is None
+                      else [trnmnt_id])
+        for trnmnt_id in trnmnt_ids:
+            for round_, date_match, winner, loser in self._matches[trnmnt_id]:
+                yield (trnmnt_id, round_, date_match, winner, loser)
+
+    def exportStandings(self, trnmnt_id, output, fmt):
+        players = self._players_trnmnt[trnmnt_id]
+        rows = (row + (players[row[0]][1],) for row in
+                self.standings(trnmnt_id))
+        tournament.writeRows(rows, tournament.STANDINGS_COLUMNS, output, fmt)
+
+    def exportMatches(self, trnmnt_id, output, fmt, round_=None):
+        rows = (row for row in self.streamMatches(trnmnt_id, None)
+                if round_ is None or row[1] == round_)
+        tournament.writeRows(rows, tournament.MATCHES_COLUMNS, output, fmt)
+
+    def updateTieBreaks(self, trnmnt_id):
+        standings = self._standings[trnmnt_id]
+        matches = self._matches[trnmnt_id]
+        opponents = collections.defaultdict(list)  # player --> [(opp, won)]
+        cumulative = collections.defaultdict(int)
+        last_round = max([r for r, d, w, l in matches if r is not None] or
+                         [None])
+        for round_, date_match, winner, loser in matches:
+            if loser > 0:
+                opponents[winner].append((loser, 1))
+                opponents[loser].append((winner, 0))
+            if loser >= 0 and round_ is not None:
+                cumulative[winner] += last_round - round_ + 1
+        for player_id, row in standings.iteritems():
+            games = [(standings[o], won) for o, won in opponents[player_id]
+                     if o in standings]
+            wins = [opp[WINS] for opp, won in games]
+            # SUM of SQL skips the nulls, it's null if all of them are null
+            points = [opp[POINTS] for opp, won in games
+                      if opp[POINTS] is not None]
+            buchholz = sum(wins)
+            self.remember(standings, player_id)
+            row[6] = sum(points) if points or not games else None
+            row[7] = buchholz
+            row[8] = (buchholz - max(wins) - min(wins) if len(wins) > 2
+                      else buchholz)
+            row[9] = sum(opp[WINS] for opp, won in games if won)
+            row[10] = cumulative[player_id]
+
+    def rankingKey(self, trnmnt_id, tie_breaks):
+        ''' Returns the sort key of the final ranking of a tournament: wins
+            and tie_breaks (descending), then the initial ranking
+        '''
+        players = self._players_trnmnt[trnmnt_id]
+        columns = [TIE_BREAK_COLUMN[rule] for rule in tie_breaks]
+
+        def key(item):
+            player_id, row = item
+            return ([descending(row[WINS])] +
+                    [descending(row[c]) for c in columns] +
+                    [players[player_id][0]])
+        return key
+
+    def finalRanking(self, trnmnt_id, tie_breaks):
+        columns = [TIE_BREAK_COLUMN[rule] for rule in tie_breaks]
+        ranking = sorted(self._standings[trnmnt_id].iteritems(),
+                         key=self.rankingKey(trnmnt_id, tie_breaks))
+        return [(player_id, self._players[player_id][0], row[WINS]) +
+                tuple(row[c] for c in columns) for player_id, row in ranking]
+
+    def cutTopPlayers(self, trnmnt_id, tie_breaks, top_players):
+        # all the players of the tournament, the ones without standings
+        # after the others with 0 wins
+        players = self._players_trnmnt[trnmnt_id]
+        standings = self._standings[trnmnt_id]
+        key = self.rankingKey(trnmnt_id, tie_breaks)
+        field = [(player_id, standings[player_id])
+                 for player_id in players if player_id in standings]
+        missing = sorted((players[player_id][0], player_id)
+                         for player_id in players if player_id not in standings)
+        ranking = sorted(field, key=key) + [(player_id, None)
+                                            for rank_ini, player_id in missing]
+        cut = list()
+        for rank, (player_id, row) in enumerate(ranking, 1):
+            rank_fin = rank if rank <= top_players else 0
+            if rank_fin or players[player_id][1]:
+                self.remember(players, player_id)
+                players[player_id][1] = rank_fin
+            if rank_fin:
+                cut.append((rank_fin, row[WINS] if row else 0, player_id,
+                            self._players[player_id][0]))
+        return cut
+
+    def cutPlayers(self, trnmnt_id, top_players):
+        cut = sorted((rank_fin, player_id) for player_id, (rank_ini, rank_fin)
+                     in self._players_trnmnt[trnmnt_id].iteritems()
+                     if 0 < rank_fin <= top_players)
+        return [(player_id, self._players[player_id][0])
+                for rank_fin, player_id in cut]
+
+    def saveBracket(self, trnmnt_id, document):
+        self._tournaments[trnmnt_id]['bracket'] = document
+        self.commit()
+
+    def loadBracket(self, trnmnt_id):
+        return self._tournaments.get(trnmnt_id, {}).get('bracket')
+
+    def setWinner(self, trnmnt_id, winner, second_place, document):
+        self._tournaments[trnmnt_id].update(
+            winner=winner, second_place=second_place, bracket=document)
+        self.commit()
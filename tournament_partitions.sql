@@ -0,0 +1,359 @@
+-- Migration of a database created with a previous tournament.sql (since the
+-- first version of the project) to the current schema, with the tables
+-- partitioned by tournament (PostgreSQL 11 or later):
+--     psql tournament -f tournament_partitions.sql
+--
+-- It's self-contained, in one transaction: the missing columns and tables
+-- are added, every function and trigger of tournament.sql is created again,
+-- and MATCHES and PLAYER_STANDINGS are created again as partitioned tables,
+-- with a partition by tournament of TOURNAMENT. The rows are copied by
+-- column name, the standings as they are and the tie-breaks computed again
+-- by UPDATETIEBREAKS; the trigger STANDINGS is created after the copy of the
+-- matches. A match reported twice in a round (the same pair) breaks
+-- MATCHES_IDX02 and the migration is rolled back.
+
+BEGIN;
+
+-- the columns and tables added after the first version
+ALTER TABLE TOURNAMENT ADD COLUMN IF NOT EXISTS BRACKET JSON;
+ALTER TABLE PLAYERS ADD COLUMN IF NOT EXISTS RATING DOUBLE PRECISION;
+CREATE TABLE IF NOT EXISTS JOURNAL_WATERMARK (
+	JOURNAL_ID TEXT PRIMARY KEY,
+	SEQ BIGINT NOT NULL);
+CREATE SCHEMA IF NOT EXISTS ARCHIVE;
+
+-- the registration of the players, a row trigger in the first version
+DROP TRIGGER IF EXISTS PLAYERTOURNAMENT ON PLAYERS;
+DROP TRIGGER IF EXISTS PLAYERTOURNAMENT_UPD ON PLAYERS;
+
+CREATE OR REPLACE FUNCTION REGPLAYERTOURNAMENT() RETURNS TRIGGER AS $REGPLAYERTOURNAMENT$
+	BEGIN
+	-- Statement trigger, it registers to their last tournament all the players
+	-- inserted by the statement (NEW_PLAYERS), in a single insert. An update
+	-- only registers the players whose LAST_TRNMNT_RGSTRD changed (OLD_PLAYERS
+	-- joined to NEW_PLAYERS): a transition table can't be used with UPDATE OF
+	-- LAST_TRNMNT_RGSTRD, and another update (e.g. a new RATING) mustn't
+	-- register again a player to a purged tournament
+
+		IF TG_OP = 'INSERT' THEN
+			INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID,RANK_INI,RANK_FIN,TOURNAMENT_ID)
+				SELECT PLAYER_ID,0,0,LAST_TRNMNT_RGSTRD FROM NEW_PLAYERS
+				WHERE LAST_TRNMNT_RGSTRD IS NOT NULL
+				ON CONFLICT (PLAYER_ID,TOURNAMENT_ID) DO NOTHING;
+		ELSE
+			INSERT INTO PLAYERS_TOURNAMENT (PLAYER_ID,RANK_INI,RANK_FIN,TOURNAMENT_ID)
+				SELECT N.PLAYER_ID,0,0,N.LAST_TRNMNT_RGSTRD
+				FROM NEW_PLAYERS N JOIN OLD_PLAYERS O ON (O.PLAYER_ID=N.PLAYER_ID)
+				WHERE N.LAST_TRNMNT_RGSTRD IS NOT NULL
+				AND N.LAST_TRNMNT_RGSTRD IS DISTINCT FROM O.LAST_TRNMNT_RGSTRD
+				ON CONFLICT (PLAYER_ID,TOURNAMENT_ID) DO NOTHING;
+		END IF;
+		RETURN NULL;
+	END;
+
+$REGPLAYERTOURNAMENT$ LANGUAGE PLPGSQL;
+
+-- A trigger with transition tables supports only one event (PostgreSQL 10+)
+CREATE TRIGGER PLAYERTOURNAMENT
+	AFTER INSERT ON PLAYERS
+	REFERENCING NEW TABLE AS NEW_PLAYERS
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE REGPLAYERTOURNAMENT();
+
+CREATE TRIGGER PLAYERTOURNAMENT_UPD
+	AFTER UPDATE ON PLAYERS
+	REFERENCING OLD TABLE AS OLD_PLAYERS NEW TABLE AS NEW_PLAYERS
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE REGPLAYERTOURNAMENT();
+
+ALTER TABLE MATCHES RENAME TO MATCHES_OLD;
+ALTER TABLE PLAYER_STANDINGS RENAME TO PLAYER_STANDINGS_OLD;
+DROP TRIGGER IF EXISTS STANDINGS ON MATCHES_OLD;
+DROP TRIGGER IF EXISTS STANDINGS_UPD ON MATCHES_OLD;
+DROP INDEX IF EXISTS MATCHES_IDX01;
+DROP INDEX IF EXISTS MATCHES_IDX02;
+DROP INDEX IF EXISTS PLAYER_STANDINGS_IDX01;
+DROP INDEX IF EXISTS PLAYER_STANDINGS_IDX02;
+ALTER TABLE PLAYER_STANDINGS_OLD DROP CONSTRAINT IF EXISTS PLAYER_STANDINGS_PKEY;
+-- the views are bound to the tables, not to their names
+DROP VIEW IF EXISTS V_STANDINGS;
+DROP FUNCTION IF EXISTS F_STANDINGS(INTEGER);
+DROP FUNCTION IF EXISTS UPDATETIEBREAKS(INTEGER);
+
+CREATE TABLE MATCHES (
+	TOURNAMENT_ID INTEGER,
+	ROUND INTEGER,
+	DATE_MATCH TIMESTAMP,
+	WINNER INTEGER,
+	LOSER INTEGER ) PARTITION BY LIST (TOURNAMENT_ID);
+
+CREATE TABLE MATCHES_DEFAULT PARTITION OF MATCHES DEFAULT;
+
+CREATE INDEX MATCHES_IDX01 ON MATCHES (TOURNAMENT_ID,WINNER,LOSER);
+CREATE UNIQUE INDEX MATCHES_IDX02 ON MATCHES
+	(TOURNAMENT_ID, ROUND, LEAST(WINNER,LOSER), GREATEST(WINNER,LOSER));
+
+CREATE TABLE PLAYER_STANDINGS (
+	PLAYER_ID INTEGER,
+	WINS INTEGER,
+	LOSSES INTEGER,
+	TIEDS INTEGER,
+	MATCHES INTEGER,
+	BYES INTEGER,
+	POINTS DOUBLE PRECISION,
+	TOURNAMENT_ID INTEGER,
+	OPP_POINTS DOUBLE PRECISION DEFAULT 0,
+	BUCHHOLZ INTEGER DEFAULT 0,
+	MEDIAN_BUCHHOLZ INTEGER DEFAULT 0,
+	SONNEBORN_BERGER INTEGER DEFAULT 0,
+	CUMULATIVE INTEGER DEFAULT 0 ) PARTITION BY LIST (TOURNAMENT_ID);
+
+CREATE TABLE PLAYER_STANDINGS_DEFAULT PARTITION OF PLAYER_STANDINGS DEFAULT;
+
+ALTER TABLE PLAYER_STANDINGS ADD PRIMARY KEY (PLAYER_ID,TOURNAMENT_ID);
+CREATE INDEX PLAYER_STANDINGS_IDX01 ON PLAYER_STANDINGS
+	(TOURNAMENT_ID, WINS DESC, BYES DESC, POINTS DESC, PLAYER_ID, MATCHES, TIEDS);
+CREATE INDEX PLAYER_STANDINGS_IDX02 ON PLAYER_STANDINGS
+	(TOURNAMENT_ID, WINS DESC, OPP_POINTS DESC, POINTS DESC);
+
+-- Standings of all the tournaments, to read the standings of one tournament
+-- use F_STANDINGS, which is sorted and only touches the rows of the tournament
+CREATE VIEW V_STANDINGS AS 
+	SELECT A.PLAYER_ID, A.FULL_NAME, COALESCE(B.WINS,0) WINS, 
+    COALESCE(B.MATCHES,0) MATCHES,B.BYES, B.POINTS, A.RANK_INI,A.RANK_FIN, A.TOURNAMENT_ID FROM 
+    (SELECT C.PLAYER_ID,C.FULL_NAME,D.RANK_INI,D.RANK_FIN,D.TOURNAMENT_ID 
+    FROM PLAYERS C, PLAYERS_TOURNAMENT D WHERE C.PLAYER_ID=D.PLAYER_ID) A 
+    LEFT OUTER JOIN PLAYER_STANDINGS B ON 
+    (A.PLAYER_ID=B.PLAYER_ID AND B.TOURNAMENT_ID=A.TOURNAMENT_ID);
+
+-- Standings of one tournament, sorted. It's a SQL function that the planner
+-- inlines, so the filter by tournament uses the indexes before the joins
+-- and the sort, no matter how many tournaments are stored
+CREATE OR REPLACE FUNCTION F_STANDINGS(P_TOURNAMENT_ID INTEGER)
+	RETURNS TABLE (PLAYER_ID INTEGER, FULL_NAME TEXT, WINS INTEGER, MATCHES INTEGER,
+		BYES INTEGER, POINTS DOUBLE PRECISION, RANK_INI INTEGER, RANK_FIN INTEGER,
+		TOURNAMENT_ID INTEGER) AS $F_STANDINGS$
+	SELECT D.PLAYER_ID, C.FULL_NAME, COALESCE(B.WINS,0), COALESCE(B.MATCHES,0),
+		B.BYES, B.POINTS, D.RANK_INI, D.RANK_FIN, D.TOURNAMENT_ID
+	FROM PLAYERS_TOURNAMENT D
+	JOIN PLAYERS C ON (C.PLAYER_ID=D.PLAYER_ID)
+	LEFT OUTER JOIN PLAYER_STANDINGS B ON
+		(B.PLAYER_ID=D.PLAYER_ID AND B.TOURNAMENT_ID=D.TOURNAMENT_ID)
+	WHERE D.TOURNAMENT_ID=P_TOURNAMENT_ID
+	ORDER BY COALESCE(B.WINS,0) DESC, B.BYES DESC, B.POINTS DESC, B.TIEDS, D.RANK_INI;
+$F_STANDINGS$ LANGUAGE SQL STABLE;
+
+CREATE OR REPLACE FUNCTION ADDTOURNAMENTPARTITIONS() RETURNS TRIGGER AS $ADDTOURNAMENTPARTITIONS$
+	BEGIN
+	-- The partitions of MATCHES and PLAYER_STANDINGS of a new tournament,
+	-- MATCHES_<id> and PLAYER_STANDINGS_<id>
+
+		EXECUTE FORMAT('CREATE TABLE IF NOT EXISTS MATCHES_%s PARTITION OF MATCHES FOR VALUES IN (%s)',
+			NEW.TOURNAMENT_ID, NEW.TOURNAMENT_ID);
+		EXECUTE FORMAT('CREATE TABLE IF NOT EXISTS PLAYER_STANDINGS_%s PARTITION OF PLAYER_STANDINGS FOR VALUES IN (%s)',
+			NEW.TOURNAMENT_ID, NEW.TOURNAMENT_ID);
+		RETURN NULL;
+	END;
+
+$ADDTOURNAMENTPARTITIONS$ LANGUAGE PLPGSQL;
+
+DROP TRIGGER IF EXISTS TOURNAMENTPARTITIONS ON TOURNAMENT;
+CREATE TRIGGER TOURNAMENTPARTITIONS
+	AFTER INSERT ON TOURNAMENT
+	FOR EACH ROW
+	EXECUTE PROCEDURE ADDTOURNAMENTPARTITIONS();
+
+-- the partitions of the existing tournaments, the rows of other tournaments
+-- go to the DEFAULT partitions
+DO $PARTITIONS$
+	DECLARE
+		T_ID INTEGER;
+	BEGIN
+		FOR T_ID IN SELECT TOURNAMENT_ID FROM TOURNAMENT LOOP
+			EXECUTE FORMAT('CREATE TABLE MATCHES_%s PARTITION OF MATCHES FOR VALUES IN (%s)',
+				T_ID, T_ID);
+			EXECUTE FORMAT('CREATE TABLE PLAYER_STANDINGS_%s PARTITION OF PLAYER_STANDINGS FOR VALUES IN (%s)',
+				T_ID, T_ID);
+		END LOOP;
+	END;
+$PARTITIONS$;
+
+-- the first version had a row trigger, UPDATESTANDINGS is replaced before
+-- it's attached as a statement trigger
+CREATE OR REPLACE FUNCTION UPDATESTANDINGS() RETURNS TRIGGER AS $UPDATESTANDINGS$
+	BEGIN
+	-- This function updates the stands after report a match, it increments
+	-- Winner +1, loser nothing, player-bye +1. 
+	-- Also update the points for each player. The rule of points is increment by the value of round 
+	-- winner +$round, loser nothing, player-bye nothing
+	-- It's a statement trigger, all the matches inserted by the statement
+	-- (NEW_MATCHES) are added up by player and applied with a single upsert
+
+		INSERT INTO PLAYER_STANDINGS AS S (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
+			SELECT PLAYER_ID, SUM(WINS), SUM(LOSSES), 0, SUM(MATCHES), SUM(BYES), SUM(POINTS), TOURNAMENT_ID
+			FROM (
+				-- winners and players with round bye (LOSER=0)
+				SELECT WINNER AS PLAYER_ID, 1 AS WINS, 0 AS LOSSES, 1 AS MATCHES,
+					CASE WHEN LOSER=0 THEN 1 ELSE 0 END AS BYES,
+					CASE WHEN LOSER=0 THEN 0 ELSE ROUND END AS POINTS, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, 1, 1, 0, 0, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>0) R
+			GROUP BY PLAYER_ID, TOURNAMENT_ID
+		ON CONFLICT (PLAYER_ID, TOURNAMENT_ID) DO UPDATE SET
+			WINS=S.WINS+EXCLUDED.WINS, LOSSES=S.LOSSES+EXCLUDED.LOSSES,
+			MATCHES=S.MATCHES+EXCLUDED.MATCHES, BYES=S.BYES+EXCLUDED.BYES,
+			POINTS=S.POINTS+EXCLUDED.POINTS;
+		RETURN NULL;
+	END;
+
+$UPDATESTANDINGS$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION CORRECTSTANDINGS() RETURNS TRIGGER AS $CORRECTSTANDINGS$
+	BEGIN
+	-- Statement trigger of the corrected results (an upsert of a match with
+	-- other winner): the old result of each match (OLD_MATCHES) is taken
+	-- away and the new one (NEW_MATCHES) is added, with the rules of
+	-- UPDATESTANDINGS and a single upsert
+
+		INSERT INTO PLAYER_STANDINGS AS S (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES,BYES,POINTS, TOURNAMENT_ID)
+			SELECT PLAYER_ID, SUM(WINS), SUM(LOSSES), 0, SUM(MATCHES), SUM(BYES), SUM(POINTS), TOURNAMENT_ID
+			FROM (
+				SELECT WINNER AS PLAYER_ID, 1 AS WINS, 0 AS LOSSES, 1 AS MATCHES,
+					CASE WHEN LOSER=0 THEN 1 ELSE 0 END AS BYES,
+					CASE WHEN LOSER=0 THEN 0 ELSE ROUND END AS POINTS, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, 1, 1, 0, 0, TOURNAMENT_ID
+				FROM NEW_MATCHES WHERE LOSER>0
+				UNION ALL
+				SELECT WINNER, -1, 0, -1, CASE WHEN LOSER=0 THEN -1 ELSE 0 END,
+					CASE WHEN LOSER=0 THEN 0 ELSE -ROUND END, TOURNAMENT_ID
+				FROM OLD_MATCHES WHERE LOSER>=0
+				UNION ALL
+				SELECT LOSER, 0, -1, -1, 0, 0, TOURNAMENT_ID
+				FROM OLD_MATCHES WHERE LOSER>0) R
+			GROUP BY PLAYER_ID, TOURNAMENT_ID
+		ON CONFLICT (PLAYER_ID, TOURNAMENT_ID) DO UPDATE SET
+			WINS=S.WINS+EXCLUDED.WINS, LOSSES=S.LOSSES+EXCLUDED.LOSSES,
+			MATCHES=S.MATCHES+EXCLUDED.MATCHES, BYES=S.BYES+EXCLUDED.BYES,
+			POINTS=S.POINTS+EXCLUDED.POINTS;
+		RETURN NULL;
+	END;
+
+$CORRECTSTANDINGS$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION PURGETOURNAMENT(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $PURGETOURNAMENT$
+	BEGIN
+	-- Removes a tournament: its partitions are dropped instead of deleting
+	-- the rows one by one, the rows of the DEFAULT partitions are deleted
+
+		EXECUTE FORMAT('DROP TABLE IF EXISTS MATCHES_%s, PLAYER_STANDINGS_%s',
+			P_TOURNAMENT_ID, P_TOURNAMENT_ID);
+		DELETE FROM MATCHES_DEFAULT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		DELETE FROM PLAYER_STANDINGS_DEFAULT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		DELETE FROM PLAYERS_TOURNAMENT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+		-- the players are registered again if the id of the tournament is
+		-- used again (see REGPLAYERTOURNAMENT)
+		UPDATE PLAYERS SET LAST_TRNMNT_RGSTRD=NULL
+			WHERE LAST_TRNMNT_RGSTRD=P_TOURNAMENT_ID;
+		DELETE FROM TOURNAMENT WHERE TOURNAMENT_ID=P_TOURNAMENT_ID;
+	END;
+
+$PURGETOURNAMENT$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION ARCHIVETOURNAMENT(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $ARCHIVETOURNAMENT$
+	BEGIN
+	-- Detaches the partitions of a finished tournament and moves them to the
+	-- schema ARCHIVE (ARCHIVE.MATCHES_<id>, ARCHIVE.PLAYER_STANDINGS_<id>).
+	-- The tournament and its players (PLAYERS_TOURNAMENT) are kept
+
+		EXECUTE FORMAT('ALTER TABLE MATCHES DETACH PARTITION MATCHES_%s',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE PLAYER_STANDINGS DETACH PARTITION PLAYER_STANDINGS_%s',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE MATCHES_%s SET SCHEMA ARCHIVE',
+			P_TOURNAMENT_ID);
+		EXECUTE FORMAT('ALTER TABLE PLAYER_STANDINGS_%s SET SCHEMA ARCHIVE',
+			P_TOURNAMENT_ID);
+	END;
+
+$ARCHIVETOURNAMENT$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION UPDATETIEBREAKS(P_TOURNAMENT_ID INTEGER) RETURNS VOID AS $UPDATETIEBREAKS$
+	-- This function updates in one statement the tie-breaks of all the players
+	-- of a tournament, from its matches and the current standings:
+	-- OPP_POINTS: sum of the points of the opponents
+	-- BUCHHOLZ: sum of the wins of the opponents
+	-- MEDIAN_BUCHHOLZ: Buchholz without the best and the worst opponent
+	-- SONNEBORN_BERGER: sum of the wins of the opponents defeated
+	-- CUMULATIVE: sum of the score after each round, a win in round r of R
+	--             rounds adds R-r+1 (a round bye counts as a win)
+	-- The statement is run by EXECUTE so it's planned with the value of the
+	-- tournament, and the UPDATE only touches the partition of the tournament
+	BEGIN
+	EXECUTE $TIEBREAKS$
+	WITH GAMES AS (
+		SELECT WINNER AS PLAYER_ID, LOSER AS OPPONENT, 1 AS WON FROM MATCHES
+			WHERE TOURNAMENT_ID=$1 AND LOSER>0
+		UNION ALL
+		SELECT LOSER, WINNER, 0 FROM MATCHES
+			WHERE TOURNAMENT_ID=$1 AND LOSER>0),
+	OPPONENTS AS (
+		SELECT G.PLAYER_ID, COUNT(1) AS TOT, SUM(S.POINTS) AS OPP_POINTS,
+			SUM(S.WINS) AS BUCHHOLZ, MAX(S.WINS) AS BEST, MIN(S.WINS) AS WORST,
+			SUM(S.WINS*G.WON) AS SONNEBORN_BERGER
+		FROM GAMES G, PLAYER_STANDINGS S
+		WHERE S.PLAYER_ID=G.OPPONENT AND S.TOURNAMENT_ID=$1
+		GROUP BY G.PLAYER_ID),
+	PROGRESS AS (
+		SELECT A.WINNER AS PLAYER_ID, SUM(B.LAST_ROUND-A.ROUND+1) AS CUMULATIVE
+		FROM MATCHES A, (SELECT MAX(ROUND) AS LAST_ROUND FROM MATCHES
+			WHERE TOURNAMENT_ID=$1) B
+		WHERE A.TOURNAMENT_ID=$1 AND A.LOSER>=0
+		GROUP BY A.WINNER),
+	TIEBREAKS AS (
+		SELECT COALESCE(O.PLAYER_ID,P.PLAYER_ID) AS PLAYER_ID,
+			COALESCE(O.OPP_POINTS,0) AS OPP_POINTS, COALESCE(O.BUCHHOLZ,0) AS BUCHHOLZ,
+			CASE WHEN O.TOT>2 THEN O.BUCHHOLZ-O.BEST-O.WORST
+				ELSE COALESCE(O.BUCHHOLZ,0) END AS MEDIAN_BUCHHOLZ,
+			COALESCE(O.SONNEBORN_BERGER,0) AS SONNEBORN_BERGER,
+			COALESCE(P.CUMULATIVE,0) AS CUMULATIVE
+		FROM OPPONENTS O FULL OUTER JOIN PROGRESS P ON (O.PLAYER_ID=P.PLAYER_ID))
+	UPDATE PLAYER_STANDINGS S SET OPP_POINTS=T.OPP_POINTS, BUCHHOLZ=T.BUCHHOLZ,
+		MEDIAN_BUCHHOLZ=T.MEDIAN_BUCHHOLZ, SONNEBORN_BERGER=T.SONNEBORN_BERGER,
+		CUMULATIVE=T.CUMULATIVE
+	FROM TIEBREAKS T
+	WHERE S.PLAYER_ID=T.PLAYER_ID AND S.TOURNAMENT_ID=$1
+	$TIEBREAKS$ USING P_TOURNAMENT_ID;
+	END;
+$UPDATETIEBREAKS$ LANGUAGE PLPGSQL;
+
+INSERT INTO PLAYER_STANDINGS (PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES, BYES,
+	POINTS, TOURNAMENT_ID)
+	SELECT PLAYER_ID, WINS, LOSSES, TIEDS, MATCHES, BYES, POINTS, TOURNAMENT_ID
+	FROM PLAYER_STANDINGS_OLD;
+INSERT INTO MATCHES (TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER, LOSER)
+	SELECT TOURNAMENT_ID, ROUND, DATE_MATCH, WINNER, LOSER FROM MATCHES_OLD;
+
+CREATE TRIGGER STANDINGS
+	AFTER INSERT ON MATCHES
+	REFERENCING NEW TABLE AS NEW_MATCHES
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE UPDATESTANDINGS();
+
+CREATE TRIGGER STANDINGS_UPD
+	AFTER UPDATE ON MATCHES
+	REFERENCING OLD TABLE AS OLD_MATCHES NEW TABLE AS NEW_MATCHES
+	FOR EACH STATEMENT
+	EXECUTE PROCEDURE CORRECTSTANDINGS();
+
+-- the tie-breaks of the first versions weren't stored
+SELECT UPDATETIEBREAKS(TOURNAMENT_ID)
+	FROM (SELECT DISTINCT TOURNAMENT_ID FROM PLAYER_STANDINGS) T;
+
+DROP TABLE MATCHES_OLD;
+DROP TABLE PLAYER_STANDINGS_OLD;
+
+COMMIT;
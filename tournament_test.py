@@ -3,10 +3,21 @@
 # Test cases for tournament.py
 
 import tournament
+import pairing
+import bracket
+import planner
+import tournament_memory
+import journal
+import player
 import names
 import datetime
 import random
 import time
+import threading
+import os
+import tempfile
+import json
+import StringIO
 
 def testDeleteMatches():
     swiss_trnmnt.conn_trnmt_db.deleteMatches()
@@ -128,6 +139,657 @@ def testPairings():
         raise ValueError(
             "After one match, players with one win should be paired.")
     print "8. After one match, players with one win are paired."
+
+
+def testMatchHistory():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayer("Sunset Shimmer")
+    swiss_trnmnt.registerPlayer("Trixie Lulamoon")
+    swiss_trnmnt.registerPlayer("Starlight Glimmer")
+    standings = swiss_trnmnt.playerStandings()
+    [id1, id2, id3] = [row[0] for row in standings]
+    swiss_trnmnt.loadMatchHistory()
+    swiss_trnmnt.reportMatch(id1, id2)
+    if not swiss_trnmnt.previusMatch(id2, id1):
+        raise ValueError(
+            "A reported match should be found in the history, in any order.")
+    if swiss_trnmnt.previusMatch(id1, id3):
+        raise ValueError("Players who never met should not have a match.")
+    swiss_trnmnt.commitTournament()
+    print "9. Reported matches are found in the in-memory history."
+
+
+def testBlossomPairing():
+    engine = pairing.BlossomPairing()
+    # five players, 1 and 2 already matched, 5 already had a round bye
+    players = [player.Player(w, i, 'player %s' % i, 1)
+               for i, w in ((1, 1), (2, 1), (3, 0), (4, 0), (5, 1))]
+    history = set([pairing.pairKey(1, 2), pairing.pairKey(3, 4)])
+    pairs, player_bye = engine.pairRound(players, history, set([5]))
+    actual_pairs = set(frozenset([p1.getPlayerId(), p2.getPlayerId()])
+                       for p1, p2 in pairs)
+    if len(pairs) != 2 or player_bye is None:
+        raise ValueError("Five players should give two pairs and one bye.")
+    for key in actual_pairs:
+        if pairing.pairKey(*key) in history:
+            raise ValueError("The pairing engine should avoid rematches.")
+    if player_bye.getPlayerId() == 5:
+        raise ValueError("A player should not get a second round bye.")
+    # three players, the only pairing without rematches gives a second bye
+    players = [player.Player(w, i, 'player %s' % i, 2)
+               for i, w in ((1, 2), (2, 1), (3, 0))]
+    history = set([pairing.pairKey(1, 2), pairing.pairKey(2, 3)])
+    pairs, player_bye = engine.pairRound(players, history, set([1, 2]))
+    if ([(p1.getPlayerId(), p2.getPlayerId()) for p1, p2 in pairs] != [(1, 3)]
+            or player_bye.getPlayerId() != 2):
+        raise ValueError(
+            "A rematch should only be allowed when there is no other pairing.")
+    print "10. The blossom engine pairs the round without rematches."
+
+
+def testRegisterPlayers():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    ids = swiss_trnmnt.registerPlayers(
+        ["Rarity", "Spike", "Big McIntosh", "Spike"])
+    c = swiss_trnmnt.conn_trnmt_db.countPlayers()
+    if c != 3 or len(ids) != 3:
+        raise ValueError(
+            "After registering three distinct names, countPlayers should be 3.")
+    if len(swiss_trnmnt.playerStandings()) != 3:
+        raise ValueError("Players registered in bulk should be in standings.")
+    more_ids = swiss_trnmnt.registerPlayers(["Rarity", "Zecora"])
+    if swiss_trnmnt.conn_trnmt_db.countPlayers() != 4:
+        raise ValueError("Only the new names should be inserted again.")
+    if more_ids["Rarity"] != ids["Rarity"]:
+        raise ValueError("A registered name should keep its id.")
+    if swiss_trnmnt.checkAlreadyRegistered("Zecora") != more_ids["Zecora"]:
+        raise ValueError("The id of a name should be found after registering.")
+    print "11. Players can be registered in bulk."
+
+
+def testReportRound():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayers(
+        ["Derpy Hooves", "Lyra Heartstrings", "Bon Bon", "Vinyl Scratch",
+         "Octavia Melody"])
+    standings = swiss_trnmnt.playerStandings()
+    [id1, id2, id3, id4, id5] = [row[0] for row in standings]
+    swiss_trnmnt.reportRound([(id1, id2), (id3, id4), (id5, 0)], 1)
+    swiss_trnmnt.commitTournament()
+    for (i, n, w, m) in swiss_trnmnt.playerStandings():
+        if m != 1:
+            raise ValueError("Each player should have one match recorded.")
+        if i in (id1, id3, id5) and w != 1:
+            raise ValueError("Winners and the bye should have one win.")
+        elif i in (id2, id4) and w != 0:
+            raise ValueError("Each match loser should have zero wins recorded.")
+    print "12. A whole round can be reported in one statement."
+
+
+def testSharedPool():
+    # eight tournaments in eight threads share a pool of two connections
+    dbs = [tournament.TournamentDb(pool_size=2) for i in range(8)]
+    counts = list()
+    for db in dbs:
+        db.connect()
+    threads = [threading.Thread(target=lambda db=db: counts.append(
+        db.countPlayers())) for db in dbs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if len(counts) != 8 or len(set(counts)) != 1:
+        raise ValueError("Every thread should get the same count of players.")
+    # the open transactions don't hold the slots of the pool: three of them
+    # in one thread don't wait for each other
+    for i, db in enumerate(dbs[:3]):
+        db.setJournalWatermark('pool test %s' % i, 1)
+    if [db.countPlayers() for db in dbs] != counts:
+        raise ValueError("The open transactions should not block the pool.")
+    for db in dbs[:3]:
+        db.rollback()
+    print "13. Many tournaments can share a bounded pool of connections."
+
+
+def testAsyncTournament():
+    import trollius
+    import tournament_async
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    loop = trollius.get_event_loop()
+    db = tournament_async.AsyncTournamentDb(pool_size=4, loop=loop)
+    swiss = tournament_async.AsyncSwiss(db, swiss_trnmnt._tournament_id)
+
+    @trollius.coroutine
+    def run():
+        yield trollius.From(db.connect())
+        registered = yield trollius.From(trollius.gather(
+            *[swiss.registerPlayer(n) for n in
+              ("Queen Chrysalis", "King Sombra", "Lord Tirek", "Discord")],
+            loop=loop))
+        standings = yield trollius.From(swiss.playerStandings())
+        ids = [row[0] for row in standings]
+        if sorted(registered) != sorted(ids):
+            raise ValueError("registerPlayer should return the new ids.")
+        # the same rows as the synchronous storage
+        if standings != [tournament.PlayerStandings._make(row[:4]) for row in
+                         swiss_trnmnt.conn_trnmt_db.standings(
+                             swiss_trnmnt._tournament_id)]:
+            raise ValueError("Both APIs should read the same standings.")
+        yield trollius.From(trollius.gather(
+            swiss.reportMatch(ids[0], ids[1], 1),
+            swiss.reportMatch(ids[2], ids[3], 1), loop=loop))
+        pairings = yield trollius.From(swiss.swissPairings())
+        raise trollius.Return((ids, pairings))
+
+    [id1, id2, id3, id4], pairings = loop.run_until_complete(run())
+    db.closeConnect()
+    if len(pairings) != 2:
+        raise ValueError(
+            "For four players, swissPairings should return two pairs.")
+    correct_pairs = set([frozenset([id1, id3]), frozenset([id2, id4])])
+    actual_pairs = set(frozenset([p[0], p[2]]) for p in pairings)
+    if correct_pairs != actual_pairs:
+        raise ValueError(
+            "After one match, players with one win should be paired.")
+    print "14. The asynchronous API registers, reports and pairs players."
+
+
+def testStandingsCache():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayers(
+        ["Flash Sentry", "Shining Armor", "Cheese Sandwich"])
+    standings = swiss_trnmnt.playerStandings()
+    [id1, id2, id3] = [row[0] for row in standings]
+    swiss_trnmnt.reportMatch(id2, id1, 1)
+    swiss_trnmnt.reportMatch(id3, 0, 1)
+    standings = swiss_trnmnt.playerStandings()
+    if set(row[0] for row in standings[:2]) != set([id2, id3]):
+        raise ValueError("The winners should lead the cached standings.")
+    if swiss_trnmnt.checkStandings():
+        raise ValueError("The cached standings should match the database.")
+    swiss_trnmnt.rolllbackTournament()
+    for (i, n, w, m) in swiss_trnmnt.playerStandings():
+        if w != 0 or m != 0:
+            raise ValueError("After a rollback the matches should be gone.")
+    print "15. The standings are served from memory and match the database."
+
+
+def testTieBreaks():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayers(
+        ["Trixie Lulamoon", "Starlight Glimmer", "Sunset Shimmer",
+         "Moon Dancer"])
+    standings = swiss_trnmnt.playerStandings()
+    [id1, id2, id3, id4] = [row[0] for row in standings]
+    swiss_trnmnt.reportRound([(id1, id2), (id3, id4)], 1)
+    swiss_trnmnt.reportRound([(id1, id3), (id2, id4)], 2)
+    swiss_trnmnt.commitTournament()
+    swiss_trnmnt.setTieBreaks(('SONNEBORN_BERGER', 'CUMULATIVE'))
+    ranking = swiss_trnmnt.finalRanking()
+    swiss_trnmnt.commitTournament()
+    if [row[0] for row in ranking] != [id1, id3, id2, id4]:
+        raise ValueError(
+            "The earlier win should break the tie between the 1-win players.")
+    if [row[3] for row in ranking] != [2, 0, 0, 0]:
+        raise ValueError("Sonneborn-Berger should add the wins of the "
+                         "defeated opponents.")
+    swiss_trnmnt.setTieBreaks(('OPP_POINTS', 'POINTS'))
+    print "16. Tied players are ranked by the tie-break rules."
+
+
+def testTopPlayers():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayers(
+        ["Big McIntosh", "Granny Smith", "Braeburn", "Babs Seed",
+         "Apple Bloom", "Goldie Delicious"])
+    standings = swiss_trnmnt.playerStandings()
+    [id1, id2, id3, id4, id5, id6] = [row[0] for row in standings]
+    swiss_trnmnt.reportRound([(id1, id2), (id3, id4), (id5, id6)], 1)
+    swiss_trnmnt.reportRound([(id1, id3), (id2, id5), (id4, id6)], 2)
+    swiss_trnmnt.commitTournament()
+    final_players = swiss_trnmnt.topPlayers(4)
+    if [len(group) for group in final_players] != [1, 3]:
+        raise ValueError("The cut should have one 2-win and three 1-win "
+                         "players.")
+    if final_players[0][0][0] != id1:
+        raise ValueError("The only undefeated player should lead the cut.")
+    if swiss_trnmnt._rounds_single != 2:
+        raise ValueError("A cut of 4 players should play 2 rounds.")
+    # a player without matches is in the field, after the ones with 0 wins
+    id7 = swiss_trnmnt.registerPlayer("Apple Rose")
+    final_players = swiss_trnmnt.topPlayers(8)
+    if sum(len(group) for group in final_players) != 7 or \
+            final_players[-1][-1][0] != id7:
+        raise ValueError("A registered player without matches should be cut "
+                         "last.")
+    print "17. The top N players are cut with one statement."
+
+
+def testBracket():
+    seeds = [(i, "Seed %s" % i) for i in range(1, 7)]
+    knockout = bracket.Bracket(seeds)
+    if knockout.totalRounds() != 3:
+        raise ValueError("A cut of 6 players should play 3 rounds.")
+    first = knockout.pairings()
+    if set((p[0], p[2]) for p in first) != set([(4, 5), (3, 6)]):
+        raise ValueError("Seeds 1 and 2 should have a bye in the first round.")
+    knockout.reportMatch(5, 4)
+    knockout.reportMatch(3, 6)
+    second = knockout.pairings()
+    if set((p[0], p[2]) for p in second) != set([(1, 5), (2, 3)]):
+        raise ValueError("The winners should meet the seeds with a bye.")
+    knockout.reportMatch(1, 5)
+    knockout.reportMatch(3, 2)
+    knockout = bracket.Bracket.fromJson(knockout.toJson())
+    if [(p[0], p[2]) for p in knockout.pairings()] != [(1, 3)]:
+        raise ValueError("The saved bracket should give the final.")
+    knockout.reportMatch(3, 1)
+    if knockout.winner() != (3, "Seed 3") or knockout.secondPlace()[0] != 1:
+        raise ValueError("The winner of the final should be the champion.")
+    print "18. The bracket advances the winners and gives byes to the best seeds."
+
+
+def testPlanFormat():
+    for participants, rounds in ((4, 2), (8, 3), (128, 7), (226, 8), (409, 9),
+                                 (410, 10), (10000, 15), (100000, 18)):
+        if planner.planFormat(participants).rounds != rounds:
+            raise ValueError("%s players should play %s rounds."
+                             % (participants, rounds))
+    if planner.planFormat(19).top_players != 8:
+        raise ValueError("The cut of a small field should be the top 8.")
+    plan = planner.planFormat(100000)
+    if plan.top_players != 64 or plan.rounds_single != 6:
+        raise ValueError("A field of 100k players should cut to the top 64.")
+    if plan.accelerated_rounds != 2 or planner.planFormat(409).accelerated_rounds:
+        raise ValueError("Only large fields should use accelerated pairings.")
+    print "19. The format is planned from the size of the field."
+
+
+def testQueryStats():
+    swiss_trnmnt.conn_trnmt_db.deleteMatches()
+    swiss_trnmnt.conn_trnmt_db.deletePlayers()
+    swiss_trnmnt.registerPlayers(
+        ["Cloudchaser", "Flitter", "Thunderlane", "Blossomforth"])
+    if swiss_trnmnt.conn_trnmt_db.getStats() is not None:
+        raise ValueError("The instrumentation should be disabled by default.")
+    swiss_trnmnt.conn_trnmt_db.enableStats()
+    swiss_trnmnt.swissPairings()
+    swiss_trnmnt.rolllbackTournament()
+    stats = swiss_trnmnt.conn_trnmt_db.getStats()
+    swiss_trnmnt.conn_trnmt_db.disableStats()
+    operation = stats['operations'].get('Swiss.swissPairings')
+    if operation is None or operation['calls'] != 1:
+        raise ValueError("The statements should be recorded by API method.")
+    if operation['statements'] != sum(
+            s['callers'].get('Swiss.swissPairings', 0)
+            for s in stats['statements'].itervalues()):
+        raise ValueError("Each statement should be recorded by fingerprint.")
+    # swissPairings reads the snapshot of the round, it's part of its operation
+    if 'Swiss.pairingSnapshot' in stats['operations']:
+        raise ValueError("A nested API method should not be an operation.")
+    print "20. The statements are recorded by API method and fingerprint."
+
+
+def testMemoryTournament():
+    swiss = tournament.Swiss(storage=tournament_memory.MemoryTournamentDb())
+    swiss.setTournamentInfo([1, 'memory', 'Ponyville', '2015-12-01',
+                             '2015-12-30', 9])
+    swiss.registerPlayers(["Player %s" % i for i in range(9)])
+    swiss.rankingInit(seed=1)
+    rng = random.Random(1)
+    for round_ in range(1, swiss._total_rounds + 1):
+        pairings = swiss.swissPairings()
+        if len(pairings) != 4:
+            raise ValueError("Nine players should play four matches a round.")
+        for id1, name1, id2, name2 in pairings:
+            if rng.random() < 0.5:
+                swiss.reportMatch(id1, id2, round_)
+            else:
+                swiss.reportMatch(id2, id1, round_)
+        swiss.commitTournament()
+    if swiss.checkStandings():
+        raise ValueError("The in-memory storage should keep the standings.")
+    if (sum(w for (i, n, w, m) in swiss.playerStandings()) !=
+            5 * swiss._total_rounds):
+        raise ValueError("Each round should give four wins and a bye.")
+    final_players = swiss.topEightPlayers()
+    if sum(len(group) for group in final_players) != 8:
+        raise ValueError("The cut should have eight players.")
+    round_ = swiss._total_rounds + 1
+    while round_ <= swiss._total_rounds + swiss._rounds_single:
+        for id1, name1, id2, name2 in swiss.siglePairingElimination():
+            swiss.reportMatch(id1, id2, round_)
+        swiss.commitTournament()
+        round_ += 1
+    swiss.setWinnerTournament()
+    if swiss._bracket.winner()[0] != final_players[0][0][0]:
+        raise ValueError("The best seed won all its matches.")
+    print "21. A whole tournament runs without database."
+
+
+def testSimulator():
+    import simulator
+    ratings = [2400] + [1400] * 15
+    stats = simulator.simulateFormat(16, events=200, ratings=ratings,
+                                     processes=2, seed=7)
+    if (stats['rounds'], stats['top_players']) != (4, 8):
+        raise ValueError("The format should be the one of planner.")
+    if stats != simulator.simulateFormat(16, events=200, ratings=ratings,
+                                         processes=1, seed=7):
+        raise ValueError("The same seed should give the same statistics.")
+    if stats['strongest_top_rate'] < 0.95:
+        raise ValueError("A player 1000 points stronger makes the top 8.")
+    if not 0 < stats['true_top_in_cut_rate'] <= 1:
+        raise ValueError("The true top share of the cut is a rate.")
+    stats = simulator.simulateFormat(9, events=100, processes=1)
+    if stats['undefeated_mean'] > 1:
+        raise ValueError("Nine players can't have two undefeated players.")
+    print "22. Swiss events are simulated with rating-based results."
+
+
+def testPlayerTable():
+    # the points come from PostgreSQL as floats (DOUBLE PRECISION)
+    table = player.PlayerTable([(7, 'a', 2, 2, 0, 3.0), (3, 'b', 2, 2, 1, 1),
+                                (9, 'c', 1, 2, None, None), (4, 'd', 0, 2)])
+    if table.scoreGroups() != [(2, 0, 2), (1, 2, 3), (0, 3, 4)]:
+        raise ValueError("The score groups should be ranges of the table.")
+    if [p.getPlayerId() for p in table[2:4]] != [9, 4]:
+        raise ValueError("A range of the table should give its players.")
+    if list(table.byes) != [0, 1, 0, 0]:
+        raise ValueError("The null byes should be stored as zero.")
+    if list(table.points) != [3.0, 1.0, 0.0, 0.0]:
+        raise ValueError("The float points should be kept in the table.")
+    if list(table.reorder([3, 0]).ids) != [4, 7]:
+        raise ValueError("A reordered table should follow the indexes.")
+    try:
+        table[0].rating = 1500
+    except AttributeError:
+        pass
+    else:
+        raise ValueError("A Player should only have its slots.")
+    # 100k players sorted by standings are paired by blocks of the table
+    players = player.PlayerTable((i, 'player %s' % i, 9 - i * 10 / 100001, 9)
+                                 for i in xrange(1, 100002))
+    pairs, player_bye = pairing.BlossomPairing().pairRound(
+        players, set(), set())
+    if len(pairs) != 50000 or player_bye is None:
+        raise ValueError("100001 players should give 50000 pairs and a bye.")
+    print "23. The players of a round are paired from a compact table."
+
+
+def testResumeTournament():
+    storage = tournament_memory.MemoryTournamentDb()
+    swiss = tournament.Swiss(storage=storage)
+    swiss.setTournamentInfo([1, 'resume', 'Canterlot', '2015-12-01',
+                             '2015-12-30', 9])
+    swiss.registerPlayers(["Player %s" % i for i in range(9)])
+    swiss.rankingInit(seed=2)
+    for round_ in (1, 2):
+        for id1, name1, id2, name2 in swiss.swissPairings():
+            swiss.reportMatch(id1, id2, round_)
+        swiss.commitTournament()
+    resumed = tournament.Swiss.resume(swiss._tournament_id, storage=storage)
+    if (resumed._round, resumed._total_rounds, resumed._top_players) != (
+            swiss._round, swiss._total_rounds, swiss._top_players):
+        raise ValueError("The round and the format should be resumed.")
+    if resumed.playerStandings() != swiss.playerStandings():
+        raise ValueError("The standings should be resumed.")
+    if resumed._match_history != swiss._match_history:
+        raise ValueError("The match history should be resumed.")
+    if len(resumed.swissPairings()) != 4:
+        raise ValueError("A resumed tournament should pair the next round.")
+    try:
+        tournament.Swiss.resume(999, storage=storage)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("An unknown tournament can't be resumed.")
+    print "24. A tournament is resumed from its id with one read."
+
+
+def testMatchJournal():
+    path = os.path.join(tempfile.mkdtemp(), 'results.journal')
+    storage = tournament_memory.MemoryTournamentDb()
+    results = journal.MatchJournal(path, storage=storage)
+    swiss = tournament.Swiss(storage=storage, journal=results)
+    swiss.setTournamentInfo([1, 'journal', 'Manehattan', '2015-12-01',
+                             '2015-12-30', 4])
+    swiss.registerPlayers(["Applejack", "Rainbow Dash", "Fluttershy",
+                           "Pinkie Pie"])
+    swiss.rankingInit(seed=3)
+    (id1, n1, id2, n2), (id3, n3, id4, n4) = swiss.swissPairings()
+    swiss.reportMatch(id1, id2, 1)
+    swiss.reportMatch(id3, id4, 1)
+    swiss.commitTournament()
+    if storage.matchPairs(swiss._tournament_id) or results.pending() != 2:
+        raise ValueError("The results should wait in the journal.")
+    # a crash before the flush: the journal is replayed, a torn record at
+    # the end of the file is dropped
+    results.close()
+    with open(path, 'ab') as journal_file:
+        journal_file.write('torn')
+    results = journal.MatchJournal(path, storage=storage)
+    if results.pending() != 2:
+        raise ValueError("The journal should replay the pending results.")
+    results.drain()
+    results.close()
+    # the watermark avoids to write the results again
+    results = journal.MatchJournal(path, storage=storage)
+    if results.pending() or len(storage.matchPairs(swiss._tournament_id)) != 2:
+        raise ValueError("The results should be written exactly once.")
+    # a station reporting the same result twice doesn't block the flusher
+    date_match = datetime.datetime.now()
+    results.append(swiss._tournament_id, 1, date_match, id1, id2)
+    results.append(swiss._tournament_id, 1, date_match, id1, id2)
+    results.drain()
+    if results.pending() or len(storage.matchPairs(swiss._tournament_id)) != 2:
+        raise ValueError("A duplicate result should be skipped by the flush.")
+    results.close()
+    print "25. The results are written behind from a local journal."
+
+
+def testExports():
+    swiss = tournament.Swiss(storage=tournament_memory.MemoryTournamentDb())
+    swiss.setTournamentInfo([1, 'exports', 'Cloudsdale', '2015-12-01',
+                             '2015-12-30', 5])
+    swiss.registerPlayers(["Twilight", "Starlight", "Sunburst", "Trixie",
+                           "Moondancer"])
+    swiss.rankingInit(seed=4)
+    pairings = swiss.swissPairings()
+    for id1, name1, id2, name2 in pairings:
+        swiss.reportMatch(id1, id2, 1, datetime.datetime(2015, 12, 1, 10))
+    swiss.commitTournament()
+    if list(swiss.streamStandings(fetch_size=2)) != swiss.playerStandings():
+        raise ValueError("The streamed standings should be the standings.")
+    output = StringIO.StringIO()
+    swiss.exportStandings(output)
+    lines = output.getvalue().splitlines()
+    if (len(lines) != 6 or
+            lines[0] != ','.join(tournament.STANDINGS_COLUMNS)):
+        raise ValueError("The CSV export should have a header and 5 rows.")
+    output = StringIO.StringIO()
+    swiss.exportMatches(output, 'jsonl', round_=1)
+    matches = [json.loads(line) for line in output.getvalue().splitlines()]
+    if (len(matches) != 3 or
+            matches[-1]['date_match'] != '2015-12-01T10:00:00'):
+        raise ValueError("The JSON Lines export should have the 3 matches.")
+    output = StringIO.StringIO()
+    swiss.exportPairings(pairings, output, 'jsonl')
+    if json.loads(output.getvalue().splitlines()[0])['id1'] != pairings[0][0]:
+        raise ValueError("The pairings should be exported by line.")
+    try:
+        swiss.exportStandings(output, 'xml')
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Only the export formats should be accepted.")
+    print "26. The standings and matches are streamed and exported."
+
+
+def testPreparedStatements():
+    db = swiss_trnmnt.conn_trnmt_db
+    db.deleteMatches()
+    db.deletePlayers()
+    player_id = swiss_trnmnt.registerPlayer("Cheerilee")
+    for prepared in (True, False):
+        db.setPrepared(prepared)
+        db._player_ids.clear()  # the lookup goes to the database
+        if db.findPlayer("Cheerilee") != player_id:
+            raise ValueError("The prepared and text lookups should match.")
+    db.setPrepared(True)
+    names = set()
+    for statements in db._pool._prepared.itervalues():
+        names.update(statements)
+    if not set(['find_player', 'insert_player']) <= names:
+        raise ValueError("The hot statements should be prepared.")
+    print "27. The hot statements are prepared once per connection."
+
+
+def testConcurrentReports():
+    swiss = tournament.Swiss(storage=tournament_memory.MemoryTournamentDb())
+    swiss.setTournamentInfo([1, 'stations', 'Ponyville', '2015-12-01',
+                             '2015-12-30', 4])
+    names = ["Player %s" % i for i in range(4)]
+    player_ids = swiss.registerPlayers(names)
+    ids = [player_ids[name] for name in names]
+    swiss.rankingInit(seed=1)
+    swiss.swissPairings()
+    # a report waiting for commitTournament isn't committed by a station
+    swiss.reportMatch(ids[0], ids[1], 1)
+    try:
+        swiss.submitMatch(ids[2], ids[3], 1)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("The open transaction shouldn't be committed.")
+    swiss.rolllbackTournament()
+    if not swiss.submitMatch(ids[0], ids[1], 1):
+        raise ValueError("A new result should be stored.")
+    if swiss.submitMatch(ids[0], ids[1], 1):
+        raise ValueError("A repeated report should be ignored.")
+    if swiss.submitRound([(ids[2], ids[3]), (ids[1], ids[0])], 1) != 2:
+        raise ValueError("A new result and a correction should be stored.")
+    wins = dict((i, w) for (i, n, w, m) in swiss.playerStandings())
+    if (wins[ids[0]], wins[ids[1]], wins[ids[2]]) != (0, 1, 1):
+        raise ValueError("The correction should swap the standings.")
+    if swiss.checkStandings():
+        raise ValueError("The standings should match the matches.")
+    # the pairings don't leave a transaction open to the stations
+    pairings = swiss.swissPairings()
+    if swiss.submitRound([(id1, id2) for id1, n1, id2, n2 in pairings],
+                         2) != 2:
+        raise ValueError("The results of the next round should be stored.")
+    print "28. Repeated and corrected reports keep one result per match."
+
+
+def testPurgeArchive():
+    storage = tournament_memory.MemoryTournamentDb()
+    swiss = tournament.Swiss(storage=storage)
+    for trnmnt_id in (1, 2):
+        swiss.setTournamentInfo([trnmnt_id, 'partition', 'Ponyville',
+                                 '2015-12-01', '2015-12-30', 4])
+        swiss.registerPlayers(["Player %s %s" % (trnmnt_id, i)
+                               for i in range(4)])
+        swiss.rankingInit(seed=1)
+        for id1, name1, id2, name2 in swiss.swissPairings():
+            swiss.reportMatch(id1, id2, 1)
+        swiss.commitTournament()
+    swiss.archiveTournament(1)
+    if storage.matchPairs(1) or storage.storedStandings(1):
+        raise ValueError("The archived matches should leave the tables.")
+    if not storage.tournamentExists(1):
+        raise ValueError("The archived tournament should be kept.")
+    swiss.purgeTournament()
+    if storage.tournamentExists(2) or storage.tournamentPlayerIds(2):
+        raise ValueError("The purged tournament should be removed.")
+    if storage.countPlayers() != 8:
+        raise ValueError("The players should outlive their tournaments.")
+    names = ["Player 2 %s" % i for i in range(4)]
+    player_ids = dict((name, storage.findPlayer(name)) for name in names)
+    swiss.setPlayerRatings(dict((i, 1500.0) for i in player_ids.values()))
+    if storage.tournamentPlayerIds(2):
+        raise ValueError("An update of the players should not register them "
+                         "to a purged tournament.")
+    swiss.setTournamentInfo([2, 'partition', 'Ponyville', '2015-12-01',
+                             '2015-12-30', 4])
+    if swiss.registerPlayers(names) != player_ids or len(
+            storage.tournamentPlayerIds(2)) != 4:
+        raise ValueError("The players should be registered again to a new "
+                         "tournament with the id of a purged one.")
+    print "29. Tournaments are archived and purged as a whole."
+
+
+def testPrecomputedPairings():
+    path = os.path.join(tempfile.mkdtemp(), 'precompute.journal')
+    storage = tournament_memory.MemoryTournamentDb()
+    results = journal.MatchJournal(path, storage=storage)
+    swiss = tournament.Swiss(storage=storage, journal=results)
+    swiss.setTournamentInfo([1, 'precompute', 'Ponyville', '2015-12-01',
+                             '2015-12-30', 9])
+    swiss.registerPlayers(["Player %s" % i for i in range(9)])
+    swiss.rankingInit(seed=1)
+    snapshot = swiss.pairingSnapshot()
+    engine = swiss._pairing_engine
+    first = tournament.pairSnapshot(engine, snapshot)
+    if first != tournament.pairSnapshot(engine, snapshot):
+        raise ValueError("The same snapshot should give the same pairings.")
+    if storage.matchPairs(1) or swiss._round != 1:
+        raise ValueError("Pairing a snapshot should not change the tournament.")
+    swiss.startPrecompute()
+    try:
+        pairings = swiss.commitPairings(first)
+        for id1, name1, id2, name2 in pairings:
+            swiss.reportMatch(id1, id2, 1)
+        # the precompute pairs the in-memory state, the reports don't wait
+        # for the journal
+        if results.pending() != len(pairings) + 1:
+            raise ValueError("The precompute should not drain the journal.")
+        snapshot = swiss.pairingSnapshot()
+        # the worker paired both outcomes of the last board
+        if swiss._precompute.lookup(snapshot) != tournament.pairSnapshot(
+                engine, snapshot):
+            raise ValueError("The last board should be speculated.")
+        if swiss.swissPairings() != list(
+                tournament.pairSnapshot(engine, snapshot).pairings):
+            raise ValueError("The precomputed round should be published.")
+    finally:
+        swiss.stopPrecompute()
+        results.close()
+    try:
+        swiss.commitPairings(first)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("The pairings of a past round should be stale.")
+    print "30. The next round is paired ahead without side effects."
+
+
+def testRatingSeeds():
+    storage = tournament_memory.MemoryTournamentDb()
+    swiss = tournament.Swiss(storage=storage)
+    swiss.setTournamentInfo([1, 'ratings', 'Ponyville', '2015-12-01',
+                             '2015-12-30', 4])
+    names = ["Player %s" % i for i in range(4)]
+    player_ids = swiss.registerPlayers(names)
+    ids = [player_ids[name] for name in names]
+    swiss.setPlayerRatings({ids[0]: 1500.0, ids[1]: 2100.0, ids[3]: 1800.0})
+    # a new rating doesn't register the players again
+    if len(storage.tournamentPlayerIds(swiss._tournament_id)) != 4:
+        raise ValueError("The players should be registered once.")
+    swiss.rankingInit(by_rating=True)
+    rank_ini = dict((row[0], row[6])
+                    for row in storage.standings(swiss._tournament_id))
+    if [rank_ini[i] for i in ids] != [3, 1, 4, 2]:
+        raise ValueError("The players should be seeded by rating, the ones "
+                         "without rating last.")
+    print "31. The initial ranking is seeded by the ratings of the players."
         
 
 def testTournamentMultiPlayers():
@@ -215,6 +877,29 @@ if __name__ == '__main__':
     testStandingsBeforeMatches()
     reportMatches()
     testPairings()
+    testMatchHistory()
+    testBlossomPairing()
+    testRegisterPlayers()
+    testReportRound()
+    testSharedPool()
+    testAsyncTournament()
+    testStandingsCache()
+    testTieBreaks()
+    testTopPlayers()
+    testBracket()
+    testPlanFormat()
+    testQueryStats()
+    testMemoryTournament()
+    testSimulator()
+    testPlayerTable()
+    testResumeTournament()
+    testMatchJournal()
+    testExports()
+    testPreparedStatements()
+    testConcurrentReports()
+    testPurgeArchive()
+    testPrecomputedPairings()
+    testRatingSeeds()
     '''
     # To test extended implementation (multi-players and multi-tournaments) 
     # "comment methods for testing nanodegree program"